@@ -0,0 +1,502 @@
+"""
+Benchmarks for the draft window's hot paths: anchor calculation, label
+generation, anchor resolution and the undo history.
+
+These run outside Talon. From the directory containing this repo, save a
+baseline on your own machine before making a change, then compare against it
+after:
+
+    python -m talon_draft_window.bench_draft_ui --save-baseline before.json
+    python -m talon_draft_window.bench_draft_ui --baseline before.json
+
+Results are written as JSON, along with the Python version, machine and numpy
+version they were timed with. When a baseline is given, any case that got slower
+by more than the tolerance, or that isn't in the baseline at all, is reported
+and the exit status is 1. A baseline timed somewhere else isn't compared
+against at all (exit status 2), as the times can't be compared.
+bench_baseline.json is one such run, kept for reference.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from .fake_talon import install_fake_talon
+
+# Stand in for the Talon imports when running outside Talon
+running_in_talon = not install_fake_talon()
+
+from .draft_index import TOKENIZERS, WordOffsetIndex, WordSpanIndex, get_numpy
+from .draft_ui import (
+    LABEL_CHARS,
+    DraftManager,
+    calculate_range_anchors,
+    calculate_text_anchors,
+    index_text_anchors,
+    locate_visible_text,
+)
+from .draft_undo import UndoHistory
+from .draft_reference import reference_text_anchors
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "bench_baseline.json")
+SIZES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+CURSORS = ("start", "middle", "end")
+# Roughly what fits in a draft window
+VISIBLE_LENGTH = 3000
+
+
+def _prose_block(rng):
+    words = "the quick brown fox jumps over a lazy dog and then some".split()
+    lines = []
+    for _ in range(200):
+        lines.append(" ".join(rng.choice(words) for _ in range(rng.randint(5, 15))))
+    return "\n".join(lines) + "\n"
+
+
+def _code_block(rng):
+    tokens = ["def", "x", "=", "foo(bar,", "baz)", "return", "{", "}", "#", "if:"]
+    lines = []
+    for _ in range(200):
+        indent = rng.choice(["", "    ", "        ", "\t", "\t\t"])
+        line = " ".join(rng.choice(tokens) for _ in range(rng.randint(1, 8)))
+        lines.append(indent + line)
+    return "\n".join(lines) + "\n"
+
+
+def _sparse_block(rng):
+    parts = []
+    for _ in range(1000):
+        parts.append("word")
+        parts.append("".join(rng.choice(" \t\n") for _ in range(rng.randint(1, 20))))
+    return "".join(parts)
+
+
+def _dense_block(rng):
+    return " ".join(rng.choice("abcdefghij") for _ in range(5000))
+
+
+PATTERNS = {
+    "prose": _prose_block,
+    "code": _code_block,
+    "sparse": _sparse_block,
+    "dense": _dense_block,
+}
+
+
+def make_document(size, pattern="prose"):
+    """A synthetic document of exactly `size` characters."""
+    block = PATTERNS[pattern](random.Random(pattern))
+    return (block * (size // len(block) + 1))[:size]
+
+
+def cursor_position(document, cursor):
+    return {"start": 0, "middle": len(document) // 2, "end": len(document)}[cursor]
+
+
+def _visible_range(document, cursor_pos):
+    start = max(0, cursor_pos - VISIBLE_LENGTH // 2)
+    return start, min(len(document), start + VISIBLE_LENGTH)
+
+
+# Each case takes (document, cursor position, shared state for the document) and
+# returns the function to time.
+
+
+def case_calculate_text_anchors(document, cursor_pos, shared):
+    return lambda: calculate_text_anchors(document, cursor_pos)
+
+
+def label_visible_range_case(tokenizer):
+    def case(document, cursor_pos, shared):
+        start, end = _visible_range(document, cursor_pos)
+        visible_text = document[start:end]
+
+        def run():
+            visible_start = locate_visible_text(document, visible_text, cursor_pos)
+            visible_end = visible_start + len(visible_text)
+            calculate_range_anchors(
+                document,
+                visible_start,
+                visible_end,
+                cursor_pos,
+                tokenizer=TOKENIZERS[tokenizer],
+            )
+
+        return run
+
+    return case
+
+
+def case_index_update(document, cursor_pos, shared):
+    index = shared["index"]
+    edited = document[:cursor_pos] + "x " + document[cursor_pos:]
+
+    def run():
+        # Type, then undo it, so the index ends up where it started
+        index.update(edited)
+        index.update(document)
+
+    return run
+
+
+def case_resolve_anchors(document, cursor_pos, shared):
+    index = shared["index"]
+
+    def run():
+        ranges = {}
+        for anchor_data in index_text_anchors(index, cursor_pos):
+            ranges[anchor_data[0]] = anchor_data[1:]
+        for anchor in LABEL_CHARS:
+            ranges.get(anchor)
+
+    return run
+
+
+def case_find_word(document, cursor_pos, shared):
+    index = shared.get("offsets")
+    if index is None:
+        index = shared["offsets"] = WordOffsetIndex(document)
+    edited = document[:cursor_pos] + "x " + document[cursor_pos:]
+
+    def run():
+        # Type, look up a word, then undo the typing
+        index.update(edited)
+        index.offsets("x")
+        index.update(document)
+
+    return run
+
+
+def case_undo_push_pop(document, cursor_pos, shared):
+    history = UndoHistory()
+    history.push(document, (cursor_pos, cursor_pos))
+    edited = document[:cursor_pos] + "x " + document[cursor_pos:]
+
+    def run():
+        history.push(edited, (cursor_pos + 2, cursor_pos + 2))
+        history.pop()
+
+    return run
+
+
+def keystroke_case(two_character_labels):
+    def case(document, cursor_pos, shared):
+        key = ("manager", two_character_labels)
+        draft_manager = shared.get(key)
+        if draft_manager is None:
+            # Labelled while drawing, as they are by default, and paged like a
+            # default draft
+            draft_manager = shared[key] = DraftManager()
+            draft_manager.two_character_labels = two_character_labels
+            draft_manager.large_document_chars = 1024 * 1024
+            draft_manager.set_text(document)
+            draft_manager.area.show()
+        draft_manager.set_selection(cursor_pos, cursor_pos)
+        area = draft_manager.area
+
+        def run():
+            # Type a character and delete it again. The fake text area redraws,
+            # and so labels, straight after each.
+            area.insert("x")
+            area.key("backspace")
+
+        return run
+
+    return case
+
+
+CASES = {
+    "calculate_text_anchors": case_calculate_text_anchors,
+    "label_visible_range": label_visible_range_case("word"),
+    "label_visible_range_subword": label_visible_range_case("subword"),
+    "label_visible_range_punctuation": label_visible_range_case("punctuation"),
+    "index_update": case_index_update,
+    "resolve_anchors": case_resolve_anchors,
+    "find_word": case_find_word,
+    "undo_push_pop": case_undo_push_pop,
+    "keystroke": keystroke_case(False),
+    "keystroke_two_character": keystroke_case(True),
+}
+
+
+def _best_time(fn, budget=0.5, max_repeat=20):
+    """Best of several runs, stopping early once `budget` seconds are used up."""
+    best = None
+    total = 0
+    for _ in range(max_repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        if total > budget:
+            break
+    return best
+
+
+def _cpu_name():
+    """The CPU's model name, where it can be found."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    if sys.platform == "darwin":
+        try:
+            return subprocess.run(
+                ["sysctl", "-n", "machdep.cpu.brand_string"],
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+        except OSError:
+            pass
+    return platform.processor()
+
+
+def environment():
+    """What the benchmarks are running on, as it affects the times."""
+    numpy = get_numpy()
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "cpu": _cpu_name(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__ if numpy is not None else None,
+    }
+
+
+def environment_differences(environment, baseline_environment):
+    """
+    The ways `environment` differs from the one a baseline was timed in, as
+    "name: baseline value -> value" strings. A baseline that doesn't say what it
+    was timed in differs in every way.
+    """
+    baseline_environment = baseline_environment or {}
+    return [
+        f"{name}: {baseline_environment.get(name, 'unknown')} -> {value}"
+        for name, value in environment.items()
+        if baseline_environment.get(name, "unknown") != value
+    ]
+
+
+def result_key(result):
+    return (result["case"], result["size"], result["pattern"], result["cursor"])
+
+
+def run_suite(sizes=SIZES, patterns=tuple(PATTERNS), cases=tuple(CASES), log=None):
+    results = []
+    for size in sizes:
+        for pattern in patterns:
+            document = make_document(size, pattern)
+            shared = {"index": WordSpanIndex(document)}
+            for cursor in CURSORS:
+                cursor_pos = cursor_position(document, cursor)
+                for case in cases:
+                    seconds = _best_time(CASES[case](document, cursor_pos, shared))
+                    result = {
+                        "case": case,
+                        "size": size,
+                        "pattern": pattern,
+                        "cursor": cursor,
+                        "seconds": seconds,
+                    }
+                    results.append(result)
+                    if log:
+                        log(result)
+    return results
+
+
+def compare(results, baseline, tolerance=1.5, min_seconds=0.002):
+    """
+    Find the results that are more than `tolerance` times slower than the
+    baseline, as (result, baseline seconds) pairs. Timings below `min_seconds`
+    are too noisy to compare. Results that aren't in the baseline are included
+    too, with None for the baseline, as they can't be checked.
+    """
+    baseline_seconds = {result_key(result): result["seconds"] for result in baseline}
+    regressions = []
+    for result in results:
+        old = baseline_seconds.get(result_key(result))
+        if old is None:
+            regressions.append((result, None))
+            continue
+        new = result["seconds"]
+        if new > min_seconds and new > old * tolerance:
+            regressions.append((result, old))
+    return regressions
+
+
+def bench_anchor_scaling(sizes=(1_000, 10_000, 100_000, 1_000_000)):
+    """
+    Compare calculate_text_anchors to the reference implementation, with the
+    cursor at the end of the document. The reference rescans the text before
+    every anchor, so its cost grows with document size times label count.
+    """
+    rows = []
+    for size in sizes:
+        text = make_document(size)
+        for label_count in (8, len(LABEL_CHARS)):
+            labels = LABEL_CHARS[:label_count]
+            new = _best_time(lambda: calculate_text_anchors(text, len(text), labels))
+            reference = _best_time(
+                lambda: reference_text_anchors(text, len(text), labels)
+            )
+            rows.append((size, label_count, new, reference))
+    return rows
+
+
+# Run in a fresh interpreter, so nothing is imported already
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from {package}.fake_talon import install_fake_talon
+install_fake_talon()
+from {package} import draft_talon_helpers
+imported = time.perf_counter()
+draft_talon_helpers.get_draft_manager()
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def bench_startup(repeat=10):
+    """
+    Time loading the Talon helpers, as Talon does at startup, and creating the
+    draft manager the first time an action needs it. Each run is in a new
+    interpreter. Returns the best (import, first use) times of `repeat` runs, in
+    seconds. Against the fake text area, so creating a real window isn't counted.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    script = _STARTUP_SCRIPT.format(package=__package__)
+    best_import = best_first_use = None
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        import_seconds, first_use_seconds = map(float, output.split())
+        if best_import is None or import_seconds < best_import:
+            best_import = import_seconds
+        if best_first_use is None or first_use_seconds < best_first_use:
+            best_first_use = first_use_seconds
+    return best_import, best_first_use
+
+
+def _log_result(result):
+    print(
+        f"{result['case']:>32} {result['size']:>10} {result['pattern']:>7} "
+        f"{result['cursor']:>7} {result['seconds'] * 1000:>10.3f} ms",
+        file=sys.stderr,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--max-size", type=int, default=max(SIZES))
+    parser.add_argument("--case", action="append", choices=sorted(CASES))
+    parser.add_argument("--pattern", action="append", choices=sorted(PATTERNS))
+    parser.add_argument("--output", help="Write the results here (default stdout)")
+    parser.add_argument("--baseline", help="Compare against this baseline")
+    parser.add_argument(
+        "--save-baseline",
+        nargs="?",
+        const=DEFAULT_BASELINE,
+        help="Save the results as a baseline to compare with later (default: the "
+        "reference run, bench_baseline.json)",
+    )
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument(
+        "--scaling",
+        action="store_true",
+        help="Only compare anchor calculation to the reference implementation",
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="Only time loading the helpers and creating the draft manager",
+    )
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        import_seconds, first_use_seconds = bench_startup()
+        print(f"import helpers:      {import_seconds * 1000:>8.3f} ms")
+        print(f"first draft manager: {first_use_seconds * 1000:>8.3f} ms")
+        return 0
+
+    if args.scaling:
+        print(f"{'size':>10} {'labels':>6} {'new (ms)':>10} {'reference (ms)':>15}")
+        for size, label_count, new, reference in bench_anchor_scaling():
+            print(
+                f"{size:>10} {label_count:>6} {new * 1000:>10.3f} {reference * 1000:>15.3f}"
+            )
+        return 0
+
+    results = run_suite(
+        sizes=[size for size in SIZES if size <= args.max_size],
+        patterns=args.pattern or tuple(PATTERNS),
+        cases=args.case or tuple(CASES),
+        log=_log_result,
+    )
+    report = {"environment": environment(), "results": results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        differences = environment_differences(
+            report["environment"], baseline.get("environment")
+        )
+        if differences:
+            print(
+                f"Not comparing with {args.baseline}, as it was timed on a "
+                "different setup:",
+                *differences,
+                "Save a baseline of your own with --save-baseline before making "
+                "changes, and compare with that.",
+                sep="\n    ",
+                file=sys.stderr,
+            )
+            return 2
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for result, old in regressions:
+            if old is None:
+                print(
+                    f"NO BASELINE {result_key(result)}: regenerate it with "
+                    "--save-baseline",
+                    file=sys.stderr,
+                )
+                continue
+            print(
+                f"REGRESSION {result_key(result)}: "
+                f"{old * 1000:.3f} ms -> {result['seconds'] * 1000:.3f} ms",
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
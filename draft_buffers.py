@@ -0,0 +1,146 @@
+"""Named draft buffers, with the least recently used ones kept on disk."""
+
+from collections import OrderedDict
+import json
+import os
+import re
+
+from .draft_undo import UndoHistory
+
+
+class DraftBuffer:
+    """The text, selection and undo state of one named draft."""
+
+    def __init__(self, name, text="", sel=(0, 0), undo_stack=None, redo_stack=None):
+        self.name = name
+        self.text = text
+        self.sel = sel
+        self.undo_stack = undo_stack if undo_stack is not None else UndoHistory()
+        self.redo_stack = redo_stack if redo_stack is not None else UndoHistory()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "text": self.text,
+            "sel": self.sel,
+            "undo_stack": self.undo_stack.to_dict(),
+            "redo_stack": self.redo_stack.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["name"],
+            data["text"],
+            tuple(data["sel"]),
+            UndoHistory.from_dict(data["undo_stack"]),
+            UndoHistory.from_dict(data["redo_stack"]),
+        )
+
+
+def buffer_key(name):
+    """
+    Normalise a spoken buffer name, so "Shopping List" and "shopping list" are
+    the same buffer. Also used as its file name.
+    """
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "default"
+
+
+class BufferStore:
+    """
+    Named DraftBuffers. The `max_resident` most recently used are kept in
+    memory, the rest are saved to `directory` and loaded again when next asked
+    for. `save_all()` saves the ones in memory too, e.g. when the window is
+    hidden, so every buffer survives a restart.
+
+    The name of the buffer in the window is also kept in `directory`, so a draft
+    recovered after a restart goes back into the buffer it came from.
+    """
+
+    def __init__(self, directory, max_resident=4):
+        self.directory = directory
+        self.max_resident = max_resident
+        # Least recently used first
+        self._resident = OrderedDict()
+
+    def get(self, name):
+        """The buffer called `name`, an empty one if it doesn't exist yet."""
+        key = buffer_key(name)
+        buffer = self._resident.get(key)
+        if buffer is None:
+            buffer = self._load(key) or DraftBuffer(key)
+            self._resident[key] = buffer
+            self._evict()
+        else:
+            self._resident.move_to_end(key)
+        return buffer
+
+    def put(self, buffer):
+        """Store a buffer, replacing any with the same name."""
+        key = buffer_key(buffer.name)
+        buffer.name = key
+        self._resident[key] = buffer
+        self._resident.move_to_end(key)
+        self._evict()
+
+    def save_all(self):
+        """Save every buffer in memory to disk, keeping them in memory."""
+        for buffer in self._resident.values():
+            self.save(buffer)
+
+    def read_current(self):
+        """The name saved by `write_current()`, or "default"."""
+        try:
+            with open(self._current_path(), encoding="utf-8") as f:
+                return buffer_key(f.read())
+        except FileNotFoundError:
+            return "default"
+
+    def write_current(self, name):
+        """Remember `name` as the buffer in the window."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._current_path(), "w", encoding="utf-8") as f:
+            f.write(buffer_key(name))
+
+    def is_resident(self, name):
+        return buffer_key(name) in self._resident
+
+    def names(self):
+        """The names of every buffer, in memory or on disk."""
+        names = set(self._resident)
+        try:
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith(".json"):
+                    names.add(file_name[: -len(".json")])
+        except FileNotFoundError:
+            pass
+        return sorted(names)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _current_path(self):
+        # Not .json, so it isn't taken for a buffer
+        return os.path.join(self.directory, "current.txt")
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        return DraftBuffer.from_dict(data)
+
+    def save(self, buffer):
+        """Write `buffer` to disk."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(buffer.name)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(buffer.to_dict(), f)
+        os.replace(temp_path, path)
+
+    def _evict(self):
+        while len(self._resident) > self.max_resident:
+            _, buffer = self._resident.popitem(last=False)
+            self.save(buffer)
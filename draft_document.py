@@ -0,0 +1,93 @@
+"""Piece table storage for drafts too big to edit as one string."""
+
+from bisect import bisect_left, bisect_right
+
+
+class PieceTable:
+    """
+    A string that can be edited without copying the whole of it.
+
+    The text is a list of pieces, each a slice of one of the buffers: the
+    original text, or the text inserted by an edit. An edit only splits the
+    pieces at its ends, so it costs time in proportion to the number of pieces,
+    not the length of the text. Once there are more than `max_pieces` the text is
+    joined back into a single piece.
+    """
+
+    def __init__(self, text="", max_pieces=2000):
+        self.max_pieces = max_pieces
+        self._buffers = [text]
+        # (buffer index, start, end) for each piece, in order
+        self._pieces = [(0, 0, len(text))] if text else []
+        # Where each piece starts in the text, for bisecting
+        self._starts = [0] if text else []
+        self._length = len(text)
+        # The whole text, while it's known
+        self._text = text
+
+    def __len__(self):
+        return self._length
+
+    def text(self):
+        """The whole text. Joined up once, then kept until the next edit."""
+        if self._text is None:
+            buffers = self._buffers
+            self._text = "".join(
+                buffers[buffer][start:end] for buffer, start, end in self._pieces
+            )
+        return self._text
+
+    def slice(self, start, end):
+        """The same as `text()[start:end]`, without joining the whole text."""
+        start = max(0, min(start, self._length))
+        end = max(start, min(end, self._length))
+        if self._text is not None:
+            return self._text[start:end]
+
+        parts = []
+        i = max(0, bisect_right(self._starts, start) - 1)
+        while i < len(self._pieces) and self._starts[i] < end:
+            buffer, piece_start, piece_end = self._pieces[i]
+            offset = self._starts[i] - piece_start
+            parts.append(
+                self._buffers[buffer][
+                    max(piece_start, start - offset) : min(piece_end, end - offset)
+                ]
+            )
+            i += 1
+        return "".join(parts)
+
+    def replace(self, start, end, text):
+        """Replace `text()[start:end]` with `text`."""
+        pieces = self._pieces
+        starts = self._starts
+        # The pieces from the one containing `start` to the one containing `end`
+        first = max(0, bisect_right(starts, start) - 1)
+        last = min(len(pieces), max(first + 1, bisect_left(starts, end)))
+
+        new_pieces = []
+        if first < len(pieces) and start > starts[first]:
+            buffer, piece_start, _ = pieces[first]
+            new_pieces.append(
+                (buffer, piece_start, piece_start + start - starts[first])
+            )
+        if text:
+            self._buffers.append(text)
+            new_pieces.append((len(self._buffers) - 1, 0, len(text)))
+        if last > first:
+            buffer, piece_start, piece_end = pieces[last - 1]
+            cut = piece_start + end - starts[last - 1]
+            if cut < piece_end:
+                new_pieces.append((buffer, cut, piece_end))
+
+        pieces[first:last] = new_pieces
+        position = starts[first] if starts else 0
+        del starts[first:]
+        for _, piece_start, piece_end in pieces[first:]:
+            starts.append(position)
+            position += piece_end - piece_start
+        self._length = position
+        self._text = None
+
+        if len(pieces) > self.max_pieces:
+            self.__init__(self.text(), self.max_pieces)
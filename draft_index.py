@@ -0,0 +1,455 @@
+"""Incrementally maintained indexes over the draft text.
+
+Nothing in here depends on Talon, so it can be used (and tested) anywhere.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import re
+import string
+
+# TODO: \s probably wrong? Should be [ \t]?
+word_matcher = re.compile(r"([^\s]+)(\s*)")
+
+# Ways of splitting the text into words to label. Each is a compiled pattern
+# whose matches are a word (group 1) and the whitespace after it (group 2).
+TOKENIZERS = {
+    # Everything between whitespace
+    "word": word_matcher,
+    # Parts of camelCase, snake_case and kebab-case identifiers, numbers and
+    # runs of punctuation. Underscores are treated like whitespace.
+    "subword": re.compile(
+        r"([A-Z]+(?![^\W\d_A-Z])|[A-Z]?[^\W\d_A-Z]+|\d+|[^\w\s]+)([\s_]*)"
+    ),
+    # Words, keeping contractions like "don't" together, and punctuation
+    "punctuation": re.compile(r"(\w+(?:['\u2019]\w+)*|[^\w\s]+)(\s*)"),
+}
+
+# Texts shorter than this are always tokenised with the regex, as setting up
+# the arrays costs more than it saves.
+NUMPY_MIN_CHARS = 1000
+
+# numpy is optional, and only used to tokenise long texts faster. It's slow to
+# import, so that waits until the first long text. None until then, False if it
+# isn't installed.
+_numpy = None
+# Which code points are whitespace, as `\s` matches it, built with numpy. None
+# are above U+3000, so anything higher is looked up in the last (False) entry.
+_WHITESPACE_TABLE = None
+
+
+def get_numpy():
+    """The numpy module, importing it the first time, or None if it's missing."""
+    global _numpy, _WHITESPACE_TABLE
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            _numpy = False
+        else:
+            table = numpy.zeros(0x3002, dtype=bool)
+            table[[c for c in range(0x3001) if chr(c).isspace()]] = True
+            _WHITESPACE_TABLE = table
+            _numpy = numpy
+    return _numpy or None
+
+
+def use_numpy_spans(text, tokenizer):
+    """Should `numpy_word_spans` be used to tokenise `text`?"""
+    return (
+        tokenizer is word_matcher
+        and len(text) >= NUMPY_MIN_CHARS
+        and get_numpy() is not None
+    )
+
+
+def numpy_word_spans(text):
+    """
+    The spans `word_matcher` finds in `text`, as three numpy arrays: the start
+    of each word, its end, and the end of the whitespace after it.
+
+    Every character is classified as whitespace or not in one go, and the words
+    are where that changes, so no Python code runs per word. Needs numpy.
+    """
+    numpy = get_numpy()
+    length = len(text)
+    if length == 0:
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return empty, empty, empty
+    codes = numpy.frombuffer(
+        text.encode("utf-32-le", "surrogatepass"), dtype=numpy.uint32
+    )
+    space = _WHITESPACE_TABLE[numpy.minimum(codes, 0x3001)]
+    word = ~space
+    # A word starts after whitespace (or at the start), and ends before it
+    starts = numpy.flatnonzero(word & numpy.concatenate(([True], space[:-1])))
+    ends = numpy.flatnonzero(word & numpy.concatenate((space[1:], [True]))) + 1
+    # Each word's whitespace runs up to the next word, the last one's to the end
+    whitespace_ends = numpy.append(starts[1:], length) if len(starts) else starts
+    return starts, ends, whitespace_ends
+
+
+# Size of the first block compared when looking for the common prefix/suffix of
+# two strings. Blocks double in size after each match.
+_COMPARE_BLOCK = 4096
+
+
+def _common_prefix_length(a, b, limit):
+    """Length of the common prefix of `a` and `b`, up to `limit` characters."""
+    # Gallop through equal blocks (compared in C), then binary search the first
+    # block that differs.
+    lo = 0
+    size = _COMPARE_BLOCK
+    while lo < limit:
+        hi = min(lo + size, limit)
+        if a[lo:hi] != b[lo:hi]:
+            break
+        lo = hi
+        size *= 2
+    else:
+        return limit
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def _common_suffix_length(a, b, limit):
+    """Length of the common suffix of `a` and `b`, up to `limit` characters."""
+    len_a = len(a)
+    len_b = len(b)
+    lo = 0
+    size = _COMPARE_BLOCK
+    while lo < limit:
+        hi = min(lo + size, limit)
+        if a[len_a - hi : len_a - lo] != b[len_b - hi : len_b - lo]:
+            break
+        lo = hi
+        size *= 2
+    else:
+        return limit
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[len_a - mid : len_a - lo] == b[len_b - mid : len_b - lo]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def text_difference(old, new):
+    """
+    Find the region that changed between `old` and `new`.
+
+    Returns a (start, old_end, new_end) tuple such that
+    `new == old[:start] + new[start:new_end] + old[old_end:]`. If the strings are
+    equal the region is empty.
+    """
+    shortest = min(len(old), len(new))
+    start = _common_prefix_length(old, new, shortest)
+    suffix = _common_suffix_length(old, new, shortest - start)
+    return start, len(old) - suffix, len(new) - suffix
+
+
+class WordSpanIndex:
+    """
+    The word spans of a piece of text, as found by `tokenizer` (one of
+    TOKENIZERS).
+
+    Spans are held in three parallel lists - the start of each word, the end of
+    each word and the end of the whitespace after it - so they can be bisected.
+    When the text changes only the words around the edited region are
+    re-tokenised, the words after it are just moved.
+    """
+
+    def __init__(self, text="", tokenizer=word_matcher):
+        self.text = ""
+        self.tokenizer = tokenizer
+        self.starts = []
+        self.ends = []
+        self.whitespace_ends = []
+        self.update(text)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def update(self, text):
+        """Bring the index up to date with `text`. Returns True if it changed."""
+        old_text = self.text
+        if text == old_text:
+            return False
+
+        start, old_end, new_end = text_difference(old_text, text)
+        delta = new_end - old_end
+        starts = self.starts
+
+        # Tokenising can restart from any word start that isn't affected by the
+        # edit. Back up an extra word because a change at the start of a word
+        # can also change the trailing whitespace of the one before it.
+        first = bisect_right(starts, start) - 2
+        if first < 0:
+            first = 0
+            scan_from = 0
+        else:
+            scan_from = starts[first]
+            # Splitting up a word can depend on the whole word (e.g. "HTTPServer"),
+            # so go back to where it starts.
+            while scan_from > 0 and not text[scan_from - 1].isspace():
+                scan_from -= 1
+            first = bisect_left(starts, scan_from, 0, first)
+
+        if not starts and use_numpy_spans(text, self.tokenizer):
+            # Indexing a long text from scratch
+            self.starts, self.ends, self.whitespace_ends = (
+                spans.tolist() for spans in numpy_word_spans(text)
+            )
+            self.text = text
+            return True
+
+        new_starts = []
+        new_ends = []
+        new_whitespace_ends = []
+        # Index of the first old span that is still valid, once moved.
+        resume = len(starts)
+        for match in self.tokenizer.finditer(text, scan_from):
+            match_start = match.start()
+            if match_start >= new_end:
+                # Past the edit, tokenising is back in step with the old text
+                # as soon as a word starts where an old (moved) word started.
+                old_start = match_start - delta
+                candidate = bisect_left(starts, old_start, first)
+                if candidate < len(starts) and starts[candidate] == old_start:
+                    resume = candidate
+                    break
+            new_starts.append(match_start)
+            new_ends.append(match.end(1))
+            new_whitespace_ends.append(match.end())
+
+        self._splice(self.starts, first, resume, new_starts, delta)
+        self._splice(self.ends, first, resume, new_ends, delta)
+        self._splice(self.whitespace_ends, first, resume, new_whitespace_ends, delta)
+        self.text = text
+        return True
+
+    @staticmethod
+    def _splice(values, first, resume, replacement, delta):
+        if delta:
+            replacement.extend(value + delta for value in values[resume:])
+            values[first:] = replacement
+        else:
+            values[first:resume] = replacement
+
+    def word_at(self, position):
+        """
+        Index of the word whose span (including trailing whitespace) contains
+        `position`, or None if no word does.
+
+        Like `calculate_text_anchors`, when `position` sits on the boundary
+        between two words the later word wins.
+        """
+        i = bisect_right(self.starts, position) - 1
+        if i >= 0 and self.whitespace_ends[i] >= position:
+            return i
+        return None
+
+
+# Tokens for WordOffsetIndex: anything between whitespace
+token_matcher = re.compile(r"\S+")
+_PUNCTUATION = string.punctuation + "‘’“”…"
+
+
+def word_bounds(token):
+    """
+    The (start, end) of the word in `token`, without surrounding punctuation.
+    Tokens that are all punctuation are a word of their own.
+    """
+    end = len(token.rstrip(_PUNCTUATION))
+    if end == 0:
+        return (0, len(token))
+    return (len(token) - len(token.lstrip(_PUNCTUATION)), end)
+
+
+def word_key(token):
+    """
+    How a token is looked up in WordOffsetIndex: its word in lower case, so
+    "hello" finds "Hello,".
+    """
+    start, end = word_bounds(token)
+    return token[start:end].lower()
+
+
+class WordOffsetIndex:
+    """
+    Where each word appears in a piece of text, as a map from `word_key()` to the
+    sorted offsets of the tokens with that key.
+
+    On an edit only the keys of the tokens in the edited region are touched. The
+    offsets of every other token after the edit need moving, but that's put off:
+    the edit is added to a log, and a key's offsets are moved along the log the
+    next time that key is looked up. So both edits and lookups cost time in
+    proportion to the number of matching tokens, not the size of the text. Once
+    the log has `max_pending_edits` entries every key is brought up to date and
+    the log is cleared.
+    """
+
+    def __init__(self, text="", max_pending_edits=64):
+        self.text = ""
+        self.max_pending_edits = max_pending_edits
+        self._offsets = {}
+        # How many entries of the log each key's offsets have been moved along
+        self._versions = {}
+        # (position, delta) for each edit: offsets from position move by delta
+        self._edits = []
+        self.update(text)
+
+    def update(self, text):
+        """Bring the index up to date with `text`. Returns True if it changed."""
+        old_text = self.text
+        if text == old_text:
+            return False
+
+        start, old_end, new_end = text_difference(old_text, text)
+        # Widen the edited region to whole tokens. The text after the region is
+        # the same before and after the edit, so it widens by the same amount.
+        while start > 0 and not old_text[start - 1].isspace():
+            start -= 1
+        extra = 0
+        while (
+            old_end + extra < len(old_text) and not old_text[old_end + extra].isspace()
+        ):
+            extra += 1
+        old_end += extra
+        new_end += extra
+        delta = new_end - old_end
+
+        removed = {}
+        for match in token_matcher.finditer(old_text, start, old_end):
+            removed.setdefault(word_key(match.group()), []).append(match.start())
+        added = {}
+        for match in token_matcher.finditer(text, start, new_end):
+            added.setdefault(word_key(match.group()), []).append(match.start())
+
+        version = len(self._edits)
+        for key in removed.keys() | added.keys():
+            offsets = self._current_offsets(key)
+            first = bisect_left(offsets, start)
+            resume = bisect_left(offsets, old_end, first)
+            tail = offsets[resume:]
+            del offsets[first:]
+            offsets.extend(added.get(key, ()))
+            offsets.extend(offset + delta for offset in tail)
+            if offsets:
+                self._versions[key] = version + 1
+            else:
+                del self._offsets[key]
+                del self._versions[key]
+        self._edits.append((old_end, delta))
+        self.text = text
+
+        if len(self._edits) > self.max_pending_edits:
+            for key in self._offsets:
+                self._current_offsets(key)
+            self._edits = []
+            self._versions = dict.fromkeys(self._offsets, 0)
+        return True
+
+    def offsets(self, word):
+        """The sorted start offsets of the tokens matching `word`."""
+        key = word_key(word)
+        if key not in self._offsets:
+            return array("q")
+        return self._current_offsets(key)
+
+    def _current_offsets(self, key):
+        offsets = self._offsets.get(key)
+        if offsets is None:
+            offsets = self._offsets[key] = array("q")
+            self._versions[key] = len(self._edits)
+            return offsets
+
+        version = self._versions[key]
+        for position, delta in self._edits[version:]:
+            if delta:
+                i = bisect_left(offsets, position)
+                offsets[i:] = array("q", [offset + delta for offset in offsets[i:]])
+        self._versions[key] = len(self._edits)
+        return offsets
+
+
+class LineIndex:
+    """
+    Where each line of a piece of text starts, so a position can be turned into a
+    line number (and back) by bisecting rather than counting newlines.
+
+    On an edit only the newlines in the edited region are looked at. The starts
+    of the lines after it are moved along.
+    """
+
+    def __init__(self, text=""):
+        self.text = ""
+        self.starts = array("q", [0])
+        self.update(text)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def update(self, text):
+        """Bring the index up to date with `text`. Returns True if it changed."""
+        old_text = self.text
+        if text == old_text:
+            return False
+
+        start, old_end, new_end = text_difference(old_text, text)
+        delta = new_end - old_end
+        starts = self.starts
+        # A line starts after each newline, so the starts that may have changed
+        # are those from just after `start` to just after the end of the edit.
+        first = bisect_right(starts, start)
+        resume = bisect_right(starts, old_end, first)
+        replacement = array("q")
+        newline = text.find("\n", start, new_end)
+        while newline != -1:
+            replacement.append(newline + 1)
+            newline = text.find("\n", newline + 1, new_end)
+        if delta:
+            replacement.extend(line_start + delta for line_start in starts[resume:])
+            starts[first:] = replacement
+        else:
+            starts[first:resume] = replacement
+        self.text = text
+        return True
+
+    def line_at(self, position):
+        """The number (from 0) of the line containing `position`."""
+        return bisect_right(self.starts, position) - 1
+
+    def line_range(self, line):
+        """The (start, end) of a line, not including its newline."""
+        starts = self.starts
+        start = starts[line]
+        if line + 1 < len(starts):
+            return (start, starts[line + 1] - 1)
+        return (start, len(self.text))
+
+    def is_blank(self, line):
+        start, end = self.line_range(line)
+        return self.text[start:end].isspace() or start == end
+
+    def paragraph_range(self, position):
+        """
+        The (start, end) of the paragraph containing `position`: the lines around
+        it up to the nearest blank lines, not including the last newline. On a
+        blank line it's just that line.
+        """
+        first = last = self.line_at(position)
+        if not self.is_blank(first):
+            while first > 0 and not self.is_blank(first - 1):
+                first -= 1
+            while last + 1 < len(self.starts) and not self.is_blank(last + 1):
+                last += 1
+        return (self.line_range(first)[0], self.line_range(last)[1])
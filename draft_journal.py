@@ -0,0 +1,181 @@
+"""Crash-safe autosave for the draft window."""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from .draft_document import PieceTable
+from .draft_index import text_difference
+
+
+class DraftJournal:
+    """
+    An append-only journal of the draft text, so it can be recovered if Talon
+    exits mid-dictation.
+
+    Each line of the file is JSON: either `{"text": ...}`, a full copy of the
+    text, or `{"edit": [start, end, replacement]}`, a change to the text before
+    it. Writes happen on a background thread, which batches whatever has queued
+    up and fsyncs once per batch, so `record()` never waits on the disk. Every
+    `compact_after` edits the file is rewritten as a single copy of the text.
+    """
+
+    def __init__(self, path, compact_after=100, batch_delay=0.1):
+        self.path = path
+        self.compact_after = compact_after
+        self.batch_delay = batch_delay
+        # A PieceTable of the text as of the last record, or None if the next
+        # record has to write the text in full
+        self._text = None
+        self._edits_since_compaction = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Set by the writer when a write fails, until a full copy is written
+        self._needs_text = False
+
+    def record(self, text):
+        """Journal the current text, if it has changed."""
+        with self._lock:
+            old_text = None if self._text is None else self._text.text()
+            if text == old_text:
+                return
+            self._text = PieceTable(text)
+            if old_text is None or self._edits_since_compaction >= self.compact_after:
+                self._edits_since_compaction = 0
+                self._put(("text", text))
+            else:
+                start, old_end, new_end = text_difference(old_text, text)
+                self._edits_since_compaction += 1
+                self._put(("edit", [start, old_end, text[start:new_end]]))
+
+    def record_edit(self, start, end, replacement):
+        """
+        Journal the text last recorded with `[start:end]` replaced by
+        `replacement`, without needing the whole of the text. Returns False, and
+        records nothing, if the journal doesn't have the text to edit, in which
+        case pass the whole of it to record() instead.
+        """
+        with self._lock:
+            text = self._text
+            if text is None:
+                return False
+            if text.slice(start, end) == replacement:
+                return True
+            text.replace(start, end, replacement)
+            if self._edits_since_compaction >= self.compact_after:
+                self._edits_since_compaction = 0
+                self._put(("text", text.text()))
+            else:
+                self._edits_since_compaction += 1
+                self._put(("edit", [start, end, replacement]))
+            return True
+
+    def reset(self):
+        """Forget the text, so the next record() writes it in full."""
+        with self._lock:
+            self._text = None
+
+    def recover(self):
+        """
+        Read the text back from the journal, or None if there isn't one. Also
+        compacts the journal, and continues journaling from the recovered text.
+        """
+        self.flush()
+        text = self.read(self.path)
+        with self._lock:
+            self._text = None if text is None else PieceTable(text)
+            self._edits_since_compaction = 0
+            if text is not None:
+                self._put(("text", text))
+        return text
+
+    def flush(self):
+        """Block until everything recorded so far is on disk."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _put(self, item):
+        self._queue.put(item)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._write_loop, name="draft journal", daemon=True
+            )
+            self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Give a burst of changes a moment to arrive, then write them together
+            time.sleep(self.batch_delay)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if not (self._needs_text and all(kind != "text" for kind, _ in batch)):
+                    self._write(batch)
+                    self._needs_text = False
+            except OSError:
+                logging.exception("Couldn't write draft journal %s", self.path)
+                # The edits after this are against text the file doesn't have, so
+                # skip them, and have the next record() write the text in full
+                self._needs_text = True
+                self.reset()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        # Only the entries after the last full copy matter
+        for i in range(len(batch) - 1, -1, -1):
+            if batch[i][0] == "text":
+                batch = batch[i:]
+                replace = True
+                break
+        else:
+            replace = False
+
+        lines = "".join(json.dumps({kind: value}) + "\n" for kind, value in batch)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if replace:
+            # Compact by writing a fresh file and swapping it in, so a crash
+            # part way through leaves the old journal intact.
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        else:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def read(path):
+        """The text recorded in the journal at `path`, or None if there's none."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+
+        text = None
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line torn by a crash mid-write. Nothing can follow it.
+                break
+            if "text" in entry:
+                text = entry["text"]
+            elif text is not None:
+                start, end, replacement = entry["edit"]
+                text = text[:start] + replacement + text[end:]
+        return text
@@ -0,0 +1,45 @@
+"""
+Slow but obviously correct versions of the draft window's algorithms, to check
+the real ones against in tests and benchmarks.
+"""
+
+import re
+
+from .draft_index import word_matcher
+
+
+def reference_text_anchors(text, cursor_position, anchor_labels):
+    """
+    The original, straightforward implementation of calculate_text_anchors. It
+    rescans the text before every anchor, so it's slow, but it's easy to check.
+    """
+    if len(text) == 0:
+        return []
+
+    matches = []
+    cursor_idx = 0
+    for match in word_matcher.finditer(text):
+        matches.append(
+            (
+                # Words start
+                match.start(),
+                # Words end
+                match.end() - len(match.group(2)),
+                # After trailing whitespace
+                match.end(),
+            )
+        )
+        if matches[-1][0] <= cursor_position and matches[-1][2] >= cursor_position:
+            cursor_idx = len(matches) - 1
+
+    anchors_before_cursor = len(anchor_labels) // 2
+    anchor_start_idx = max(0, cursor_idx - anchors_before_cursor)
+    anchor_end_idx = min(len(matches), anchor_start_idx + len(anchor_labels))
+    anchor_start_idx = max(0, anchor_end_idx - len(anchor_labels))
+
+    result = []
+    for i, anchor in zip(range(anchor_start_idx, anchor_end_idx), anchor_labels):
+        word_start, word_end, whitespace_end = matches[i]
+        whitespace_start = re.search("[ \t]*$", text[:word_start]).start()
+        result.append((anchor, word_start, word_end, whitespace_start, whitespace_end))
+    return result
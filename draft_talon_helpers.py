@@ -1,10 +1,18 @@
 from typing import Optional
-from talon import ui, settings, Module, Context, actions
+from functools import wraps
+import logging
+import os
+import time
+from talon import ui, settings, Module, Context, actions, cron
+from .draft_buffers import BufferStore, DraftBuffer, buffer_key
+from .draft_journal import DraftJournal
+from .draft_trace import TraceRecorder
 from .draft_ui import DraftManager
+from .draft_undo import UndoHistory
+from .draft_timing import timings
 
 from user.misc.chunked_phrase import SurroundingText
 
-
 mod = Module()
 
 # ctx is for toggling the draft_window_showing variable
@@ -46,22 +54,163 @@ setting_text_size = mod.setting(
     default=20,
     desc="Sets the size of the text used in the draft window",
 )
+setting_two_character_labels = mod.setting(
+    "draft_window_two_character_labels",
+    type=int,
+    default=0,
+    desc=(
+        "Set to 1 to label every word on screen with two letters, rather than "
+        "labelling the words near the cursor with one character"
+    ),
+)
+setting_tokenizer = mod.setting(
+    "draft_window_tokenizer",
+    type=str,
+    default="word",
+    desc=(
+        "How the text is split into words to label: 'word' (between whitespace), "
+        "'subword' (also splits camelCase and snake_case) or 'punctuation' (labels "
+        "punctuation separately)"
+    ),
+)
+setting_label_margin = mod.setting(
+    "draft_window_label_margin",
+    type=int,
+    default=0,
+    desc=(
+        "Set above 0 to keep the labels where they are until the cursor gets this "
+        "many words from the first or last label, rather than moving them all "
+        "every time the cursor moves"
+    ),
+)
+setting_undo_max_steps = mod.setting(
+    "draft_window_undo_max_steps",
+    type=int,
+    default=200,
+    desc="The number of undo steps to remember in the draft window",
+)
+setting_undo_max_kb = mod.setting(
+    "draft_window_undo_max_kb",
+    type=int,
+    default=4096,
+    desc=(
+        "Roughly how much memory (in KB) the draft window's undo history may use "
+        "before the oldest steps are forgotten"
+    ),
+)
+setting_timing = mod.setting(
+    "draft_window_timing",
+    type=int,
+    default=0,
+    desc=(
+        "Set to 1 to time draft window operations, see user.draft_timing_report. "
+        "Off by default"
+    ),
+)
+setting_trace = mod.setting(
+    "draft_window_trace",
+    type=int,
+    default=0,
+    desc=(
+        "Set to 1 to record what you do in the draft window to "
+        "draft_window/traces in the Talon home directory, for replay_draft_trace.py"
+    ),
+)
+setting_autosave = mod.setting(
+    "draft_window_autosave",
+    type=int,
+    default=1,
+    desc=(
+        "Set to 0 to stop saving the draft text to disk. When on, the draft is "
+        "recovered the next time the window is shown after Talon restarts"
+    ),
+)
+setting_buffers_in_memory = mod.setting(
+    "draft_window_buffers_in_memory",
+    type=int,
+    default=4,
+    desc=(
+        "How many named draft buffers to keep in memory. Less recently used ones "
+        "are saved to disk until you switch back to them"
+    ),
+)
+setting_large_document_kb = mod.setting(
+    "draft_window_large_document_kb",
+    type=int,
+    default=1024,
+    desc=(
+        "Drafts bigger than this (in KB) are shown a page at a time, which keeps "
+        "editing them responsive. 0 turns this off"
+    ),
+)
+setting_background_labels_kb = mod.setting(
+    "draft_window_background_labels_kb",
+    type=int,
+    default=256,
+    desc=(
+        "With two character labels, drafts at least this big (in KB) are labelled "
+        "on a background thread, so the window never waits for labels to redraw. "
+        "0 turns this off"
+    ),
+)
 
 
-draft_manager = DraftManager()
+# Created when the draft window is first used, see get_draft_manager()
+_draft_manager = None
+
+
+def get_draft_manager() -> DraftManager:
+    """The draft window's manager, creating it the first time it's needed."""
+    global _draft_manager
+    if _draft_manager is None:
+        _draft_manager = DraftManager()
+        _update_draft_style()
+    return _draft_manager
 
 
 # Update the styling of the draft window dynamically as user settings change
 def _update_draft_style(*args):
-    draft_manager.set_styling(
+    global _style_update_handle
+    _style_update_handle = None
+    if _draft_manager is None:
+        # Nothing to style yet. The settings are read when it's created.
+        return
+    _draft_manager.set_styling(
         theme=settings.get("user.draft_window_theme"),
         label_size=settings.get("user.draft_window_label_size"),
         label_color=settings.get("user.draft_window_label_color"),
         text_size=settings.get("user.draft_window_text_size"),
+        two_character_labels=(
+            settings.get("user.draft_window_two_character_labels") == 1
+        ),
+        tokenizer=settings.get("user.draft_window_tokenizer"),
+    )
+    timings.enabled = settings.get("user.draft_window_timing") == 1
+    _draft_manager.large_document_chars = (
+        settings.get("user.draft_window_large_document_kb") * 1024
     )
+    _draft_manager.label_margin = settings.get("user.draft_window_label_margin")
+    _draft_manager.background_label_chars = (
+        settings.get("user.draft_window_background_labels_kb") * 1024
+    )
+
+
+# Handle for the timer that applies a burst of setting changes
+_style_update_handle = None
 
 
-settings.register("", _update_draft_style)
+def _on_setting_change(name, value):
+    if _draft_manager is None or not name.startswith("user.draft_window_"):
+        return
+    # A context switch can change many settings at once, so wait for them all
+    # and update once.
+    global _style_update_handle
+    if _style_update_handle is not None:
+        cron.cancel(_style_update_handle)
+    _style_update_handle = cron.after("50ms", _update_draft_style)
+
+
+settings.register("", _on_setting_change)
 
 
 @ctx_focused.action_class("user")
@@ -72,11 +221,11 @@ class ContextSensitiveDictationActions:
     """
 
     def dictation_peek_left(clobber=False):
-        area = draft_manager.area
+        area = get_draft_manager().area
         return area[max(0, area.sel.left - 50) : area.sel.left]
 
     def dictation_peek_right():
-        area = draft_manager.area
+        area = get_draft_manager().area
         return area[area.sel.right : area.sel.right + 50]
 
     def paste(text: str):
@@ -91,14 +240,155 @@ class EditActions:
     """
 
     def selected_text() -> str:
-        area = draft_manager.area
+        area = get_draft_manager().area
         if area.sel:
             result = area[area.sel.left : area.sel.right]
             return result
         return ""
 
 
-from talon import cron
+class Autosave:
+    """
+    Keeps a journal of the draft text on disk, so the draft survives Talon
+    restarting or crashing.
+    """
+
+    journal = None
+    # Only recover once, the first time the window is shown
+    recovered = False
+
+    @classmethod
+    def enabled(cls):
+        return settings.get("user.draft_window_autosave") == 1
+
+    @classmethod
+    def get_journal(cls):
+        if cls.journal is None:
+            path = os.path.join(
+                str(actions.path.talon_home()), "draft_window", "journal.jsonl"
+            )
+            cls.journal = DraftJournal(path)
+        return cls.journal
+
+    @classmethod
+    def record(cls, text):
+        if cls.enabled():
+            if not cls.recovered:
+                cls._rescue(text)
+            cls.get_journal().record(text)
+        elif cls.journal is not None:
+            # Changes made while it's off aren't journaled, so write the text in
+            # full when it's turned back on
+            cls.journal.reset()
+
+    @classmethod
+    def record_edit(cls, start, end, replacement, get_text):
+        """
+        Journal `[start:end]` of the text last recorded being replaced with
+        `replacement`. Falls back to recording all of `get_text()` if the journal
+        doesn't have the text to edit.
+        """
+        if not cls.enabled():
+            if cls.journal is not None:
+                cls.journal.reset()
+        elif not (
+            cls.recovered and cls.get_journal().record_edit(start, end, replacement)
+        ):
+            cls.record(get_text())
+
+    @classmethod
+    def recover(cls) -> Optional[str]:
+        """The draft from before Talon restarted, if there's one to recover."""
+        if cls.recovered or not cls.enabled():
+            return None
+        cls.recovered = True
+        return cls.get_journal().recover() or None
+
+    @classmethod
+    def _rescue(cls, text):
+        """
+        Called when the window is given new text before the draft from before
+        Talon restarted was recovered. Moves that draft into the "recovered"
+        buffer, rather than journaling over it.
+        """
+        old_text = cls.recover()
+        if old_text is None or old_text == text:
+            return
+        store = DraftBuffers.get_store()
+        buffer = DraftBuffer("recovered", old_text, (len(old_text), len(old_text)))
+        store.put(buffer)
+        store.save(buffer)
+        actions.app.notify(
+            'Say "draft buffer recovered" to get it back',
+            "Draft from before Talon restarted",
+        )
+
+
+class Tracing:
+    """
+    Records the draft window actions that are run, and the changes to the text
+    around them, while user.draft_window_trace is on. See draft_trace.py.
+    """
+
+    recorder = None
+    # How many traced actions are running, so actions run by other actions
+    # aren't recorded twice
+    depth = 0
+
+    @classmethod
+    def get_recorder(cls) -> Optional[TraceRecorder]:
+        if settings.get("user.draft_window_trace") != 1:
+            if cls.recorder is not None:
+                cls.recorder.close()
+                cls.recorder = None
+            return None
+        if cls.recorder is None:
+            path = os.path.join(
+                str(actions.path.talon_home()),
+                "draft_window",
+                "traces",
+                time.strftime("%Y%m%d-%H%M%S") + ".jsonl",
+            )
+            cls.recorder = TraceRecorder(path)
+        return cls.recorder
+
+    @classmethod
+    def traced(cls, name, fn):
+        """Wrap the action `fn`, called `name`, so it's recorded."""
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = cls.get_recorder() if cls.depth == 0 else None
+            if recorder is None:
+                return fn(*args, **kwargs)
+
+            area = get_draft_manager().area
+            # Whatever was dictated since the last action
+            recorder.record_state(area.value, (area.sel.left, area.sel.right))
+            cls.depth += 1
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                cls.depth -= 1
+                recorder.record_action(name, args, kwargs, time.perf_counter() - start)
+                recorder.record_state(
+                    area.value, (area.sel.left, area.sel.right), result=True
+                )
+
+        return wrapper
+
+    @classmethod
+    def trace_actions(cls, namespace):
+        """Class decorator that traces every action in an action class."""
+
+        def decorator(action_class):
+            for name, fn in list(vars(action_class).items()):
+                if not name.startswith("_") and callable(fn):
+                    setattr(action_class, name, cls.traced(f"{namespace}.{name}", fn))
+            return action_class
+
+        return decorator
 
 
 class UndoWorkaround:
@@ -113,39 +403,60 @@ class UndoWorkaround:
     enable_workaround = True
 
     # Stack of (text_value, selection) tuples representing the undo stack
-    undo_stack = []
+    undo_stack = UndoHistory()
     # Stack of (text_value, selection) tuples representing the redo stack
-    redo_stack = []
-    # Used by the timer to check when the text has stopped changing
-    pending_undo = None
+    redo_stack = UndoHistory()
+
+    # How long the text has to stay the same before it's added to the undo stack
+    debounce = "500ms"
 
-    # timer handle
+    # Handle for the one-shot debounce timer
     timer_handle = None
 
     @classmethod
     def start_logger(cls, reset_undo_stack: bool):
         if reset_undo_stack:
-            cls.undo_stack = []
-            cls.redo_stack = []
+            cls.undo_stack.clear()
+            cls.redo_stack.clear()
+
+        max_entries = settings.get("user.draft_window_undo_max_steps")
+        max_chars = settings.get("user.draft_window_undo_max_kb") * 1024
+        for stack in (cls.undo_stack, cls.redo_stack):
+            stack.max_entries = max_entries
+            stack.max_chars = max_chars
 
         cls.stop_logger()
-        cls.timer_handle = cron.interval("500ms", cls._log_changes)
+        # Record the starting state straight away, then wait to be told about
+        # changes rather than polling.
+        cls._log_changes()
+        get_draft_manager().add_change_listener(cls._on_change)
 
     @classmethod
     def stop_logger(cls):
+        get_draft_manager().remove_change_listener(cls._on_change)
         if cls.timer_handle is not None:
             cron.cancel(cls.timer_handle)
+            # Don't lose the last change just because it hadn't settled yet
+            cls._log_changes()
         cls.timer_handle = None
-        cls.pending_undo = None
 
     @classmethod
+    def log_now(cls):
+        """Record the current state straight away, without waiting for it to settle."""
+        if cls.timer_handle is not None:
+            cron.cancel(cls.timer_handle)
+        cls._log_changes()
+
+    @classmethod
+    @timings.timed("undo")
     def perform_undo(cls):
         if len(cls.undo_stack) == 0:
             return
 
-        curr_text = draft_manager.area.value
-        curr_sel = (draft_manager.area.sel.left, draft_manager.area.sel.right)
-        text, sel = cls.undo_stack[-1]
+        draft_manager = get_draft_manager()
+        curr_text = draft_manager.get_text()
+        curr_sel = draft_manager.get_selection()
+        text, sel = cls.undo_stack.peek()
         if text == curr_text:
             cls.undo_stack.pop()
             if len(cls.undo_stack) == 0:
@@ -155,75 +466,204 @@ class UndoWorkaround:
             # top of the stack will have the same contents as the text area. In
             # this case pop again to get a bit lower. We should never have the
             # same text twice, hence we don't need a loop.
-            text, sel = cls.undo_stack[-1]
+            text, sel = cls.undo_stack.peek()
 
         # Remember the current state in the redo stack
-        cls.redo_stack.append((curr_text, curr_sel))
-        draft_manager.area.value = text
-        draft_manager.area.sel = sel
-
-        cls.pending_undo = (text, sel)
+        cls.redo_stack.push(curr_text, curr_sel)
+        draft_manager.set_text(text, sel)
 
     @classmethod
+    @timings.timed("redo")
     def perform_redo(cls):
         if len(cls.redo_stack) == 0:
             return
 
         text, sel = cls.redo_stack.pop()
+        get_draft_manager().set_text(text, sel)
 
-        draft_manager.area.value = text
-        draft_manager.area.sel = sel
+        cls.undo_stack.push(text, sel)
 
-        cls.pending_undo = (text, sel)
-        cls.undo_stack.append((text, sel))
+    @classmethod
+    def _on_change(cls):
+        """Called by the draft manager whenever the text or selection changes."""
+        # Restart the debounce timer, so the state is only logged once the text
+        # has settled.
+        if cls.timer_handle is not None:
+            cron.cancel(cls.timer_handle)
+        cls.timer_handle = cron.after(cls.debounce, cls._log_changes)
 
     @classmethod
+    @timings.timed("undo_log")
     def _log_changes(cls):
         """
-        If the text and cursor position hasn't changed for two interval iterations
-        (1s) and the undo stack doesn't match the current state, then add to the stack.
+        Called once the text and cursor position have stopped changing. If the undo
+        stack doesn't match the current text, add the current state to it.
         """
+        cls.timer_handle = None
 
-        curr_val = draft_manager.area.value
-        # Turn the Span into a tuple, because we can't == Spans
-        curr_sel = (draft_manager.area.sel.left, draft_manager.area.sel.right)
-        curr_state = (curr_val, curr_sel)
-
-        state_stack_mismatch = (
-            len(cls.undo_stack) == 0
-            or
-            # Only want to update the undo stack if the value has changed, not just
-            # the selection
-            curr_state[0] != cls.undo_stack[-1][0]
-        )
-
-        if cls.pending_undo == curr_state and state_stack_mismatch:
-            cls.undo_stack.append(curr_state)
+        # Changes to the whole text and where the selection is in it, even if it's
+        # paged, so the history isn't lost when the page moves
+        draft_manager = get_draft_manager()
+        edit = draft_manager.take_document_edit()
+        curr_sel = draft_manager.get_selection()
+
+        if edit is not None and len(cls.undo_stack) > 0:
+            # Paged, so only look at the part of the document that changed rather
+            # than joining the whole of it up
+            start, old_end, new_end = edit
+            replacement = draft_manager.document.slice(start, new_end)
+            changed = cls.undo_stack.push_edit(start, old_end, replacement, curr_sel)
+            Autosave.record_edit(start, old_end, replacement, draft_manager.get_text)
+        else:
+            curr_val = draft_manager.get_text()
+            # Only want to update the undo stack if the value has changed, not
+            # just the selection
+            changed = len(cls.undo_stack) == 0 or curr_val != cls.undo_stack.peek()[0]
+            if changed:
+                cls.undo_stack.push(curr_val, curr_sel)
+            # The journal skips the text if it's unchanged, e.g. after an undo,
+            # and only writes what changed otherwise
+            Autosave.record(curr_val)
+
+        if changed:
             # Clear out the redo stack because we've changed the text
-            cls.redo_stack = []
-        elif cls.pending_undo != curr_state:
-            cls.pending_undo = curr_state
-        elif not state_stack_mismatch and len(cls.undo_stack) > 0:
-            # Remember the cursor position in the undo stack for the current text value
-            cls.undo_stack[-1] = (cls.undo_stack[-1][0], curr_sel)
+            cls.redo_stack.clear()
         else:
-            # The text area text is not changing, do nothing
-            pass
+            # Remember the cursor position in the undo stack for the current text value
+            cls.undo_stack.set_top_selection(curr_sel)
+
+
+class Paging:
+    """
+    Moves the page shown in the draft window along as the caret nears its edge,
+    for large documents (see DraftManager.large_document_chars).
+    """
+
+    # How long the caret has to stay put before the page is moved
+    delay = "100ms"
+
+    # Handle for the one-shot delay timer
+    timer_handle = None
+
+    @classmethod
+    def _on_change(cls):
+        if get_draft_manager().document is None:
+            return
+        if cls.timer_handle is not None:
+            cron.cancel(cls.timer_handle)
+        cls.timer_handle = cron.after(cls.delay, cls._update_page)
+
+    @classmethod
+    def _update_page(cls):
+        cls.timer_handle = None
+        get_draft_manager().update_page()
+
+    @classmethod
+    def start(cls):
+        get_draft_manager().add_change_listener(cls._on_change)
+
+    @classmethod
+    def stop(cls):
+        get_draft_manager().remove_change_listener(cls._on_change)
+        if cls.timer_handle is not None:
+            cron.cancel(cls.timer_handle)
+        cls.timer_handle = None
+
+
+class DraftBuffers:
+    """
+    Swaps named buffers in and out of the draft window. Each has its own text,
+    selection and undo history.
+    """
+
+    store = None
+    # The name of the buffer currently in the window
+    current = "default"
+
+    @classmethod
+    def get_store(cls):
+        if cls.store is None:
+            directory = os.path.join(
+                str(actions.path.talon_home()), "draft_window", "buffers"
+            )
+            cls.store = BufferStore(directory)
+        cls.store.max_resident = settings.get("user.draft_window_buffers_in_memory")
+        return cls.store
+
+    @classmethod
+    def switch(cls, name: str):
+        """Put the current draft away and show the buffer called `name` instead."""
+        store = cls.get_store()
+        if buffer_key(name) == cls.current:
+            return
+
+        # Make sure the undo history is up to date before it's put away
+        UndoWorkaround.stop_logger()
+        draft_manager = get_draft_manager()
+        store.put(
+            DraftBuffer(
+                cls.current,
+                draft_manager.get_text(),
+                draft_manager.get_selection(),
+                UndoWorkaround.undo_stack,
+                UndoWorkaround.redo_stack,
+            )
+        )
+
+        buffer = store.get(name)
+        cls.current = buffer.name
+        store.write_current(cls.current)
+        UndoWorkaround.undo_stack = buffer.undo_stack
+        UndoWorkaround.redo_stack = buffer.redo_stack
+        draft_manager.set_text(buffer.text, buffer.sel)
+        UndoWorkaround.start_logger(False)
+
+    @classmethod
+    def save(cls):
+        """Save every buffer to disk, including the one in the window."""
+        if cls.store is None:
+            # Never switched buffers, so the journal has everything
+            return
+        draft_manager = get_draft_manager()
+        cls.store.put(
+            DraftBuffer(
+                cls.current,
+                draft_manager.get_text(),
+                draft_manager.get_selection(),
+                UndoWorkaround.undo_stack,
+                UndoWorkaround.redo_stack,
+            )
+        )
+        cls.store.save_all()
+        cls.store.write_current(cls.current)
 
 
 if UndoWorkaround.enable_workaround:
-    ctx_focused.action("edit.undo")(UndoWorkaround.perform_undo)
-    ctx_focused.action("edit.redo")(UndoWorkaround.perform_redo)
+    ctx_focused.action("edit.undo")(
+        Tracing.traced("edit.undo", UndoWorkaround.perform_undo)
+    )
+    ctx_focused.action("edit.redo")(
+        Tracing.traced("edit.redo", UndoWorkaround.perform_redo)
+    )
 
 
 @mod.action_class
+@Tracing.trace_actions("user")
 class Actions:
     def draft_show(text: Optional[str] = None):
         """Show draft window"""
+        draft_manager = get_draft_manager()
+        if text is None and draft_manager.area.value == "":
+            text = Autosave.recover()
+            if text is not None:
+                # It goes back in the buffer it was written in
+                DraftBuffers.current = DraftBuffers.get_store().read_current()
+
         # Toggle to gain focus
         draft_manager.hide()
         draft_manager.show(text)
         UndoWorkaround.start_logger(text is not None)
+        Paging.start()
         ctx.tags = ["user.draft_window_showing"]
 
         # Set the default draft window size
@@ -245,13 +685,29 @@ class Actions:
 
     def draft_hide():
         """Hide draft window"""
+        draft_manager = get_draft_manager()
         draft_manager.hide()
         UndoWorkaround.stop_logger()
+        Paging.stop()
+        DraftBuffers.save()
         ctx.tags = []
 
+    def draft_buffer(name: str):
+        """Show the draft window with the named buffer in it"""
+        actions.self.draft_show()
+        DraftBuffers.switch(name)
+
+    def draft_buffer_list() -> str:
+        """Show (and return) the names of the draft buffers"""
+        names = set(DraftBuffers.get_store().names())
+        names.add(DraftBuffers.current)
+        listing = ", ".join(sorted(names))
+        actions.app.notify(listing, "Draft buffers")
+        return listing
+
     def draft_clear():
         """Delete all text in draft window."""
-        draft_manager.area.value = ""
+        get_draft_manager().set_text("")
 
     def draft_cancel():
         """Delete all text in the draft window, and hide it."""
@@ -265,28 +721,86 @@ class Actions:
         include_trailing_whitespace: int = 0,
     ):
         """Selects text in the draft window"""
-        draft_manager.select_text(
+        get_draft_manager().select_text(
             start_anchor,
             end_anchor=None if end_anchor == "" else end_anchor,
             include_leading_whitespace=include_leading_whitespace == 1,
             include_trailing_whitespace=include_trailing_whitespace == 1,
         )
 
+    def draft_delete(anchors: str):
+        """Deletes words or ranges of words in the draft window"""
+        actions.self.draft_replace(anchors, "")
+
+    def draft_replace(anchors: str, text: str):
+        """
+        Replaces words or ranges of words in the draft window with `text`.
+        `anchors` is formatted like user.draft_anchor_spans. This is a single undo
+        step.
+        """
+        edits = [
+            (start_anchor, end_anchor, text)
+            for start_anchor, end_anchor in get_draft_manager().anchor_spans(anchors)
+        ]
+        # Keep any earlier typing as its own undo step, then log this one
+        UndoWorkaround.log_now()
+        get_draft_manager().apply_edits(edits)
+        UndoWorkaround.log_now()
+
     def draft_position_caret(anchor: str, after: int = 0):
         """Positions the caret in the draft window"""
-        draft_manager.position_caret(anchor, after=after == 1)
+        get_draft_manager().position_caret(anchor, after=after == 1)
+
+    def draft_jump(word: str, direction: str = "nearest"):
+        """
+        Moves the caret to an occurrence of `word` in the draft window. `direction`
+        is nearest, next or previous.
+        """
+        get_draft_manager().jump_to_word(word, direction)
+
+    def draft_go_line(line: int):
+        """Moves the caret to the start of a line (from 1) in the draft window"""
+        get_draft_manager().go_to_line(line)
+
+    def draft_line_edge(end: int = 1):
+        """Moves the caret to the end of its line in the draft window, or the start"""
+        get_draft_manager().move_to_line_edge(end=end == 1)
+
+    def draft_select_line(line: int = 0):
+        """Selects a line (from 1) in the draft window, 0 for the current one"""
+        get_draft_manager().select_line(line if line > 0 else None)
+
+    def draft_select_paragraph():
+        """Selects the paragraph the caret's in, in the draft window"""
+        get_draft_manager().select_paragraph()
+
+    def draft_replace_word(word: str, text: str):
+        """Replaces every occurrence of `word` in the draft window with `text`"""
+        UndoWorkaround.log_now()
+        get_draft_manager().replace_word(word, text)
+        UndoWorkaround.log_now()
 
     def draft_change_case(anchor: str, case: str):
-        """Positions the caret in the draft window"""
-        draft_manager.change_case(anchor, case)
+        """
+        Changes the case of a word or range of words in the draft window. `anchor`
+        is formatted like user.draft_anchor_span, `case` is one of
+        user.draft_case.
+        """
+        spans = get_draft_manager().anchor_spans(anchor)
+        if len(spans) != 1:
+            raise RuntimeError(f"Couldn't find anchor {anchor}")
+        ((start_anchor, end_anchor),) = spans
+        UndoWorkaround.log_now()
+        get_draft_manager().change_case(start_anchor, case, end_anchor)
+        UndoWorkaround.log_now()
 
     def draft_get_text() -> str:
         """Returns the text in the draft window"""
-        return draft_manager.get_text()
+        return get_draft_manager().get_text()
 
     def draft_resize(width: int, height: int):
         """Resize the draft window."""
-        draft_manager.reposition(width=width, height=height)
+        get_draft_manager().reposition(width=width, height=height)
 
     def draft_named_move(name: str, screen_number: Optional[int] = None):
         """Move the draft window to a named position on screen.
@@ -295,7 +809,7 @@ class Actions:
 
         """
         screen = ui.screens()[screen_number or 0]
-        window_rect = draft_manager.get_rect()
+        window_rect = get_draft_manager().get_rect()
         xpos = (screen.width - window_rect.width) / 2
         ypos = (screen.height - window_rect.height) / 2
 
@@ -314,11 +828,21 @@ class Actions:
         # Adjust for the fact that the screen may not be at 0,0.
         xpos += screen.x
         ypos += screen.y
-        draft_manager.reposition(xpos=xpos, ypos=ypos)
+        get_draft_manager().reposition(xpos=xpos, ypos=ypos)
 
     def draft_finish():
         """Finish drafting and transfer the text to the target program."""
 
+    def draft_timing_report() -> str:
+        """Log (and return) timing stats for draft window operations"""
+        report = timings.report()
+        logging.info("Draft window timings:\n%s", report)
+        return report
+
+    def draft_timing_reset():
+        """Forget the timings recorded for draft window operations"""
+        timings.reset()
+
     def draft_finish_and_submit():
         """Finish drafting, transfer the text to the target and press enter."""
 
@@ -329,6 +853,24 @@ def draft_anchor(m) -> str:
     return "".join(str(m))
 
 
+@mod.capture(rule="<self.draft_anchor> [to <self.draft_anchor>]")
+def draft_anchor_span(m) -> str:
+    """A single anchor, or a range of anchors, e.g. 'a to d'"""
+    return " to ".join(m.draft_anchor_list)
+
+
+@mod.capture(rule="<self.draft_anchor_span> ([and] <self.draft_anchor_span>)*")
+def draft_anchor_spans(m) -> str:
+    """Several anchors or ranges, e.g. 'a c to d and f'"""
+    return " and ".join(m.draft_anchor_span_list)
+
+
+@mod.capture(rule="(title | lower | upper | camel | snake | kebab)")
+def draft_case(m) -> str:
+    """One of the cases draft_change_case can change words to"""
+    return str(m)
+
+
 @mod.capture(rule="(top | bottom | left | right | middle)")
 def draft_window_position(m) -> str:
     """One of the named positions you can move the window to"""
@@ -343,12 +885,13 @@ tag: user.draft_window_showing
 
 
 @draft_window_context.action_class("user")
+@Tracing.trace_actions("user")
 class DraftWindowActions:
     def surrounding_text() -> Optional[SurroundingText]:
 
         CONTEXT_LIMIT = 1000
 
-        area = draft_manager.area
+        area = get_draft_manager().area
         # Unlike e.g. Emacs, selection would be erased - so give context around
         # selection.
         return SurroundingText(
@@ -357,10 +900,11 @@ class DraftWindowActions:
         )
 
     def draft_finish():
-        content = actions.self.draft_get_text()
-        actions.clip.set_text(content)
-        actions.self.draft_hide()
-        actions.edit.paste()
+        with timings.measure("draft_finish"):
+            content = actions.self.draft_get_text()
+            actions.clip.set_text(content)
+            actions.self.draft_hide()
+            actions.edit.paste()
 
     def draft_finish_and_submit():
         actions.self.draft_finish
@@ -0,0 +1,121 @@
+"""Lightweight timing of draft window operations, with rolling percentiles."""
+
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+import math
+import threading
+import time
+
+_NOT_TIMING = nullcontext()
+
+
+class OperationTimings:
+    """
+    Keeps the most recent `window` durations of each named operation.
+
+    Timing is off by default. While it's off `measure()` hands back a shared
+    do-nothing context manager and `timed()` functions call straight through, so
+    instrumented code pays for an attribute lookup and little else.
+
+    Durations may be recorded from any thread, e.g. the label worker's.
+    """
+
+    def __init__(self, window=500):
+        self.enabled = False
+        self.window = window
+        self._samples = {}
+        # Held while reading or changing `_samples`
+        self._lock = threading.Lock()
+
+    def measure(self, name):
+        """Context manager that times its body as an occurrence of `name`."""
+        if not self.enabled:
+            return _NOT_TIMING
+        return self._measure(name)
+
+    def timed(self, name):
+        """Decorator that times every call of the function as `name`."""
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self._measure(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @contextmanager
+    def _measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        """Record a duration for `name` that was measured some other way."""
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+
+    def stats(self, name):
+        """
+        Summary of the recent durations of `name`, in seconds: a dict of count,
+        p50, p90, p99 and max. None if nothing has been recorded.
+        """
+        with self._lock:
+            samples = self._samples.get(name)
+            if not samples:
+                return None
+            ordered = sorted(samples)
+
+        def percentile(p):
+            # Nearest-rank
+            return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+        return {
+            "count": len(ordered),
+            "p50": percentile(50),
+            "p90": percentile(90),
+            "p99": percentile(99),
+            "max": ordered[-1],
+        }
+
+    def report(self):
+        """A plain text table of the stats for every operation, in milliseconds."""
+        with self._lock:
+            names = sorted(self._samples)
+        if not names:
+            state = "on" if self.enabled else "off"
+            return f"No draft window timings recorded (timing is {state})"
+
+        lines = [
+            f"{'operation':<20} {'count':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+        ]
+        for name in names:
+            stats = self.stats(name)
+            lines.append(
+                f"{name:<20} {stats['count']:>6}"
+                + "".join(
+                    f" {stats[key] * 1000:>8.2f}"
+                    for key in ("p50", "p90", "p99", "max")
+                )
+            )
+        return "\n".join(lines)
+
+
+# Shared by everything in the draft window
+timings = OperationTimings()
@@ -0,0 +1,84 @@
+"""Recording draft window sessions, to replay them with replay_draft_trace.py."""
+
+import json
+import os
+import time
+
+from .draft_index import text_difference
+
+
+class TraceRecorder:
+    """
+    Writes a trace of a draft window session to `path`.
+
+    Each line of the file is JSON, with `t`, the seconds since recording started,
+    and one of:
+
+    - `{"text": ..., "sel": [left, right]}`, the whole text and selection
+    - `{"edit": [start, end, replacement], "sel": [left, right]}`, a change to the
+      text (and the new selection), from dictation, or from the action before it
+      if `result` is true
+    - `{"action": name, "args": [...], "ms": ...}`, an action that was run, and
+      how long it took. Keyword arguments, if any, are in `kwargs`
+
+    The text is only written out in full at the start, after that only what
+    changed is.
+    """
+
+    def __init__(self, path, clock=time.perf_counter):
+        self.path = path
+        self.clock = clock
+        self._start = clock()
+        # The text and selection as of the last record_state() call
+        self._text = None
+        self._sel = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record_state(self, text, sel, result=False):
+        """
+        Note the current text and selection, if either has changed. `result` says
+        the change was made by the action just recorded.
+        """
+        sel = list(sel)
+        if text == self._text and sel == self._sel:
+            return
+        if self._text is None:
+            entry = {"text": text, "sel": sel}
+        else:
+            start, old_end, new_end = text_difference(self._text, text)
+            entry = {"edit": [start, old_end, text[start:new_end]], "sel": sel}
+        if result:
+            entry["result"] = True
+        self._write(entry)
+        self._text = text
+        self._sel = sel
+
+    def record_action(self, name, args, kwargs, seconds):
+        entry = {"action": name, "args": list(args)}
+        if kwargs:
+            entry["kwargs"] = kwargs
+        entry["ms"] = round(seconds * 1000, 3)
+        self._write(entry)
+
+    def close(self):
+        self._file.close()
+
+    def _write(self, entry):
+        entry["t"] = round(self.clock() - self._start, 6)
+        self._file.write(json.dumps(entry) + "\n")
+        # Flush, so the trace is there to look at if Talon goes down
+        self._file.flush()
+
+
+def read_trace(path):
+    """The entries of the trace at `path`, in order."""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # A line cut short as Talon exited. Nothing can follow it.
+                break
+    return entries
@@ -1,6 +1,10 @@
 from typing import Optional
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import logging
 import re
-import math
+import threading
+import time
 
 from talon.experimental.textarea import (
     TextArea,
@@ -8,8 +12,23 @@ from talon.experimental.textarea import (
     DarkThemeLabels,
     LightThemeLabels,
 )
-from talon import ui, actions
+from talon import cron, ui
 
+from .draft_document import PieceTable
+from .draft_index import (
+    TOKENIZERS,
+    LineIndex,
+    WordOffsetIndex,
+    WordSpanIndex,
+    numpy_word_spans,
+    text_difference,
+    use_numpy_spans,
+    token_matcher,
+    word_bounds,
+    word_matcher,
+)
+from .draft_timing import timings
+from .draft_worker import LatestWorker
 
 DRAFT_WINDOW_TITLE = "Talon Draft"
 LABEL_CHARS = (
@@ -20,17 +39,29 @@ LABEL_CHARS = (
     # Multi-syllable symbols last, so they're rarer.
     "=,$<>%^&@~;"
 )
+# Two letter labels, enough to label every word on screen. "to" is left out
+# because it's the connector word.
+TWO_CHARACTER_LABELS = tuple(
+    first + second
+    for first in "abcdefghijklmnopqrstuvwxyz"
+    for second in "abcdefghijklmnopqrstuvwxyz"
+    if first + second != "to"
+)
 
 
-# TODO: \s probably wrong? Should be [ \t]?
-word_matcher = re.compile(r"([^\s]+)(\s*)")
-
-
-def calculate_text_anchors(text, cursor_position, anchor_labels=LABEL_CHARS):
+def calculate_text_anchors(
+    text,
+    cursor_position,
+    anchor_labels=LABEL_CHARS,
+    tokenizer=word_matcher,
+    window_start=None,
+    margin=0,
+):
     """
-    Produces an iterator of (anchor, start_word_index, end_word_index, last_space_index)
-    tuples from the given text. Each tuple indicates a particular point you may want to
-    reference when editing along with some useful ranges you may want to operate on.
+    Produces an iterator of (anchor, start_word_index, end_word_index,
+    first_space_index, last_space_index) tuples from the given text. Each tuple
+    indicates a particular point you may want to reference when editing along with
+    some useful ranges you may want to operate on.
 
     - text is the text you want to process.
     - cursor_position is the current position of the cursor, anchors will be placed around
@@ -39,42 +70,452 @@ def calculate_text_anchors(text, cursor_position, anchor_labels=LABEL_CHARS):
     - *index is just a character offset from the start of the string (e.g. the first character is at index 0)
     - end_word_index is the index of the character after the last one included in the
       anchor. That is, you can use it with a slice directly like [start:end]
+    - first_space_index is the start of the whitespace before the word (on the same
+      line), last_space_index the end of the whitespace after it.
     - anchor is a short piece of text you can use to identify it (e.g. 'a', or '1').
+    - tokenizer is how the text is split into words, one of TOKENIZERS.
+    - window_start is where the first anchored word started last time, if the
+      anchors should stay where they were while the cursor is more than `margin`
+      words inside them. See `_anchors_from_spans`.
+
+    The text is scanned once. Leading whitespace is only worked out for the words
+    that get an anchor, by walking back from the word, so the cost doesn't depend
+    on how far into the text the anchors are. Long texts are split into words with
+    numpy, if it's installed (see `numpy_word_spans`).
     """
     if len(text) == 0:
         return []
 
+    if use_numpy_spans(text, tokenizer):
+        return _numpy_text_anchors(
+            text, cursor_position, anchor_labels, window_start, margin
+        )
+
     # Find all the word spans
-    matches = []
+    starts = []
+    ends = []
+    whitespace_ends = []
     cursor_idx = 0
-    for match in word_matcher.finditer(text):
-        matches.append(
-            (
-                # Words start
-                match.start(),
-                # Words end
-                match.end() - len(match.group(2)),
-                # After trailing whitespace
-                match.end(),
-            )
+    for match in tokenizer.finditer(text):
+        word_start = match.start()
+        whitespace_end = match.end()
+        starts.append(word_start)
+        ends.append(match.end(1))
+        whitespace_ends.append(whitespace_end)
+        if word_start <= cursor_position and whitespace_end >= cursor_position:
+            cursor_idx = len(starts) - 1
+
+    return _anchors_from_spans(
+        text,
+        starts,
+        ends,
+        whitespace_ends,
+        cursor_idx,
+        anchor_labels,
+        window_start,
+        margin,
+    )
+
+
+def _numpy_text_anchors(text, cursor_position, anchor_labels, window_start, margin):
+    starts, ends, whitespace_ends = numpy_word_spans(text)
+    if len(starts) == 0:
+        return []
+    # The last word starting at or before the cursor, as in the regex version
+    cursor_idx = max(0, int(starts.searchsorted(cursor_position, "right")) - 1)
+    # Only the words within reach of the anchors are needed as Python ints
+    first = max(0, cursor_idx - len(anchor_labels))
+    last = min(len(starts), cursor_idx + len(anchor_labels) + 1)
+    return _anchors_from_spans(
+        text,
+        starts[first:last].tolist(),
+        ends[first:last].tolist(),
+        whitespace_ends[first:last].tolist(),
+        cursor_idx - first,
+        anchor_labels,
+        window_start,
+        margin,
+    )
+
+
+def index_text_anchors(
+    index, cursor_position, anchor_labels=LABEL_CHARS, window_start=None, margin=0
+):
+    """
+    Equivalent to `calculate_text_anchors(index.text, ...)`, but reads the word
+    spans from a `WordSpanIndex` rather than tokenising the whole text again.
+    """
+    cursor_idx = index.word_at(cursor_position)
+    if cursor_idx is None:
+        cursor_idx = 0
+
+    return _anchors_from_spans(
+        index.text,
+        index.starts,
+        index.ends,
+        index.whitespace_ends,
+        cursor_idx,
+        anchor_labels,
+        window_start,
+        margin,
+    )
+
+
+def calculate_range_anchors(
+    text,
+    range_start,
+    range_end,
+    cursor_position,
+    anchor_labels=LABEL_CHARS,
+    tokenizer=word_matcher,
+    window_start=None,
+    margin=0,
+):
+    """
+    Like `calculate_text_anchors`, but only labels the words that start inside
+    `text[range_start:range_end]`, e.g. the part of the draft that's on screen.
+
+    Only that range is tokenised, so the cost depends on the size of the range,
+    not the text. Indexes are still relative to the start of the whole text, and
+    the spans are the same ones `calculate_text_anchors` would find. If the
+    cursor is outside the range, anchors start from the nearest edge.
+    """
+    if range_start > 0 and not text[range_start - 1].isspace():
+        # Don't label the tail of a word that started before the range
+        match = tokenizer.match(text, range_start - 1)
+        range_start = match.end() if match else range_start
+
+    starts = []
+    ends = []
+    whitespace_ends = []
+    cursor_idx = 0
+    for match in tokenizer.finditer(text, range_start, range_end):
+        if match.end() == range_end and range_end < len(text):
+            # The range may have cut the word or its whitespace short
+            match = tokenizer.match(text, match.start())
+        word_start = match.start()
+        whitespace_end = match.end()
+        starts.append(word_start)
+        ends.append(match.end(1))
+        whitespace_ends.append(whitespace_end)
+        if word_start <= cursor_position and whitespace_end >= cursor_position:
+            cursor_idx = len(starts) - 1
+
+    if starts and cursor_position > whitespace_ends[-1]:
+        cursor_idx = len(starts) - 1
+
+    return _anchors_from_spans(
+        text,
+        starts,
+        ends,
+        whitespace_ends,
+        cursor_idx,
+        anchor_labels,
+        window_start,
+        margin,
+    )
+
+
+def ordinal_text_anchors(
+    index,
+    visible_range,
+    cursor_position,
+    anchor_labels=TWO_CHARACTER_LABELS,
+    keep=None,
+):
+    """
+    Like `index_text_anchors`, but labels every word that starts in
+    `visible_range` (or every word, if it's None), up to one of each label,
+    centred on the cursor if there are more.
+
+    `keep` maps the starts of words to the labels they had before, see
+    `carry_labels`. Those words keep their labels, so labels stay put across
+    edits. Other words get label number i % len(anchor_labels) for word number i,
+    or the first label not in use if that one's taken.
+    """
+    starts = index.starts
+    if visible_range is None:
+        first, last = 0, len(starts)
+    else:
+        first = bisect_left(starts, visible_range[0])
+        last = bisect_left(starts, visible_range[1], first)
+
+    label_count = len(anchor_labels)
+    if last - first > label_count:
+        cursor_idx = index.word_at(cursor_position)
+        if cursor_idx is None:
+            cursor_idx = first
+        first = max(first, min(cursor_idx - label_count // 2, last - label_count))
+        last = first + label_count
+
+    word_labels = {}
+    used = set()
+    if keep:
+        for i in range(first, last):
+            label = keep.get(starts[i])
+            if label is not None and label not in used:
+                word_labels[i] = label
+                used.add(label)
+
+    def unused_labels():
+        for label in anchor_labels:
+            if label not in used:
+                yield label
+
+    spare = unused_labels()
+    for i in range(first, last):
+        if i not in word_labels:
+            label = anchor_labels[i % label_count]
+            if label in used:
+                label = next(spare)
+            word_labels[i] = label
+            used.add(label)
+
+    text = index.text
+    ends = index.ends
+    whitespace_ends = index.whitespace_ends
+    return [
+        (
+            word_labels[i],
+            starts[i],
+            ends[i],
+            leading_whitespace_start(text, starts[i]),
+            whitespace_ends[i],
         )
-        if matches[-1][0] <= cursor_position and matches[-1][2] >= cursor_position:
-            cursor_idx = len(matches) - 1
+        for i in range(first, last)
+    ]
+
+
+def carry_labels(old_text, new_text, labels):
+    """
+    The labels to keep after `old_text` is edited into `new_text`, for
+    `ordinal_text_anchors`: a dict from where each labelled word starts in
+    `new_text` to its label. `labels` is (Span, label) for each word labelled in
+    `old_text`. Words the edit touched lose their labels.
+    """
+    start, old_end, new_end = text_difference(old_text, new_text)
+    shift = new_end - old_end
+    carried = {}
+    for span, label in labels:
+        if span.right <= start:
+            carried[span.left] = label
+        elif span.left >= old_end:
+            carried[span.left + shift] = label
+    return carried
+
+
+def normalise_anchor(anchor):
+    """The label meant by an anchor as spoken, e.g. "a b" for "ab"."""
+    return "".join(anchor.split())
+
+
+def parse_anchor_spans(spec, label_length=1):
+    """
+    Turns anchors as spoken, e.g. "a to c and f", into a list of (start_anchor,
+    end_anchor) pairs, where end_anchor is None for a single word.
+
+    Since labels are all `label_length` characters long, anchors that run
+    together are split up, so "ac to f" is the same as "a and c to f".
+    """
 
+    def split(labels):
+        labels = normalise_anchor(labels)
+        return [
+            labels[i : i + label_length] for i in range(0, len(labels), label_length)
+        ]
+
+    spans = []
+    for span in spec.split(" and "):
+        start, _, end = span.partition(" to ")
+        start_labels = split(start)
+        spans.extend((label, None) for label in start_labels[:-1])
+        if end:
+            end_labels = split(end)
+            spans.append((start_labels[-1], end_labels[0]))
+            spans.extend((label, None) for label in end_labels[1:])
+        elif start_labels:
+            spans.append((start_labels[-1], None))
+    return spans
+
+
+def locate_visible_text(text, visible_text, cursor_position):
+    """
+    Find where `visible_text` sits in `text`, preferring the occurrence around
+    the cursor. Returns the start index, or None if it isn't there.
+    """
+    length = len(visible_text)
+    # The visible text almost always contains the cursor, so look there first
+    # rather than searching the whole document.
+    start = text.find(
+        visible_text,
+        max(0, cursor_position - length),
+        cursor_position + 2 * length,
+    )
+    if start < 0:
+        start = text.find(visible_text)
+    return start if start >= 0 else None
+
+
+def leading_whitespace_start(text, word_start):
+    """
+    Find where the whitespace before `word_start` begins, without leaving the line.
+
+    Equivalent to `re.search("[ \\t]*$", text[:word_start]).start()`, but walks
+    backwards instead of copying and rescanning the prefix. Since `$` also matches
+    before a trailing newline, a newline directly before the word counts.
+    """
+    i = word_start
+    if i > 0 and text[i - 1] == "\n":
+        i -= 1
+    while i > 0 and text[i - 1] in " \t":
+        i -= 1
+    return i
+
+
+def _anchors_from_spans(
+    text,
+    starts,
+    ends,
+    whitespace_ends,
+    cursor_idx,
+    anchor_labels,
+    window_start=None,
+    margin=0,
+):
     # Now work out what range of those matches are getting an anchor. The aim is
     # to centre the anchors around the cursor position, but also to use all the
     # anchors.
-    anchors_before_cursor = len(anchor_labels) // 2
-    anchor_start_idx = max(0, cursor_idx - anchors_before_cursor)
-    anchor_end_idx = min(len(matches), anchor_start_idx + len(anchor_labels))
+    anchor_start_idx = None
+    if window_start is not None:
+        # Keep the anchors where they were, so the labels don't all move, unless
+        # the cursor has got within `margin` words of their edge.
+        held_idx = bisect_left(starts, window_start)
+        held_idx = max(0, min(held_idx, len(starts) - len(anchor_labels)))
+        if held_idx + margin <= cursor_idx < held_idx + len(anchor_labels) - margin:
+            anchor_start_idx = held_idx
+    if anchor_start_idx is None:
+        anchors_before_cursor = len(anchor_labels) // 2
+        anchor_start_idx = max(0, cursor_idx - anchors_before_cursor)
+    anchor_end_idx = min(len(starts), anchor_start_idx + len(anchor_labels))
     anchor_start_idx = max(0, anchor_end_idx - len(anchor_labels))
 
     # Now add anchors to the selected matches
-    for i, anchor in zip(range(anchor_start_idx, anchor_end_idx), anchor_labels):
-        word_start, word_end, whitespace_end = matches[i]
-        # Leading whitespace
-        whitespace_start = re.search("[ \t]*$", text[:word_start]).start()
-        yield (anchor, word_start, word_end, whitespace_start, whitespace_end)
+    return [
+        (
+            anchor,
+            starts[i],
+            ends[i],
+            leading_whitespace_start(text, starts[i]),
+            whitespace_ends[i],
+        )
+        for i, anchor in zip(range(anchor_start_idx, anchor_end_idx), anchor_labels)
+    ]
+
+
+def edit_text_spans(text, edits):
+    """
+    Apply several edits to `text` at once, returning (new_text, caret) where caret
+    is just after the last edit.
+
+    Each edit is (start_index, end_index, first_space_index, last_space_index,
+    replacement), with indices into the original text. Deletions (an empty
+    replacement) take some surrounding whitespace with them the way deleting a
+    single word does, and deletions of neighbouring words are merged so they
+    don't leave stray spaces. Other edits mustn't overlap.
+    """
+    groups = []
+    for start, end, first_space, last_space, replacement in sorted(edits):
+        if groups:
+            previous = groups[-1]
+            if replacement == "" and previous[4] == "" and start <= previous[3]:
+                # Nothing but whitespace between this deletion and the last one
+                if end > previous[1]:
+                    previous[1] = end
+                    previous[3] = last_space
+                continue
+            if start < previous[1]:
+                raise RuntimeError("Can't make overlapping edits")
+        groups.append([start, end, first_space, last_space, replacement])
+
+    pieces = []
+    last_end = 0
+    caret = 0
+    for start, end, first_space, last_space, replacement in groups:
+        if replacement == "":
+            # HACK: As in select_text, only take trailing whitespace when there's
+            #   no leading whitespace.
+            if first_space < start:
+                start = first_space
+            else:
+                end = last_space
+        pieces.append(text[last_end:start])
+        pieces.append(replacement)
+        caret += start - last_end + len(replacement)
+        last_end = end
+    pieces.append(text[last_end:])
+    return "".join(pieces), caret
+
+
+# Where each whitespace separated word starts, for title case
+_word_start_matcher = re.compile(r"(?<!\S)\S")
+# The words to join up for camel, snake and kebab case, ignoring punctuation
+_identifier_word_matcher = re.compile(r"[^\W_]+")
+
+
+def _title_case(text):
+    # Unlike str.title(), leaves the rest of each word (e.g. "iPhone") alone
+    return _word_start_matcher.sub(lambda m: m.group().upper(), text)
+
+
+def _camel_case(text):
+    words = _identifier_word_matcher.findall(text)
+    return "".join(
+        [word.lower() if i == 0 else word.capitalize() for i, word in enumerate(words)]
+    )
+
+
+def _join_words(separator):
+    def join(text):
+        return separator.join(_identifier_word_matcher.findall(text)).lower()
+
+    return join
+
+
+# Each case, as a function from the original text to the new text
+CASE_TRANSFORMS = {
+    "title": _title_case,
+    "lower": str.lower,
+    "upper": str.upper,
+    "camel": _camel_case,
+    "snake": _join_words("_"),
+    "kebab": _join_words("-"),
+}
+
+
+# The labels for one state of the draft window. `visible_range` is the (start,
+# end) of the text that was labelled, or None for the whole text. `labels` is
+# what the render callback returns, `ranges` maps each anchor to its
+# (start_index, end_index, first_space_index, last_space_index). `steady_range`
+# is the (start, end) the cursor can move in without the labels changing, or
+# None if they change whenever it moves. `text` is the text that was labelled.
+LabelSnapshot = namedtuple(
+    "LabelSnapshot",
+    [
+        "text_version",
+        "cursor",
+        "visible_range",
+        "labels",
+        "ranges",
+        "steady_range",
+        "text",
+    ],
+)
+
+
+# UI events that may mean the draft window gained or lost focus
+FOCUS_EVENTS = ("win_focus", "app_activate")
+# How often to check focus anyway while waiting for one of those events
+FOCUS_POLL_SECONDS = 0.016
 
 
 def _draft_window_active():
@@ -94,52 +535,306 @@ class DraftManager:
         self.area = TextArea()
         self.area.title = "Talon Draft"
         self.area.value = ""
+        self.word_index = WordSpanIndex()
+        # Built the first time a word is searched for
+        self.word_offsets = None
+        self.line_index = LineIndex()
+        # Incremented whenever the text is seen to change
+        self.text_version = 0
+        self._last_text = ""
+        self.label_snapshot = None
+        # The labels last drawn by the render callback. They're on screen if their
+        # text_version is the current one, otherwise the window is drawn without
+        # labels until the label worker catches up.
+        self.shown_snapshot = None
+        # Texts at least this long are labelled on a background thread, so drawing
+        # never waits for it, when labelling costs more the longer the text is
+        # (see _labels_in_background). 0 labels everything while drawing.
+        self.background_label_chars = 0
+        self.label_worker = LatestWorker("draft labels", self._on_labels_ready)
+        # Held while the word index is in use, as the label worker uses it too
+        self._index_lock = threading.Lock()
+        # Only tokenise and label the text that's on screen. When False, the
+        # whole text is indexed and the anchors are centred on the cursor.
+        self.label_visible_only = True
+        # Label with TWO_CHARACTER_LABELS rather than LABEL_CHARS
+        self.two_character_labels = False
+        # The name of the TOKENIZERS entry that splits the text into words
+        self.tokenizer = "word"
+        # Keep single character labels where they are until the cursor gets this
+        # many words from their edge, rather than centring them on the cursor
+        # every time it moves. 0 always centres them.
+        self.label_margin = 0
+        # The visible text passed to the last render callback
+        self.visible_text = None
+        # Seconds the last show() or hide() spent waiting for focus to move
+        self.last_focus_wait = 0.0
+        # Called with no arguments when the text or selection changes
+        self._change_listeners = []
+        self._last_state = None
+        # Texts longer than this are kept in a piece table, and only a page of
+        # `page_chars` characters around the caret is put in the text area. 0
+        # turns this off.
+        self.large_document_chars = 0
+        self.page_chars = 50000
+        # The full text while paging, otherwise None
+        self.document = None
+        # Where the page in the text area starts in the document, and its text
+        # as it was put there
+        self.page_start = 0
+        self._page_text = ""
+        # The (start, old_end, new_end) of the part of the document changed since
+        # take_document_edit() was last called, () if none of it has, or None if
+        # the whole text was replaced
+        self._document_edit = None
+        # Themes built by set_styling, by the style they were built for
+        self._themes = {}
+        self._style = None
         self.area.register("label", self._update_labels)
         self.set_styling()
 
-    def set_styling(self, theme="dark", text_size=20, label_size=20, label_color=None):
+    def set_styling(
+        self,
+        theme="dark",
+        text_size=20,
+        label_size=20,
+        label_color=None,
+        two_character_labels=False,
+        tokenizer="word",
+    ):
         """Allow settings the style of the draft window. Will dynamically
         update the style based on the passed in parameters.
 
         """
 
-        area_theme = DarkThemeLabels if theme == "dark" else LightThemeLabels
-        theme_changes = {
-            "text_size": text_size,
-            "label_size": label_size,
-        }
-        if label_color is not None:
-            theme_changes["label"] = label_color
-        self.area.theme = area_theme(**theme_changes)
+        self.text_size = text_size
+        if tokenizer not in TOKENIZERS:
+            logging.warning(
+                "Unknown draft window tokenizer %r, using 'word'", tokenizer
+            )
+            tokenizer = "word"
+        labels_changed = False
+        if two_character_labels != self.two_character_labels:
+            self.two_character_labels = two_character_labels
+            labels_changed = True
+        if tokenizer != self.tokenizer:
+            self.tokenizer = tokenizer
+            with self._index_lock:
+                self.word_index = WordSpanIndex(tokenizer=TOKENIZERS[tokenizer])
+            labels_changed = True
+        if labels_changed:
+            # None of the labels worked out so far are right any more
+            self.label_snapshot = None
+            self.shown_snapshot = None
+            self.label_worker.result = None
+
+        style = (theme, text_size, label_size, label_color)
+        if style == self._style:
+            # Assigning the theme redraws the window, so only do it if something
+            # changed. The labels are redrawn with the same theme.
+            if labels_changed:
+                self._redraw()
+            return
+        area_theme = self._themes.get(style)
+        if area_theme is None:
+            theme_class = DarkThemeLabels if theme == "dark" else LightThemeLabels
+            theme_changes = {
+                "text_size": text_size,
+                "label_size": label_size,
+            }
+            if label_color is not None:
+                theme_changes["label"] = label_color
+            area_theme = self._themes[style] = theme_class(**theme_changes)
+        self.area.theme = area_theme
+        self._style = style
 
+    @timings.timed("show")
     def show(self, text: Optional[str] = None):
         """Show the window. If provided, set text to `text`."""
         if text is not None:
-            self.area.value = text
+            self.set_text(text)
         self.area.show()
+        self._wait_for_focus(True)
 
-        # Max wait, 3 seconds
-        for i in range(int(math.ceil(3 / 0.016))):
-            if _draft_window_active():
-                break
-            else:
-                actions.sleep("16ms")
-
+    @timings.timed("hide")
     def hide(self):
         """Hide the window."""
         self.area.hide()
+        self._wait_for_focus(False)
 
-        # Max wait, 3 seconds
-        for i in range(int(math.ceil(3 / 0.016))):
-            if _draft_window_active():
-                actions.sleep("16ms")
-            else:
-                break
+    def _wait_for_focus(self, focused, timeout=3):
+        """
+        Block until the draft window has (or has lost) focus, or `timeout` seconds
+        pass. Woken by window focus events, so it returns as soon as focus moves.
+        The time taken is kept in `last_focus_wait`.
+        """
+        start = time.perf_counter()
+        if _draft_window_active() != focused:
+            focus_changed = threading.Event()
+
+            def on_focus(_window):
+                if _draft_window_active() == focused:
+                    focus_changed.set()
+
+            for event in FOCUS_EVENTS:
+                ui.register(event, on_focus)
+            try:
+                deadline = start + timeout
+                # Check again now we're listening, in case focus already moved.
+                # HACK: Also check every so often, in case the focus event for
+                #   Talon's own window never arrives.
+                while _draft_window_active() != focused:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    focus_changed.wait(min(remaining, FOCUS_POLL_SECONDS))
+            finally:
+                for event in FOCUS_EVENTS:
+                    ui.unregister(event, on_focus)
+        self.last_focus_wait = time.perf_counter() - start
+        timings.record("focus_wait", self.last_focus_wait)
 
     def get_text(self) -> str:
         """Gets the context of the text area"""
+        if self.document is not None:
+            self._sync_page()
+            return self.document.text()
         return self.area.value
 
+    def set_text(self, text: str, selection=None):
+        """
+        Replace the text, with the caret at the start, or selecting `selection`
+        (relative to the whole text) if given. Long enough texts (see
+        `large_document_chars`) are paged.
+        """
+        self._document_edit = None
+        if self.large_document_chars and len(text) > self.large_document_chars:
+            self.document = PieceTable(text)
+            left, right = selection or (0, 0)
+            self._load_page(left, left, right)
+        else:
+            self.document = None
+            self.area.value = text
+            if selection is not None:
+                self.area.sel = Span(*selection)
+
+    def take_document_edit(self):
+        """
+        While paging, the (start, old_end, new_end) of the part of the document
+        that changed since this was last called, such that the document is what
+        it was with `[start:old_end]` replaced by `document.slice(start, new_end)`.
+        None if the whole text has to be looked at instead: when not paging, the
+        first time, and after the text has been replaced.
+        """
+        if self.document is None:
+            return None
+        self._sync_page()
+        edit = self._document_edit
+        self._document_edit = ()
+        if edit == ():
+            return (0, 0, 0)
+        return edit
+
+    def get_selection(self):
+        """The (left, right) of the selection, relative to the whole text."""
+        sel = self.area.sel
+        if self.document is not None:
+            return (self.page_start + sel.left, self.page_start + sel.right)
+        return (sel.left, sel.right)
+
+    def set_selection(self, left, right):
+        """Select from `left` to `right` of the whole text, paging if need be."""
+        if self.document is not None:
+            page_end = self.page_start + len(self._page_text)
+            if not (self.page_start <= left and right <= page_end):
+                self._sync_page()
+                self._load_page(left, left, right)
+                return
+            left -= self.page_start
+            right -= self.page_start
+        self.area.sel = Span(left, right)
+
+    @timings.timed("page")
+    def update_page(self):
+        """
+        Move the page along if the caret is near the edge of it and there's more
+        text that way. Returns True if the page was moved, which also changes the
+        text in the text area.
+        """
+        if self.document is None:
+            return False
+        sel = self.area.sel
+        margin = self.page_chars // 4
+        page_end = self.page_start + len(self._page_text)
+        near_start = self.page_start > 0 and sel.left < margin
+        near_end = page_end < len(self.document) and (
+            sel.right > len(self.area.value) - margin
+        )
+        if not (near_start or near_end):
+            return False
+        self._sync_page()
+        self._load_page(
+            self.page_start + sel.left,
+            self.page_start + sel.left,
+            self.page_start + sel.right,
+        )
+        return True
+
+    def _load_page(self, centre, left, right):
+        """Show the page around `centre`, selecting `left` to `right`."""
+        document = self.document
+        start = max(
+            0, min(centre - self.page_chars // 2, len(document) - self.page_chars)
+        )
+        if start > 0:
+            # Start the page on a new line, if there's one nearby
+            newline = document.slice(start, start + 1000).find("\n")
+            if newline != -1 and start + newline < left:
+                start += newline + 1
+        end = min(len(document), start + self.page_chars)
+        self.page_start = start
+        self._page_text = document.slice(start, end)
+        self.area.value = self._page_text
+        page_length = len(self._page_text)
+        self.area.sel = Span(
+            max(0, min(left - start, page_length)),
+            max(0, min(right - start, page_length)),
+        )
+
+    def _sync_page(self):
+        """Copy any edits made in the text area into the document."""
+        text = self.area.value
+        if text != self._page_text:
+            start, old_end, new_end = text_difference(self._page_text, text)
+            self.document.replace(
+                self.page_start + start,
+                self.page_start + old_end,
+                text[start:new_end],
+            )
+            self._page_text = text
+            self._note_document_edit(
+                self.page_start + start,
+                self.page_start + old_end,
+                self.page_start + new_end,
+            )
+
+    def _note_document_edit(self, start, old_end, new_end):
+        """Add an edit to the document to the one take_document_edit() returns."""
+        edit = self._document_edit
+        if edit is None:
+            return
+        if edit:
+            # Cover both edits, in the text from before the first and after the
+            # second
+            first_start, first_old_end, first_new_end = edit
+            end = max(first_new_end, old_end)
+            start = min(first_start, start)
+            old_end, new_end = (
+                end - first_new_end + first_old_end,
+                end - old_end + new_end,
+            )
+        self._document_edit = (start, old_end, new_end)
+
     def get_rect(self) -> "talon.types.Rect":
         """Get the Rect for the window"""
         return self.area.rect
@@ -201,36 +896,439 @@ class DraftManager:
 
         self.area.sel = index
 
-    def anchor_to_range(self, anchor):
-        anchors_data = calculate_text_anchors(
-            self._get_visible_text(), self.area.sel.left
+    @timings.timed("apply_edits")
+    def apply_edits(self, edits):
+        """
+        Make several edits in one go. `edits` is a list of (start_anchor,
+        end_anchor, replacement), where end_anchor may be None for a single word,
+        and an empty replacement deletes. All the anchors are resolved against the
+        same labels, and the text is replaced once, leaving the caret after the
+        last edit.
+        """
+        ranges = self._get_label_snapshot().ranges
+        spans = []
+        for start_anchor, end_anchor, replacement in edits:
+            start_index, end_index, first_space_index, last_space_index = (
+                self._lookup_anchor(ranges, start_anchor)
+            )
+            if end_anchor is not None:
+                _, end_index, _, last_space_index = self._lookup_anchor(
+                    ranges, end_anchor
+                )
+            spans.append(
+                (
+                    start_index,
+                    end_index,
+                    first_space_index,
+                    last_space_index,
+                    replacement,
+                )
+            )
+
+        text, caret = edit_text_spans(self.area.value, spans)
+        self.area.value = text
+        self.area.sel = caret
+
+    @timings.timed("change_case")
+    def change_case(self, start_anchor, case, end_anchor=None):
+        """
+        Change the case of the word at `start_anchor`, or the words up to
+        `end_anchor`, to one of CASE_TRANSFORMS. The selection is kept where it
+        was, relative to the surrounding text.
+        """
+        try:
+            transform = CASE_TRANSFORMS[case]
+        except KeyError:
+            raise RuntimeError(f"Unknown case {case}")
+        ranges = self._get_label_snapshot().ranges
+        start_index, end_index, _, _ = self._lookup_anchor(ranges, start_anchor)
+        if end_anchor is not None:
+            _, end_index, _, _ = self._lookup_anchor(ranges, end_anchor)
+
+        text = self.area.value
+        replacement = transform(text[start_index:end_index])
+        new_end_index = start_index + len(replacement)
+
+        def moved(index):
+            if index <= start_index:
+                return index
+            if index >= end_index:
+                return index - end_index + new_end_index
+            return min(index, new_end_index)
+
+        sel = self.area.sel
+        left, right = moved(sel.left), moved(sel.right)
+        self.area.value = text[:start_index] + replacement + text[end_index:]
+        self.area.sel = Span(left, right)
+
+    def find_word(self, word, direction="nearest"):
+        """
+        The (start, end) of an occurrence of `word` (ignoring case and surrounding
+        punctuation) in the whole text, or None if there isn't one. `direction` is
+        "nearest" for the one closest to the caret, or "next" or "previous" to look
+        after or before it, wrapping around the text.
+        """
+        offsets = self._get_word_offsets().offsets(word)
+        if not offsets:
+            return None
+        text = self._get_document_text()
+        # Compare the caret with where each word starts, after any punctuation in
+        # front of it, as that's where jumping to the word leaves the caret
+        ranges = [self._token_word_range(text, offset) for offset in offsets]
+        starts = [start for start, _ in ranges]
+        cursor = self.get_selection()[0]
+        i = bisect_right(starts, cursor)
+        if direction == "next":
+            return ranges[i % len(ranges)]
+        elif direction == "previous":
+            # Skip the word the caret is at the start of
+            return ranges[bisect_left(starts, cursor) - 1]
+        candidates = ranges[max(0, i - 1) : i + 1]
+        return min(candidates, key=lambda word_range: abs(word_range[0] - cursor))
+
+    def jump_to_word(self, word, direction="nearest"):
+        """Move the caret to the start of an occurrence of `word`, see find_word."""
+        word_range = self.find_word(word, direction)
+        if word_range is None:
+            raise RuntimeError(f"Couldn't find {word}")
+        self.set_selection(word_range[0], word_range[0])
+
+    def go_to_line(self, line):
+        """Move the caret to the start of `line` of the whole text, counting from 1."""
+        line_index = self._get_line_index()
+        line = min(max(line, 1), len(line_index)) - 1
+        line_start = line_index.line_range(line)[0]
+        self.set_selection(line_start, line_start)
+
+    def move_to_line_edge(self, end=True):
+        """Move the caret to the end (or start) of the line it's on."""
+        line_index = self._get_line_index()
+        left, right = self.get_selection()
+        line_start, line_end = line_index.line_range(
+            line_index.line_at(right if end else left)
         )
-        for (
-            loop_anchor,
-            start_index,
-            end_index,
-            first_space_index,
-            last_space_index,
-        ) in anchors_data:
-            if anchor == loop_anchor:
-                return (start_index, end_index, first_space_index, last_space_index)
+        caret = line_end if end else line_start
+        self.set_selection(caret, caret)
 
-        raise RuntimeError(f"Couldn't find anchor {anchor}")
+    def select_line(self, line=None):
+        """
+        Select `line` of the whole text (counting from 1), or the line the caret's
+        on.
+        """
+        line_index = self._get_line_index()
+        if line is None:
+            line = line_index.line_at(self.get_selection()[0])
+        else:
+            line = min(max(line, 1), len(line_index)) - 1
+        self.set_selection(*line_index.line_range(line))
+
+    def select_paragraph(self):
+        """Select the paragraph the caret's in."""
+        line_index = self._get_line_index()
+        self.set_selection(*line_index.paragraph_range(self.get_selection()[0]))
+
+    @timings.timed("replace_word")
+    def replace_word(self, word, replacement):
+        """
+        Replace every occurrence of `word` (ignoring case and surrounding
+        punctuation) in the whole text with `replacement`, in one change to the
+        text. Returns the number replaced.
+        """
+        offsets = self._get_word_offsets().offsets(word)
+        if not offsets:
+            return 0
+        text = self._get_document_text()
+        pieces = []
+        last_end = 0
+        for offset in offsets:
+            start, end = self._token_word_range(text, offset)
+            pieces.append(text[last_end:start])
+            pieces.append(replacement)
+            last_end = end
+        pieces.append(text[last_end:])
+        if self.document is None:
+            self.area.value = "".join(pieces)
+        else:
+            # Keep showing the same part of the document
+            self.set_text("".join(pieces), self.get_selection())
+        return len(offsets)
 
-    def _update_labels(self, _visible_text):
+    @staticmethod
+    def _token_word_range(text, offset):
+        # The word in the token at `offset`, without surrounding punctuation
+        token = token_matcher.match(text, offset).group()
+        start, end = word_bounds(token)
+        return (offset + start, offset + end)
+
+    @staticmethod
+    def _lookup_anchor(ranges, anchor):
+        try:
+            return ranges[normalise_anchor(anchor)]
+        except KeyError:
+            raise RuntimeError(f"Couldn't find anchor {anchor}")
+
+    @timings.timed("anchor_to_range")
+    def anchor_to_range(self, anchor):
+        return self._lookup_anchor(self._get_label_snapshot().ranges, anchor)
+
+    def add_change_listener(self, callback):
+        """
+        Call `callback` whenever the text or selection changes.
+
+        Changes are noticed when the window redraws, so nothing runs while the
+        draft sits idle.
+        """
+        if callback not in self._change_listeners:
+            self._change_listeners.append(callback)
+
+    def remove_change_listener(self, callback):
+        if callback in self._change_listeners:
+            self._change_listeners.remove(callback)
+
+    def _update_labels(self, visible_text):
         """Updates the position of the labels displayed on top of each word"""
+        self.visible_text = visible_text
+        if self._labels_in_background():
+            snapshot = self._get_background_label_snapshot()
+        else:
+            snapshot = self._get_label_snapshot()
+        if snapshot is not None:
+            self.shown_snapshot = snapshot
+        self._notify_if_changed()
+        return snapshot.labels if snapshot is not None else []
 
-        anchors_data = calculate_text_anchors(
-            self._get_visible_text(), self.area.sel.left
-        )
-        return [
-            (Span(start_index, end_index), anchor)
-            for anchor, start_index, end_index, _, _ in anchors_data
+    def _labels_in_background(self):
+        if self.label_visible_only and not self.two_character_labels:
+            # Only the text on screen is labelled, which takes the same time
+            # however long the draft is, so there's nothing to gain
+            return False
+        return 0 < self.background_label_chars <= len(self.area.value)
+
+    def _get_background_label_snapshot(self):
+        """
+        The newest labels the label worker has finished for the current text,
+        asking it for labels for the current cursor and scroll position if they
+        aren't those. None if there aren't any for this text yet, as labels for
+        older text would be drawn on the wrong words.
+        """
+        text = self._get_text()
+        cursor = self.area.sel.left
+        visible_range = self._get_visible_range(text, cursor)
+        text_version = self.text_version
+        finished = self.label_worker.result
+        candidates = [
+            snapshot
+            for snapshot in (
+                finished[1] if finished is not None else None,
+                self.shown_snapshot,
+            )
+            if snapshot is not None and snapshot.text_version == text_version
         ]
+        for snapshot in candidates:
+            if self._snapshot_fits(snapshot, cursor, visible_range):
+                return snapshot
 
-    def _get_visible_text(self):
-        # Placeholder for a future method of getting this
-        return self.area.value
+        previous = self.shown_snapshot
+        window_start = self._label_window_start(previous)
+        self.label_worker.submit(
+            (text_version, cursor, visible_range),
+            lambda: self._calculate_label_snapshot(
+                text, text_version, cursor, visible_range, window_start, previous
+            ),
+        )
+        return candidates[0] if candidates else None
+
+    def _on_labels_ready(self):
+        # Called on the worker thread. Draw the new labels from the main thread.
+        cron.after("0ms", self._redraw)
+
+    def _redraw(self):
+        # Assigning the theme redraws the window, picking up the new labels
+        self.area.theme = self.area.theme
+
+    def _notify_if_changed(self):
+        sel = self.area.sel
+        # Text changes are tracked by version, so this comparison stays cheap
+        state = (self.text_version, sel.left, sel.right)
+        if state != self._last_state:
+            self._last_state = state
+            for callback in list(self._change_listeners):
+                callback()
+
+    def _get_label_snapshot(self):
+        """
+        The labels for the current text and cursor position.
+
+        These are normally calculated by the render callback, so commands resolve
+        anchors against exactly what's on screen. They're only recalculated here if
+        the text, cursor or scroll position has moved on since.
+
+        When labelling in the background, the labels on screen may be behind the
+        cursor or scroll position, but they're still right for the text, so they're
+        used as they are. If the text itself has changed since they were drawn,
+        there are no labels on screen to use, which is an error rather than
+        resolving anchors the user never saw.
+        """
+        text = self._get_text()
+        if self._labels_in_background():
+            snapshot = self.shown_snapshot
+            if snapshot is None or snapshot.text_version != self.text_version:
+                raise RuntimeError("The labels haven't caught up with the text yet")
+            return snapshot
+
+        cursor = self.area.sel.left
+        visible_range = self._get_visible_range(text, cursor)
+        snapshot = self.label_snapshot
+        if (
+            snapshot is not None
+            and snapshot.text_version == self.text_version
+            and self._snapshot_fits(snapshot, cursor, visible_range)
+        ):
+            return snapshot
+
+        snapshot = self._calculate_label_snapshot(
+            text,
+            self.text_version,
+            cursor,
+            visible_range,
+            self._label_window_start(snapshot),
+            # Keep the labels that are on screen where they can be
+            self.shown_snapshot or snapshot,
+        )
+        self.label_snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _snapshot_fits(snapshot, cursor, visible_range):
+        """Are `snapshot`'s labels the ones to show for this cursor and range?"""
+        if snapshot.visible_range != visible_range:
+            return False
+        if snapshot.cursor == cursor:
+            return True
+        steady_range = snapshot.steady_range
+        return steady_range is not None and (
+            steady_range[0] <= cursor < steady_range[1]
+        )
+
+    def _label_window_start(self, snapshot):
+        """Where the labels in `snapshot` start, if they should be kept there."""
+        if self.label_margin <= 0 or snapshot is None or not snapshot.labels:
+            return None
+        return snapshot.labels[0][0].left
+
+    def anchor_spans(self, spec):
+        """Parse spoken anchors with `parse_anchor_spans`, for the current labels."""
+        return parse_anchor_spans(spec, 2 if self.two_character_labels else 1)
+
+    @timings.timed("labels")
+    def _calculate_label_snapshot(
+        self,
+        text,
+        text_version,
+        cursor,
+        visible_range,
+        window_start=None,
+        previous=None,
+    ):
+        # This may run on the label worker, so only uses the text it's given
+        margin = self.label_margin
+        if self.two_character_labels or visible_range is None:
+            with self._index_lock:
+                word_index = self.word_index
+                word_index.update(text)
+                if self.two_character_labels:
+                    keep = None
+                    if previous is not None:
+                        keep = carry_labels(previous.text, text, previous.labels)
+                    anchors_data = ordinal_text_anchors(
+                        word_index, visible_range, cursor, keep=keep
+                    )
+                else:
+                    anchors_data = index_text_anchors(
+                        word_index, cursor, window_start=window_start, margin=margin
+                    )
+        else:
+            anchors_data = calculate_range_anchors(
+                text,
+                *visible_range,
+                cursor,
+                tokenizer=TOKENIZERS[self.tokenizer],
+                window_start=window_start,
+                margin=margin,
+            )
+
+        labels = []
+        ranges = {}
+        for anchor_data in anchors_data:
+            anchor, start_index, end_index = anchor_data[:3]
+            labels.append((Span(start_index, end_index), anchor))
+            ranges[anchor] = anchor_data[1:]
+
+        steady_range = None
+        if margin > 0 and not self.two_character_labels:
+            # While the cursor's more than `margin` words inside the labels, they
+            # stay where they are
+            inner = anchors_data[margin : len(anchors_data) - margin]
+            if inner:
+                steady_range = (inner[0][1], inner[-1][4])
+        return LabelSnapshot(
+            text_version, cursor, visible_range, labels, ranges, steady_range, text
+        )
+
+    def _get_visible_range(self, text, cursor):
+        """
+        The (start, end) of the text that's on screen, or None if the whole text
+        should be labelled.
+        """
+        if not self.label_visible_only:
+            return None
+
+        visible_text = self.visible_text
+        if visible_text:
+            start = locate_visible_text(text, visible_text, cursor)
+            if start is not None:
+                return (start, start + len(visible_text))
+
+        # The text has changed since it was last drawn (or it hasn't been drawn
+        # yet), so estimate how much fits in the window around the cursor.
+        rect = self.area.rect
+        # HACK: Rough glyph metrics, doubled to be on the safe side.
+        columns = rect.width / (self.text_size * 0.5)
+        rows = rect.height / self.text_size
+        length = int(columns * rows)
+        if length >= len(text):
+            return None
+        start = max(0, cursor - length)
+        return (start, min(len(text), cursor + length))
+
+    def _get_text(self):
+        """The current text, noting whether it has changed since last time."""
+        text = self.area.value
+        if text != self._last_text:
+            self._last_text = text
+            self.text_version += 1
+        return text
+
+    def _get_document_text(self):
+        """
+        The whole text, for the commands that search or count lines across all
+        of it. The same as `_get_text()` unless paging.
+        """
+        if self.document is None:
+            return self._get_text()
+        return self.get_text()
+
+    def _get_line_index(self):
+        """The line index, brought up to date with the whole text."""
+        self.line_index.update(self._get_document_text())
+        return self.line_index
+
+    def _get_word_offsets(self):
+        """The inverted word index, brought up to date with the whole text."""
+        if self.word_offsets is None:
+            self.word_offsets = WordOffsetIndex()
+        self.word_offsets.update(self._get_document_text())
+        return self.word_offsets
 
 
 if False:
@@ -0,0 +1,144 @@
+"""Memory bounded undo history for the draft window."""
+
+from collections import deque
+
+from .draft_document import PieceTable
+from .draft_index import text_difference
+
+
+class UndoHistory:
+    """
+    A stack of (text, selection) states.
+
+    Only the state on top of the stack is kept as a full copy of the text, in a
+    piece table so it can be edited without copying it (see `push_edit()`). Every
+    state below it is stored as the edit that turns the state above it back into
+    it, so a long session on a big draft costs roughly the size of the changes,
+    not the size of the draft times the number of changes. Popping a state
+    applies a single edit, and dropping the oldest state needs no rebasing.
+
+    Once there are more than `max_entries` states, or the stored edits add up to
+    more than `max_chars` characters, the oldest states are forgotten.
+    """
+
+    def __init__(self, max_entries=200, max_chars=4 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.clear()
+
+    def clear(self):
+        # A PieceTable of the text on top of the stack
+        self._top = None
+        self._top_sel = None
+        # (start, end, replacement, selection) for each state below the top,
+        # oldest first. Applying `top[:start] + replacement + top[end:]` to the
+        # state above gives this state's text.
+        self._edits = deque()
+        self._edit_chars = 0
+
+    def __len__(self):
+        if self._top is None:
+            return 0
+        return len(self._edits) + 1
+
+    def __bool__(self):
+        return self._top is not None
+
+    @property
+    def size_in_chars(self):
+        """Approximate number of characters held by the history."""
+        if self._top is None:
+            return 0
+        return len(self._top) + self._edit_chars
+
+    def peek(self):
+        """The (text, selection) on top of the stack, without removing it."""
+        if self._top is None:
+            raise IndexError("peek from empty undo history")
+        return self._top.text(), self._top_sel
+
+    def push(self, text, sel):
+        """Add a (text, selection) state to the top of the stack."""
+        if self._top is not None:
+            old_text = self._top.text()
+            start, end, old_end = text_difference(text, old_text)
+            self._push_undo(start, end, old_text[start:old_end])
+        self._top = PieceTable(text)
+        self._top_sel = sel
+        self._evict()
+
+    def push_edit(self, start, end, replacement, sel):
+        """
+        Add the state made by replacing `[start:end]` of the text on top of the
+        stack with `replacement`, without needing the whole of its text. Returns
+        False, and adds nothing, if that leaves the text as it was.
+        """
+        top = self._top
+        if top is None:
+            raise IndexError("push_edit onto empty undo history")
+        old = top.slice(start, end)
+        if old == replacement:
+            return False
+        self._push_undo(start, start + len(replacement), old)
+        top.replace(start, end, replacement)
+        self._top_sel = sel
+        self._evict()
+        return True
+
+    def pop(self):
+        """Remove and return the (text, selection) on top of the stack."""
+        result = self.peek()
+        if self._edits:
+            start, end, replacement, sel = self._edits.pop()
+            self._edit_chars -= len(replacement)
+            self._top.replace(start, end, replacement)
+            self._top_sel = sel
+        else:
+            self._top = None
+            self._top_sel = None
+        return result
+
+    def set_top_selection(self, sel):
+        """Replace the selection remembered for the state on top of the stack."""
+        if self._top is None:
+            raise IndexError("set_top_selection on empty undo history")
+        self._top_sel = sel
+
+    def to_dict(self):
+        """The history as a dict of JSON-friendly values, see `from_dict()`."""
+        return {
+            "max_entries": self.max_entries,
+            "max_chars": self.max_chars,
+            "top_text": None if self._top is None else self._top.text(),
+            "top_sel": self._top_sel,
+            "edits": list(self._edits),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a history saved with `to_dict()`."""
+        history = cls(data["max_entries"], data["max_chars"])
+        if data["top_text"] is not None:
+            history._top = PieceTable(data["top_text"])
+        history._top_sel = _as_selection(data["top_sel"])
+        for start, end, replacement, sel in data["edits"]:
+            history._edits.append((start, end, replacement, _as_selection(sel)))
+            history._edit_chars += len(replacement)
+        return history
+
+    def _push_undo(self, start, end, replacement):
+        # Remember how to turn the new top state back into the current one
+        self._edits.append((start, end, replacement, self._top_sel))
+        self._edit_chars += len(replacement)
+
+    def _evict(self):
+        edits = self._edits
+        while edits and (
+            len(edits) + 1 > self.max_entries or self._edit_chars > self.max_chars
+        ):
+            self._edit_chars -= len(edits.popleft()[2])
+
+
+def _as_selection(sel):
+    # JSON turns the selection tuples into lists
+    return None if sel is None else tuple(sel)
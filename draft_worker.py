@@ -0,0 +1,68 @@
+"""A background thread for work where only the latest request matters."""
+
+import logging
+import threading
+
+
+class LatestWorker:
+    """
+    Runs jobs on a background thread, one at a time. Submitting a job replaces
+    any that hasn't started yet, so a burst of requests only runs the last one.
+
+    Each job is submitted with a key saying what it was for. The key and result
+    of the last job to finish are kept in `result`, for the caller to check
+    against what it wants now. `on_done` is called on the worker thread each time
+    a job finishes.
+    """
+
+    def __init__(self, name, on_done=None):
+        self.name = name
+        self.on_done = on_done
+        # (key, value) of the last job to finish, or None
+        self.result = None
+        self._pending = None
+        self._running = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, key, job):
+        """Run `job()` in the background, unless another is submitted first."""
+        with self._condition:
+            self._pending = (key, job)
+            self._condition.notify_all()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def is_busy(self):
+        with self._condition:
+            return self._running or self._pending is not None
+
+    def wait(self, timeout=None):
+        """Block until there's nothing left to do. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not (self._running or self._pending is not None), timeout
+            )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None)
+                key, job = self._pending
+                self._pending = None
+                self._running = True
+            try:
+                value = job()
+            except Exception:
+                logging.exception("%s failed", self.name)
+            else:
+                self.result = (key, value)
+                if self.on_done is not None:
+                    self.on_done()
+            finally:
+                with self._condition:
+                    self._running = False
+                    self._condition.notify_all()
@@ -0,0 +1,666 @@
+"""
+An in-memory stand-in for the parts of Talon the draft window uses, so
+`DraftManager`, `UndoWorkaround` and the `Actions` in `draft_talon_helpers.py`
+can be driven (and profiled) outside Talon.
+
+Call `install_fake_talon()` before importing anything that imports `talon`. It
+does nothing when the real Talon is available.
+
+Time is simulated: `cron` timers only fire when `cron.advance()` is called (or an
+action calls `actions.sleep()`), which keeps tests fast and deterministic.
+"""
+
+from collections import namedtuple
+import importlib
+import re
+import sys
+import tempfile
+import threading
+import types
+import weakref
+
+
+def _parse_duration(spec):
+    """Turn a Talon duration like "500ms" or "1s" into milliseconds."""
+    match = re.fullmatch(r"\s*([0-9.]+)\s*(ms|s|m)?\s*", str(spec))
+    if not match:
+        raise ValueError(f"Bad duration: {spec!r}")
+    value = float(match.group(1))
+    unit = match.group(2) or "s"
+    return value * {"ms": 1, "s": 1000, "m": 60000}[unit]
+
+
+class Rect:
+    def __init__(self, x=0, y=0, width=0, height=0):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def copy(self):
+        return Rect(self.x, self.y, self.width, self.height)
+
+    def __eq__(self, other):
+        return isinstance(other, Rect) and (
+            (self.x, self.y, self.width, self.height)
+            == (other.x, other.y, other.width, other.height)
+        )
+
+    def __repr__(self):
+        return f"Rect({self.x}, {self.y}, {self.width}, {self.height})"
+
+
+# ---------------------------------------------------------------------------
+# talon.cron
+
+
+class FakeCron:
+    def __init__(self):
+        # Like Talon's, timers may be scheduled from other threads
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.now = 0.0
+            self._jobs = {}
+            self._next_handle = 0
+
+    def _schedule(self, spec, callback, repeat):
+        interval = _parse_duration(spec)
+        with self._lock:
+            self._next_handle += 1
+            self._jobs[self._next_handle] = [
+                self.now + interval,
+                interval,
+                callback,
+                repeat,
+            ]
+            return self._next_handle
+
+    def after(self, spec, callback):
+        return self._schedule(spec, callback, repeat=False)
+
+    def interval(self, spec, callback):
+        return self._schedule(spec, callback, repeat=True)
+
+    def cancel(self, handle):
+        with self._lock:
+            self._jobs.pop(handle, None)
+
+    @property
+    def pending(self):
+        """Number of scheduled jobs."""
+        return len(self._jobs)
+
+    def advance(self, spec):
+        """Move the clock forward, running any jobs that come due in order."""
+        end = self.now + _parse_duration(spec)
+        while True:
+            with self._lock:
+                due = [
+                    (job[0], handle)
+                    for handle, job in self._jobs.items()
+                    if job[0] <= end
+                ]
+                if not due:
+                    break
+                when, handle = min(due)
+                when, interval, callback, repeat = self._jobs[handle]
+                self.now = max(self.now, when)
+                if repeat:
+                    self._jobs[handle][0] = when + interval
+                else:
+                    del self._jobs[handle]
+            callback()
+        self.now = end
+
+
+# ---------------------------------------------------------------------------
+# talon.ui
+
+App = namedtuple("App", ["name"])
+Screen = namedtuple("Screen", ["x", "y", "width", "height", "rect"])
+
+
+class Window:
+    def __init__(self, app_name, title, screen):
+        self.app = App(app_name)
+        self.title = title
+        self.screen = screen
+
+    def __repr__(self):
+        return f"Window({self.app.name!r}, {self.title!r})"
+
+
+class FakeUI:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        rect = Rect(0, 0, 1920, 1080)
+        self._screens = [Screen(rect.x, rect.y, rect.width, rect.height, rect)]
+        self.editor_window = Window("Editor", "untitled", self._screens[0])
+        self._active = self.editor_window
+        self._handlers = {}
+
+    def active_window(self):
+        return self._active
+
+    def screens(self):
+        return list(self._screens)
+
+    def main_screen(self):
+        return self._screens[0]
+
+    def register(self, event, callback):
+        self._handlers.setdefault(event, []).append(callback)
+
+    def unregister(self, event, callback):
+        handlers = self._handlers.get(event, [])
+        if callback in handlers:
+            handlers.remove(callback)
+
+    def focus(self, window):
+        """Make `window` the active window, like the user clicking on it."""
+        if window is self._active:
+            return
+        self._active = window
+        for callback in list(self._handlers.get("win_focus", [])):
+            callback(window)
+
+
+# ---------------------------------------------------------------------------
+# talon.experimental.textarea
+
+
+class Span:
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def __bool__(self):
+        return self.right > self.left
+
+    def __eq__(self, other):
+        return isinstance(other, Span) and (self.left, self.right) == (
+            other.left,
+            other.right,
+        )
+
+    def __repr__(self):
+        return f"Span({self.left}, {self.right})"
+
+
+class _Theme:
+    def __init__(self, **changes):
+        self.changes = changes
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.changes == other.changes
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.changes})"
+
+
+class DarkThemeLabels(_Theme):
+    pass
+
+
+class LightThemeLabels(_Theme):
+    pass
+
+
+# Every TextArea created, so typing can go to whichever one has focus
+_text_areas = weakref.WeakSet()
+
+
+class TextArea:
+    """
+    A text area that "renders" synchronously whenever its text or selection
+    changes while it's showing, calling the "label" callbacks with the visible
+    text, roughly like Talon's does on each redraw.
+    """
+
+    def __init__(self):
+        self.title = ""
+        self.showing = False
+        # Redraw straight after every change. Turn off to call render() by hand.
+        self.auto_render = True
+        # Take focus as soon as it's shown. Turn off to focus it with ui.focus().
+        self.focus_on_show = True
+        # How many lines fit in the window
+        self.visible_lines = 30
+        # The labels returned by the last render
+        self.labels = []
+        self.render_count = 0
+        self._theme = None
+        self._value = ""
+        self._sel = Span(0, 0)
+        self._rect = Rect(100, 100, 800, 600)
+        self._callbacks = {}
+        self._scroll = 0
+        self._window = None
+        _text_areas.add(self)
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        # Like a real text area, keep the cursor inside the text
+        self._sel = Span(
+            min(self._sel.left, len(value)), min(self._sel.right, len(value))
+        )
+        self._changed()
+
+    @property
+    def sel(self):
+        return Span(self._sel.left, self._sel.right)
+
+    @sel.setter
+    def sel(self, sel):
+        if isinstance(sel, int):
+            sel = Span(sel, sel)
+        elif isinstance(sel, tuple):
+            sel = Span(*sel)
+        left = max(0, min(sel.left, len(self._value)))
+        right = max(left, min(sel.right, len(self._value)))
+        self._sel = Span(left, right)
+        self._changed()
+
+    @property
+    def theme(self):
+        return self._theme
+
+    @theme.setter
+    def theme(self, theme):
+        self._theme = theme
+        self._changed()
+
+    @property
+    def rect(self):
+        return self._rect.copy()
+
+    @rect.setter
+    def rect(self, rect):
+        self._rect = rect.copy()
+        self._changed()
+
+    def __getitem__(self, key):
+        return self._value[key]
+
+    def register(self, event, callback):
+        self._callbacks.setdefault(event, []).append(callback)
+
+    def unregister(self, event, callback):
+        callbacks = self._callbacks.get(event, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def show(self):
+        self.showing = True
+        self._window = Window("Talon", self.title, ui.main_screen())
+        if self.focus_on_show:
+            ui.focus(self._window)
+        self._changed()
+
+    def hide(self):
+        self.showing = False
+        if ui.active_window() is self._window:
+            ui.focus(ui.editor_window)
+
+    def insert(self, text):
+        """Type `text` over the selection, like dictation would."""
+        sel = self._sel
+        self._value = self._value[: sel.left] + text + self._value[sel.right :]
+        self._sel = Span(sel.left + len(text), sel.left + len(text))
+        self._changed()
+
+    def key(self, key):
+        """Press one of the few keys the fake understands."""
+        sel = self._sel
+        value = self._value
+        if key in ("backspace", "delete"):
+            if sel:
+                self._value = value[: sel.left] + value[sel.right :]
+                self._sel = Span(sel.left, sel.left)
+            elif key == "backspace" and sel.left > 0:
+                self._value = value[: sel.left - 1] + value[sel.left :]
+                self._sel = Span(sel.left - 1, sel.left - 1)
+            elif key == "delete":
+                self._value = value[: sel.left] + value[sel.left + 1 :]
+        elif key == "left":
+            self.sel = max(0, sel.left - 1)
+            return
+        elif key == "right":
+            self.sel = sel.right + 1
+            return
+        else:
+            return
+        self._changed()
+
+    def visible_text(self):
+        """The text that would be on screen, scrolled to keep the cursor visible."""
+        value = self._value
+        cursor = self._sel.left
+        # Edits may have left the scroll position mid-line
+        scroll = value.rfind("\n", 0, min(self._scroll, len(value))) + 1
+        if cursor < scroll:
+            scroll = value.rfind("\n", 0, cursor) + 1
+        end = self._nth_line_end(scroll, self.visible_lines)
+        if cursor > end:
+            # Scroll down until the cursor's line is the last one showing
+            scroll = value.rfind("\n", 0, cursor) + 1
+            for _ in range(self.visible_lines - 1):
+                if scroll == 0:
+                    break
+                scroll = value.rfind("\n", 0, scroll - 1) + 1
+            end = self._nth_line_end(scroll, self.visible_lines)
+        self._scroll = scroll
+        return value[scroll:end]
+
+    def _nth_line_end(self, start, lines):
+        end = start
+        for _ in range(lines):
+            end = self._value.find("\n", end)
+            if end < 0:
+                return len(self._value)
+            end += 1
+        return end
+
+    def render(self):
+        visible_text = self.visible_text()
+        self.render_count += 1
+        for callback in self._callbacks.get("label", []):
+            self.labels = callback(visible_text)
+        return self.labels
+
+    def _changed(self):
+        if self.showing and self.auto_render:
+            self.render()
+
+
+# ---------------------------------------------------------------------------
+# talon.settings, Module, Context and actions
+
+
+class FakeSettings:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._defaults = {}
+        self._values = {}
+        self._callbacks = []
+
+    def get(self, name, default=None):
+        if name in self._values:
+            return self._values[name]
+        return self._defaults.get(name, default)
+
+    def set(self, name, value):
+        """Change a setting, like a context's `settings()` block would."""
+        self._values[name] = value
+        for prefix, callback in list(self._callbacks):
+            if name.startswith(prefix):
+                callback(name, value)
+
+    def register(self, prefix, callback):
+        self._callbacks.append((prefix, callback))
+
+    def unregister(self, prefix, callback):
+        if (prefix, callback) in self._callbacks:
+            self._callbacks.remove((prefix, callback))
+
+
+def _action_functions(cls):
+    for name, value in vars(cls).items():
+        if not name.startswith("_") and callable(value):
+            yield name, value
+
+
+class Module:
+    def __init__(self):
+        self.tags = {}
+
+    def tag(self, name, desc=None):
+        self.tags[f"user.{name}"] = desc
+
+    def setting(self, name, type=None, default=None, desc=None):
+        path = f"user.{name}"
+        settings._defaults[path] = default
+        return types.SimpleNamespace(name=path, get=lambda: settings.get(path))
+
+    def list(self, name, desc=None):
+        pass
+
+    def action_class(self, cls):
+        for name, fn in _action_functions(cls):
+            actions._defaults[f"user.{name}"] = fn
+        return cls
+
+    def action(self, fn):
+        actions._defaults[f"user.{fn.__name__}"] = fn
+        return fn
+
+    def capture(self, rule=None):
+        return lambda fn: fn
+
+
+class Context:
+    def __init__(self):
+        self.matches = ""
+        self.tags = []
+        self.lists = {}
+        self.settings = {}
+        self._overrides = {}
+        _contexts.append(self)
+
+    def action_class(self, namespace):
+        def register(cls):
+            for name, fn in _action_functions(cls):
+                self._overrides[f"{namespace}.{name}"] = fn
+            return cls
+
+        return register
+
+    def action(self, path):
+        def register(fn):
+            self._overrides[path] = fn
+            return fn
+
+        return register
+
+    def capture(self, path=None, rule=None):
+        return lambda fn: fn
+
+    def is_active(self):
+        """Whether this context's `matches` currently hold (title and tags only)."""
+        active_tags = {tag for context in _contexts for tag in context.tags}
+        for line in self.matches.splitlines():
+            key, _, value = line.partition(":")
+            key = key.strip()
+            value = value.strip()
+            if key == "title" and ui.active_window().title != value:
+                return False
+            if key == "tag" and value not in active_tags:
+                return False
+        return True
+
+
+_contexts = []
+
+
+class _Namespace:
+    def __init__(self, registry, namespace):
+        self._registry = registry
+        self._namespace = namespace
+
+    def __getattr__(self, name):
+        return self._registry._find(f"{self._namespace}.{name}")
+
+
+class FakeActions:
+    """
+    Resolves `actions.<namespace>.<name>` to the override from the most recently
+    created active context, then the module's definition, then a built-in fake.
+    Every call to a built-in fake is recorded in `calls`.
+    """
+
+    def __init__(self):
+        self._defaults = {}
+        self.calls = []
+
+    def reset(self):
+        self.calls = []
+        self.clipboard = ""
+
+    def _find(self, path):
+        for context in reversed(_contexts):
+            if path in context._overrides and context.is_active():
+                return context._overrides[path]
+        if path in self._defaults:
+            return self._defaults[path]
+        builtin = _BUILTIN_ACTIONS.get(path)
+        if builtin is None:
+            raise AttributeError(f"No such action: {path}")
+
+        def call(*args):
+            self.calls.append((path, args))
+            return builtin(*args)
+
+        return call
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name == "self":
+            name = "user"
+        if name in ("user", "edit", "clip", "app", "path"):
+            return _Namespace(self, name)
+        return self._find(f"main.{name}")
+
+
+def _focused_area():
+    for area in list(_text_areas):
+        if area.showing and ui.active_window() is area._window:
+            return area
+    return None
+
+
+def _insert(text):
+    area = _focused_area()
+    if area is not None:
+        area.insert(text)
+
+
+def _key(keys):
+    area = _focused_area()
+    for key in keys.split(" "):
+        if area is not None:
+            area.key(key)
+
+
+def _select_all():
+    area = _focused_area()
+    if area is not None:
+        area.sel = Span(0, len(area.value))
+
+
+def _set_clipboard(text):
+    actions.clipboard = text
+
+
+_talon_home = None
+
+
+def _get_talon_home():
+    # A scratch directory, so nothing is written to the real Talon home
+    global _talon_home
+    if _talon_home is None:
+        _talon_home = tempfile.mkdtemp(prefix="fake_talon_home")
+    return _talon_home
+
+
+_BUILTIN_ACTIONS = {
+    "main.insert": _insert,
+    "main.key": _key,
+    "main.sleep": lambda duration: cron.advance(duration),
+    "edit.select_all": _select_all,
+    "edit.selected_text": lambda: "",
+    "edit.paste": lambda: _insert(actions.clipboard),
+    "edit.undo": lambda: None,
+    "edit.redo": lambda: None,
+    "clip.set_text": _set_clipboard,
+    "clip.text": lambda: actions.clipboard,
+    "app.notify": lambda body="", title="": None,
+    "path.talon_home": _get_talon_home,
+}
+
+
+cron = FakeCron()
+ui = FakeUI()
+settings = FakeSettings()
+actions = FakeActions()
+actions.reset()
+
+# What `user.misc.chunked_phrase` provides in the author's Talon config
+SurroundingText = namedtuple("SurroundingText", ["text_before", "text_after"])
+
+
+def reset_fake_talon():
+    """Put the clock, windows and action log back to how they started."""
+    cron.reset()
+    ui.reset()
+    actions.reset()
+
+
+def install_fake_talon():
+    """
+    Make `import talon` (and the Talon helpers from the user's config that this
+    repo imports) load the fakes. Returns False, doing nothing, when running
+    inside Talon. Returns True if the fakes are already installed.
+    """
+    if getattr(sys.modules.get("talon"), "is_fake", False):
+        return True
+    try:
+        importlib.import_module("talon.experimental.textarea")
+        return False
+    except ModuleNotFoundError:
+        pass
+
+    this = sys.modules[__name__]
+    talon = types.ModuleType("talon")
+    talon.__path__ = []
+    # So installing again can tell the fakes from the real Talon
+    talon.is_fake = True
+    for name in ["cron", "ui", "settings", "actions", "Module", "Context"]:
+        setattr(talon, name, getattr(this, name))
+    talon.app = types.SimpleNamespace(platform=sys.platform)
+    experimental = types.ModuleType("talon.experimental")
+    experimental.__path__ = []
+    textarea = types.ModuleType("talon.experimental.textarea")
+    for name in ["TextArea", "Span", "DarkThemeLabels", "LightThemeLabels"]:
+        setattr(textarea, name, getattr(this, name))
+    talon.experimental = experimental
+    experimental.textarea = textarea
+
+    chunked_phrase = types.ModuleType("user.misc.chunked_phrase")
+    chunked_phrase.SurroundingText = SurroundingText
+
+    modules = {
+        "talon": talon,
+        "talon.experimental": experimental,
+        "talon.experimental.textarea": textarea,
+        "user.misc.chunked_phrase": chunked_phrase,
+    }
+    for name in ["user", "user.misc"]:
+        if name not in sys.modules:
+            package = types.ModuleType(name)
+            package.__path__ = []
+            modules[name] = package
+    sys.modules.update(modules)
+    return True
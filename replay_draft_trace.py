@@ -0,0 +1,213 @@
+"""
+Replays a trace recorded with user.draft_window_trace (see draft_trace.py)
+against the draft window, outside Talon, timing each step.
+
+From the directory containing this repo, e.g.:
+
+    python -m talon_draft_window.replay_draft_trace trace.jsonl
+    python -m talon_draft_window.replay_draft_trace trace.jsonl --profile 20
+
+Time between steps is replayed on the fake clock, so the undo history and other
+timers behave as they did when the trace was recorded. Dictation is replayed by
+setting the text. After each action, the text is checked against the recording,
+and any difference is reported and then corrected, so the rest of the trace can
+still run.
+"""
+
+import argparse
+import cProfile
+import pstats
+import sys
+import time
+
+from .fake_talon import install_fake_talon
+
+# Stand in for the Talon imports when running outside Talon
+running_in_talon = not install_fake_talon()
+
+from talon import actions, cron, settings
+from .fake_talon import reset_fake_talon
+from .draft_talon_helpers import Autosave, UndoWorkaround, get_draft_manager
+from .draft_timing import timings
+from .draft_trace import read_trace
+
+
+def _resolve_action(name):
+    namespace, _, action = name.partition(".")
+    return getattr(getattr(actions, namespace), action)
+
+
+def replay(entries, log=None):
+    """
+    Run the steps of a trace, returning a dict for each: `step` (the action, or
+    "edit" for a change to the text between actions, e.g. dictation), `t`,
+    `recorded_ms`, `replay_ms`, and `note`, which says if the step failed or the
+    text came out different.
+    """
+    reset_fake_talon()
+    UndoWorkaround.stop_logger()
+    draft_manager = get_draft_manager()
+    draft_manager.hide()
+    draft_manager.set_text("")
+    UndoWorkaround.undo_stack.clear()
+    UndoWorkaround.redo_stack.clear()
+    # Only what's in the trace, not a draft left on disk
+    Autosave.recovered = True
+
+    area = draft_manager.area
+    results = []
+    expected_text = ""
+    expected_sel = (0, 0)
+    last_t = 0.0
+    # The last action, until what it did to the text has been checked
+    unchecked = None
+
+    def check():
+        if area.value != expected_text:
+            return "text differs from recording"
+        if (area.sel.left, area.sel.right) != expected_sel:
+            return "selection differs from recording"
+        return ""
+
+    for entry in entries + [None]:
+        if unchecked is not None and (entry is None or not entry.get("result")):
+            # The action didn't change the text or selection when recorded
+            unchecked["note"] = unchecked["note"] or check()
+            unchecked = None
+        if entry is None:
+            break
+
+        t = entry.get("t", last_t)
+        if t > last_t:
+            cron.advance(f"{(t - last_t) * 1000}ms")
+            last_t = t
+
+        note = ""
+        recorded_ms = None
+        if "action" in entry:
+            step = entry["action"]
+            start = time.perf_counter()
+            try:
+                _resolve_action(step)(*entry["args"], **entry.get("kwargs", {}))
+            except Exception as e:
+                note = f"failed: {e!r}"
+            replay_seconds = time.perf_counter() - start
+            recorded_ms = entry.get("ms")
+        else:
+            if "text" in entry:
+                expected_text = entry["text"]
+            else:
+                edit_start, edit_end, replacement = entry["edit"]
+                expected_text = (
+                    expected_text[:edit_start] + replacement + expected_text[edit_end:]
+                )
+            expected_sel = tuple(entry["sel"])
+            if entry.get("result"):
+                # What the last action did. Check it, then put it right so the
+                # rest of the trace starts from the same place.
+                results[-1]["note"] = results[-1]["note"] or check()
+                unchecked = None
+            start = time.perf_counter()
+            if area.value != expected_text:
+                area.value = expected_text
+            if (area.sel.left, area.sel.right) != expected_sel:
+                area.sel = expected_sel
+            replay_seconds = time.perf_counter() - start
+            if entry.get("result"):
+                continue
+            step = "edit"
+
+        result = {
+            "step": step,
+            "t": t,
+            "recorded_ms": recorded_ms,
+            "replay_ms": replay_seconds * 1000,
+            "note": note,
+        }
+        results.append(result)
+        if "action" in entry:
+            unchecked = result
+        if log is not None:
+            log(result)
+    return results
+
+
+def _log_step(result):
+    recorded = result["recorded_ms"]
+    recorded = "" if recorded is None else f"{recorded:.3f}"
+    print(
+        f"{result['t']:>10.3f} {result['step']:>32} {recorded:>12} "
+        f"{result['replay_ms']:>12.3f} {result['note']}"
+    )
+
+
+def summarise(results):
+    """Replay time per kind of step: {step: (count, total ms, max ms)}."""
+    summary = {}
+    for result in results:
+        count, total, longest = summary.get(result["step"], (0, 0.0, 0.0))
+        summary[result["step"]] = (
+            count + 1,
+            total + result["replay_ms"],
+            max(longest, result["replay_ms"]),
+        )
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("trace", help="A trace file from user.draft_window_trace")
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="SETTING=VALUE",
+        help="Change a setting first, e.g. user.draft_window_label_margin=5",
+    )
+    parser.add_argument(
+        "--profile",
+        type=int,
+        metavar="N",
+        help="Profile the replay, and show the N functions with the most time",
+    )
+    parser.add_argument("--quiet", action="store_true", help="Only show totals")
+    args = parser.parse_args(argv)
+
+    for assignment in args.set:
+        name, _, value = assignment.partition("=")
+        settings.set(name, int(value) if value.lstrip("-").isdigit() else value)
+    settings.set("user.draft_window_timing", 1)
+    # Let the settings take effect
+    cron.advance("1s")
+
+    entries = read_trace(args.trace)
+    if not args.quiet:
+        print(f"{'t (s)':>10} {'step':>32} {'rec (ms)':>12} {'replay (ms)':>12}")
+    log = None if args.quiet else _log_step
+    if args.profile:
+        profiler = cProfile.Profile()
+        results = profiler.runcall(replay, entries, log)
+    else:
+        results = replay(entries, log)
+
+    print()
+    print(f"{'step':>32} {'count':>6} {'total (ms)':>12} {'max (ms)':>12}")
+    for step, (count, total, longest) in sorted(
+        summarise(results).items(), key=lambda item: -item[1][1]
+    ):
+        print(f"{step:>32} {count:>6} {total:>12.3f} {longest:>12.3f}")
+    print()
+    print(timings.report())
+
+    if args.profile:
+        print()
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(args.profile)
+
+    problems = [result for result in results if result["note"]]
+    for result in problems:
+        print(f"{result['t']:.3f} {result['step']}: {result['note']}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from .draft_buffers import BufferStore, DraftBuffer, buffer_key
+
+
+class BufferStoreTest(TestCase):
+    """
+    Tests BufferStore
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.buffer_directory = os.path.join(self.directory.name, "buffers")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_new_buffer_is_empty(self):
+        store = BufferStore(self.buffer_directory)
+
+        buffer = store.get("Shopping List")
+
+        self.assertEqual(buffer.name, "shopping_list")
+        self.assertEqual(buffer.text, "")
+        self.assertEqual(len(buffer.undo_stack), 0)
+
+    def test_evicts_least_recently_used_to_disk(self):
+        # Given more buffers than are kept in memory
+        store = BufferStore(self.buffer_directory, max_resident=2)
+        for name in ["one", "two", "three"]:
+            buffer = DraftBuffer(name, f"{name} text", (1, 2))
+            buffer.undo_stack.push("", (0, 0))
+            buffer.undo_stack.push(f"{name} text", (1, 2))
+            store.put(buffer)
+
+        # Then the least recently used one is on disk only
+        self.assertFalse(store.is_resident("one"))
+        self.assertTrue(store.is_resident("two"))
+        self.assertEqual(store.names(), ["one", "three", "two"])
+
+        # And when we switch back to it, it's loaded with its state intact
+        buffer = store.get("one")
+        self.assertEqual(buffer.text, "one text")
+        self.assertEqual(buffer.sel, (1, 2))
+        self.assertEqual(buffer.undo_stack.pop(), ("one text", (1, 2)))
+        self.assertEqual(buffer.undo_stack.pop(), ("", (0, 0)))
+
+        # Which pushes out the next least recently used
+        self.assertFalse(store.is_resident("two"))
+        self.assertTrue(store.is_resident("three"))
+
+    def test_save_all_writes_resident_buffers(self):
+        # Given a buffer that's only in memory
+        store = BufferStore(self.buffer_directory)
+        store.put(DraftBuffer("notes", "some notes", (3, 3)))
+        store.write_current("notes")
+
+        # When we save everything and start again from disk
+        store.save_all()
+        store = BufferStore(self.buffer_directory)
+
+        # Then the buffer and which one was current are still there
+        self.assertEqual(store.read_current(), "notes")
+        self.assertEqual(store.get("notes").text, "some notes")
+        self.assertEqual(store.names(), ["notes"])
+
+    def test_buffer_key(self):
+        self.assertEqual(buffer_key("Email to Bob!"), "email_to_bob")
+        self.assertEqual(buffer_key("  "), "default")
@@ -0,0 +1,50 @@
+from unittest import TestCase
+import random
+
+from .draft_document import PieceTable
+
+
+class PieceTableTest(TestCase):
+    """
+    Tests PieceTable
+    """
+
+    def test_edits_match_string(self):
+        # Given a piece table and a plain string with the same text
+        rng = random.Random(0)
+        text = "".join(rng.choice("ab \n") for _ in range(200))
+        table = PieceTable(text, max_pieces=50)
+
+        # When we make the same random edits to both
+        for _ in range(500):
+            start = rng.randint(0, len(text))
+            end = rng.randint(start, min(len(text), start + 10))
+            replacement = "".join(rng.choice("xyz") for _ in range(rng.randint(0, 5)))
+            table.replace(start, end, replacement)
+            text = text[:start] + replacement + text[end:]
+
+            # Then they always agree
+            self.assertEqual(len(table), len(text))
+            slice_start = rng.randint(0, len(text))
+            self.assertEqual(
+                table.slice(slice_start, slice_start + 20),
+                text[slice_start : slice_start + 20],
+            )
+        self.assertEqual(table.text(), text)
+
+    def test_empty(self):
+        table = PieceTable()
+        table.replace(0, 0, "hello")
+        table.replace(5, 5, " world")
+        table.replace(0, 11, "")
+
+        self.assertEqual(table.text(), "")
+        self.assertEqual(table.slice(0, 10), "")
+
+    def test_compacts_pieces(self):
+        table = PieceTable("x" * 100, max_pieces=10)
+        for i in range(20):
+            table.replace(i * 2, i * 2, "y")
+
+        self.assertLessEqual(len(table._pieces), 10)
+        self.assertEqual(table.text().count("y"), 20)
@@ -0,0 +1,130 @@
+from unittest import TestCase, mock
+import os
+import tempfile
+
+from . import draft_journal
+from .draft_journal import DraftJournal
+
+
+class DraftJournalTest(TestCase):
+    """
+    Tests DraftJournal
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "drafts", "journal.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reads_back_latest_text(self):
+        # Given a journal of a draft being dictated and edited
+        journal = DraftJournal(self.path, batch_delay=0)
+        texts = ["", "hello", "hello world", "hi world", "hi there world", ""]
+        for text in texts + ["x" * 100000, "x" * 50000 + "y" + "x" * 50000]:
+            journal.record(text)
+            journal.flush()
+
+            # Then reading it back gives the latest text every time
+            self.assertEqual(DraftJournal.read(self.path), text)
+
+    def test_no_journal(self):
+        self.assertIsNone(DraftJournal.read(self.path))
+        self.assertIsNone(DraftJournal(self.path).recover())
+
+    def test_compacts(self):
+        # Given a journal that has seen more edits than it keeps
+        journal = DraftJournal(self.path, compact_after=5, batch_delay=0)
+        text = ""
+        for i in range(12):
+            text += f"word{i} "
+            journal.record(text)
+            journal.flush()
+
+        # Then it has been rewritten, so it's short but has the latest text
+        with open(self.path) as f:
+            self.assertLessEqual(len(f.readlines()), 6)
+        self.assertEqual(DraftJournal.read(self.path), text)
+
+    def test_records_edits(self):
+        # Given a journal that doesn't have the text yet
+        journal = DraftJournal(self.path, compact_after=2, batch_delay=0)
+        self.assertFalse(journal.record_edit(0, 0, "hello"))
+
+        # When it's recorded, then edited
+        journal.record("hello world")
+        text = "hello world"
+        for start, end, replacement in [
+            (5, 5, ","),
+            (0, 1, "j"),
+            (6, 12, ""),
+            (0, 0, ""),
+        ]:
+            self.assertTrue(journal.record_edit(start, end, replacement))
+            text = text[:start] + replacement + text[end:]
+            journal.flush()
+
+            # Then reading it back gives the edited text every time
+            self.assertEqual(DraftJournal.read(self.path), text)
+
+        # And once it's reset it needs the text again
+        journal.reset()
+        self.assertFalse(journal.record_edit(0, 0, "x"))
+
+    def test_batches_writes(self):
+        journal = DraftJournal(self.path, batch_delay=0.05)
+        text = "start"
+        journal.record(text)
+        for i in range(20):
+            text += f" {i}"
+            journal.record(text)
+
+        journal.flush()
+
+        self.assertEqual(DraftJournal.read(self.path), text)
+
+    def test_ignores_line_torn_by_crash(self):
+        # Given a journal whose last write was cut short
+        journal = DraftJournal(self.path, batch_delay=0)
+        journal.record("one two")
+        journal.flush()
+        with open(self.path, "a") as f:
+            f.write('{"edit": [3, 3, " and')
+
+        # Then we get the text from before that write
+        self.assertEqual(DraftJournal(self.path).recover(), "one two")
+
+    def test_continues_after_recovery(self):
+        # Given a draft recovered from a previous session
+        previous = DraftJournal(self.path, batch_delay=0)
+        previous.record("one")
+        previous.flush()
+        journal = DraftJournal(self.path, batch_delay=0)
+        self.assertEqual(journal.recover(), "one")
+
+        # When we carry on editing it
+        journal.record("one two")
+        journal.flush()
+
+        # Then the edits are journaled on top of it
+        self.assertEqual(DraftJournal.read(self.path), "one two")
+
+    def test_recovers_from_failed_write(self):
+        # Given a journal with some text in it
+        journal = DraftJournal(self.path, batch_delay=0)
+        journal.record("hello")
+        journal.flush()
+
+        # When writing an edit fails
+        with mock.patch.object(
+            draft_journal, "open", side_effect=OSError("disk full"), create=True
+        ), self.assertLogs(level="ERROR"):
+            journal.record("hello world")
+            journal.flush()
+
+        # Then the next change is written in full, not as an edit to text the
+        # file never got
+        journal.record("hello world!")
+        journal.flush()
+        self.assertEqual(DraftJournal.read(self.path), "hello world!")
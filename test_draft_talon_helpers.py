@@ -0,0 +1,779 @@
+from .fake_talon import install_fake_talon
+
+# Stand in for the Talon imports when running outside Talon
+running_in_talon = not install_fake_talon()
+
+from unittest import TestCase, mock, skipIf
+import os
+import tempfile
+import threading
+
+if not running_in_talon:
+    from talon import actions, cron, settings, ui
+    from .fake_talon import reset_fake_talon
+    from .draft_journal import DraftJournal
+    from .draft_buffers import BufferStore
+    from .draft_trace import read_trace
+    from .replay_draft_trace import replay
+    from .draft_talon_helpers import (
+        Autosave,
+        DraftBuffers,
+        Tracing,
+        UndoWorkaround,
+        get_draft_manager,
+    )
+
+    draft_manager = get_draft_manager()
+
+
+@skipIf(running_in_talon, "Drives the fake Talon, not the real one")
+class DraftWindowTest(TestCase):
+    """
+    Tests the draft window end to end, through its actions
+    """
+
+    def setUp(self):
+        reset_fake_talon()
+        UndoWorkaround.stop_logger()
+        draft_manager.area.hide()
+        draft_manager.area.focus_on_show = True
+        draft_manager.set_text("")
+        draft_manager.area.sel = 0
+        self.journal_directory = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.journal_directory.name, "journal.jsonl")
+        Autosave.journal = DraftJournal(self.journal_path, batch_delay=0)
+        Autosave.recovered = True
+        DraftBuffers.store = BufferStore(
+            os.path.join(self.journal_directory.name, "buffers")
+        )
+        DraftBuffers.current = "default"
+
+    def tearDown(self):
+        actions.user.draft_hide()
+        Autosave.journal.flush()
+        self.journal_directory.cleanup()
+
+    def set_setting(self, name, value):
+        """Change a setting until the end of the test, and let it take effect."""
+        self.addCleanup(self._apply_setting, name, settings.get(name))
+        self._apply_setting(name, value)
+
+    @staticmethod
+    def _apply_setting(name, value):
+        settings.set(name, value)
+        cron.advance("100ms")
+
+    def test_show_focuses_window_with_text(self):
+        # When we open a draft
+        actions.user.draft_show("hello world")
+
+        # Then it has focus, with the text in it and labels drawn
+        self.assertEqual(ui.active_window().title, "Talon Draft")
+        self.assertEqual(actions.user.draft_get_text(), "hello world")
+        self.assertEqual(
+            [anchor for _, anchor in draft_manager.area.labels], ["a", "b"]
+        )
+
+    def test_select_and_delete_by_anchor(self):
+        actions.user.draft_show("one two three")
+
+        actions.user.draft_select("b", "", 1, 1)
+        actions.key("backspace")
+
+        self.assertEqual(actions.user.draft_get_text(), "one three")
+
+    def test_delete_several_anchors_in_one_step(self):
+        # Given a draft with an earlier edit that hasn't settled yet
+        actions.user.draft_show("one two three four five six")
+        actions.insert("! ")
+
+        # When we delete several words and a range of words at once
+        actions.user.draft_delete("b and d to f")
+
+        # Then they're all gone
+        self.assertEqual(actions.user.draft_get_text(), "! two six")
+
+        # And one undo puts them all back, leaving the earlier edit
+        cron.advance("1s")
+        actions.edit.undo()
+        self.assertEqual(actions.user.draft_get_text(), "! one two three four five six")
+
+    def test_replace_anchor(self):
+        actions.user.draft_show("one two three")
+
+        actions.user.draft_replace("b", "2")
+
+        self.assertEqual(actions.user.draft_get_text(), "one 2 three")
+        self.assertEqual(draft_manager.area.sel.left, 5)
+
+    def test_change_case_of_range(self):
+        # Given a draft with the cursor at the end
+        actions.user.draft_show("make these words snake case")
+        draft_manager.area.sel = len("make these words snake case")
+
+        # When we change the case of some words in the middle
+        actions.user.draft_change_case("b to c", "snake")
+
+        # Then they're joined up, and the cursor is still at the end
+        self.assertEqual(actions.user.draft_get_text(), "make these_words snake case")
+        self.assertEqual(
+            draft_manager.area.sel.left, len("make these_words snake case")
+        )
+
+        # And a single word can be changed too
+        actions.user.draft_change_case("a", "upper")
+        self.assertEqual(actions.user.draft_get_text(), "MAKE these_words snake case")
+
+        # But more than one word or range is an error, which changes nothing
+        with self.assertRaises(RuntimeError):
+            actions.user.draft_change_case("a c", "upper")
+        self.assertEqual(actions.user.draft_get_text(), "MAKE these_words snake case")
+
+    def test_two_character_labels(self):
+        # Given two character labels are turned on
+        self.set_setting("user.draft_window_two_character_labels", 1)
+        words = [f"word{i}" for i in range(100)]
+        actions.user.draft_show(" ".join(words))
+
+        # Then every word gets a label
+        self.assertEqual(len(draft_manager.area.labels), 100)
+
+        # And they can be used like single character ones
+        actions.user.draft_delete("ab to ad and dv")
+        self.assertEqual(actions.user.draft_get_text().split()[:2], ["word0", "word4"])
+        self.assertNotIn("word99", actions.user.draft_get_text())
+
+        # And spoken letter by letter, with spaces between
+        actions.user.draft_select("a a")
+        self.assertEqual(actions.edit.selected_text(), "word0")
+        actions.user.draft_position_caret("a b", 1)
+        self.assertEqual(draft_manager.area.sel.left, len("word0 word4"))
+
+    def test_two_character_labels_survive_edits(self):
+        # Given two character labels on a short draft
+        self.set_setting("user.draft_window_two_character_labels", 1)
+        words = [f"word{i}" for i in range(20)]
+        actions.user.draft_show(" ".join(words))
+        before = {
+            draft_manager.area.value[span.left : span.right]: anchor
+            for span, anchor in draft_manager.area.labels
+        }
+
+        # When a word is inserted at the start
+        draft_manager.area.sel = 0
+        actions.insert("new ")
+
+        # Then every other word keeps its label, and the new one gets its own
+        after = {
+            draft_manager.area.value[span.left : span.right]: anchor
+            for span, anchor in draft_manager.area.labels
+        }
+        self.assertEqual({word: after[word] for word in words}, before)
+        self.assertNotIn(after["new"], before.values())
+        actions.user.draft_select(after["word3"])
+        self.assertEqual(actions.edit.selected_text(), "word3")
+
+    def test_changing_labels_redraws(self):
+        # Given a window showing single character labels
+        actions.user.draft_show("one two three four")
+        self.assertEqual(
+            [anchor for _, anchor in draft_manager.area.labels], ["a", "b", "c", "d"]
+        )
+
+        # When two character labels are turned on, then the window is redrawn
+        # with them
+        self.set_setting("user.draft_window_two_character_labels", 1)
+        anchors = [anchor for _, anchor in draft_manager.area.labels]
+        self.assertEqual(len(anchors), 4)
+        self.assertTrue(all(len(anchor) == 2 for anchor in anchors))
+
+        # And they're the ones commands use
+        actions.user.draft_select(anchors[1])
+        self.assertEqual(actions.edit.selected_text(), "two")
+        with self.assertRaises(RuntimeError):
+            actions.user.draft_select("b")
+
+    def test_unknown_tokenizer_falls_back_to_words(self):
+        # Given a misspelt tokenizer
+        with self.assertLogs(level="WARNING"):
+            self.set_setting("user.draft_window_tokenizer", "subwords")
+
+        # Then the window still works, splitting on whitespace
+        actions.user.draft_show("one snake_case")
+        self.assertEqual(draft_manager.tokenizer, "word")
+        actions.user.draft_select("b")
+        self.assertEqual(actions.edit.selected_text(), "snake_case")
+
+    def test_labels_stay_put_inside_margin(self):
+        # Given labels that only move when the cursor nears their edge
+        self.set_setting("user.draft_window_label_margin", 5)
+        text = " ".join(f"word{i}" for i in range(100))
+        actions.user.draft_show(text)
+        snapshot = draft_manager.label_snapshot
+        labels = draft_manager.area.labels
+        self.assertEqual(len(labels), 66)
+
+        # When we move the cursor a few words, then they're left as they were
+        draft_manager.area.sel = text.index("word50")
+        self.assertIs(draft_manager.label_snapshot, snapshot)
+
+        # And typing doesn't move them either
+        actions.insert("new ")
+        self.assertEqual(draft_manager.area.labels[:50], labels[:50])
+        actions.user.draft_select("a")
+        self.assertEqual(actions.edit.selected_text(), "word0")
+
+        # But they move once the cursor gets near the edge
+        draft_manager.area.sel = draft_manager.area.value.index("word62")
+        self.assertNotEqual(draft_manager.area.labels[0], labels[0])
+
+    def test_line_and_paragraph_commands(self):
+        actions.user.draft_show("first para\nstill first\n\nsecond para")
+
+        actions.user.draft_go_line(2)
+        self.assertEqual(draft_manager.area.sel.left, 11)
+        actions.user.draft_line_edge()
+        self.assertEqual(draft_manager.area.sel.left, 22)
+        actions.user.draft_select_paragraph()
+        self.assertEqual(actions.edit.selected_text(), "first para\nstill first")
+        actions.user.draft_select_line(4)
+        self.assertEqual(actions.edit.selected_text(), "second para")
+
+    def test_jump_to_word(self):
+        # Given a draft with a word far from the caret, out of reach of the labels
+        actions.user.draft_show("Target, " + "filler " * 200 + "target and target")
+        draft_manager.area.sel = 0
+
+        # When we jump to it, then we go to the closest one
+        actions.user.draft_jump("target")
+        self.assertEqual(draft_manager.area.sel.left, 0)
+
+        # And next and previous go through them all, wrapping around
+        actions.user.draft_jump("target", "next")
+        self.assertEqual(draft_manager.area.sel.left, 1408)
+        actions.user.draft_jump("target", "next")
+        self.assertEqual(draft_manager.area.sel.left, 1419)
+        actions.user.draft_jump("target", "next")
+        self.assertEqual(draft_manager.area.sel.left, 0)
+        actions.user.draft_jump("target", "previous")
+        self.assertEqual(draft_manager.area.sel.left, 1419)
+
+    def test_jump_past_punctuated_words(self):
+        # Given matches with punctuation in front of them
+        text = 'a target then "target and (target end'
+        actions.user.draft_show(text)
+        draft_manager.area.sel = len(text)
+
+        # Then previous steps back through each of them, rather than sticking on
+        # the one the caret's already at
+        starts = []
+        for _ in range(4):
+            actions.user.draft_jump("target", "previous")
+            starts.append(draft_manager.area.sel.left)
+        self.assertEqual(starts, [27, 15, 2, 27])
+
+        # And next goes forwards through them the same way
+        actions.user.draft_jump("target", "next")
+        self.assertEqual(draft_manager.area.sel.left, 2)
+        actions.user.draft_jump("target", "next")
+        self.assertEqual(draft_manager.area.sel.left, 15)
+
+    def test_replace_word_everywhere(self):
+        actions.user.draft_show("Colour, colour and more colour.")
+
+        actions.user.draft_replace_word("colour", "color")
+
+        self.assertEqual(actions.user.draft_get_text(), "color, color and more color.")
+
+    def test_position_caret_after_anchor(self):
+        actions.user.draft_show("one two three")
+
+        actions.user.draft_position_caret("b", 1)
+        actions.insert("!")
+
+        self.assertEqual(actions.user.draft_get_text(), "one two! three")
+
+    def test_undo_and_redo_dictation(self):
+        # Given a draft we've dictated into in two bursts
+        actions.user.draft_show("")
+        actions.insert("hello")
+        cron.advance("1s")
+        actions.insert(" world")
+        cron.advance("1s")
+
+        # When we undo, then we go back a burst at a time
+        actions.edit.undo()
+        self.assertEqual(actions.user.draft_get_text(), "hello")
+        actions.edit.undo()
+        self.assertEqual(actions.user.draft_get_text(), "")
+
+        # And redo goes forward again
+        actions.edit.redo()
+        self.assertEqual(actions.user.draft_get_text(), "hello")
+
+    def test_undo_steps_wait_for_text_to_settle(self):
+        actions.user.draft_show("")
+        for word in ["one ", "two ", "three "]:
+            actions.insert(word)
+            cron.advance("100ms")
+        cron.advance("1s")
+
+        actions.edit.undo()
+
+        self.assertEqual(actions.user.draft_get_text(), "")
+
+    def test_idle_draft_schedules_nothing(self):
+        actions.user.draft_show("some text")
+        actions.insert(" more")
+        cron.advance("1s")
+
+        self.assertEqual(cron.pending, 0)
+
+    def test_finish_pastes_into_previous_window(self):
+        actions.user.draft_show("finished text")
+
+        actions.user.draft_finish()
+
+        self.assertFalse(draft_manager.area.showing)
+        self.assertEqual(ui.active_window(), ui.editor_window)
+        self.assertEqual(actions.clipboard, "finished text")
+        self.assertIn(("edit.paste", ()), actions.calls)
+
+    def test_show_returns_when_focus_event_arrives(self):
+        # Given a window that takes a while to get focus
+        draft_manager.area.focus_on_show = False
+        timer = threading.Timer(0.05, lambda: ui.focus(draft_manager.area._window))
+        timer.start()
+
+        # When we show it
+        draft_manager.show("text")
+        timer.join()
+
+        # Then we stop waiting once it has focus, well before the timeout. The
+        # upper bound is loose, so a busy machine doesn't fail the test.
+        self.assertEqual(ui.active_window().title, "Talon Draft")
+        self.assertGreaterEqual(draft_manager.last_focus_wait, 0.04)
+        self.assertLess(draft_manager.last_focus_wait, 2)
+
+    def test_focus_wait_times_out(self):
+        draft_manager.area.focus_on_show = False
+        draft_manager.area.show()
+
+        draft_manager._wait_for_focus(True, timeout=0.1)
+
+        self.assertGreaterEqual(draft_manager.last_focus_wait, 0.1)
+        self.assertLess(draft_manager.last_focus_wait, 2)
+
+    def test_autosaves_and_recovers_draft(self):
+        # Given a draft we were dictating into
+        actions.user.draft_show("")
+        actions.insert("important words")
+        cron.advance("1s")
+
+        # When Talon restarts and we show the window again
+        Autosave.journal.flush()
+        draft_manager.area.value = ""
+        Autosave.journal = DraftJournal(self.journal_path)
+        Autosave.recovered = False
+        actions.user.draft_show()
+
+        # Then the draft is back
+        self.assertEqual(actions.user.draft_get_text(), "important words")
+
+    def test_unrecovered_draft_is_kept_in_a_buffer(self):
+        # Given a draft we were dictating into
+        actions.user.draft_show("")
+        actions.insert("important words")
+        cron.advance("1s")
+
+        # When Talon restarts and the window is opened with other text
+        Autosave.journal.flush()
+        draft_manager.area.value = ""
+        Autosave.journal = DraftJournal(self.journal_path)
+        Autosave.recovered = False
+        actions.user.draft_show("something else")
+        Autosave.journal.flush()
+
+        # Then the window has the new text, and the journal follows it
+        self.assertEqual(actions.user.draft_get_text(), "something else")
+        self.assertEqual(DraftJournal.read(self.journal_path), "something else")
+
+        # But the old draft is in its own buffer
+        actions.user.draft_buffer("recovered")
+        self.assertEqual(actions.user.draft_get_text(), "important words")
+
+    def test_cancelled_draft_is_not_recovered(self):
+        actions.user.draft_show("")
+        actions.insert("throwaway")
+        actions.user.draft_cancel()
+
+        Autosave.journal.flush()
+        Autosave.journal = DraftJournal(self.journal_path)
+        Autosave.recovered = False
+        actions.user.draft_show()
+
+        self.assertEqual(actions.user.draft_get_text(), "")
+
+    def test_buffers_keep_their_own_text_and_undo(self):
+        # Given a draft in the default buffer
+        actions.user.draft_show("")
+        actions.insert("first draft")
+        cron.advance("1s")
+
+        # When we switch to another buffer and write in that
+        actions.user.draft_buffer("notes")
+        self.assertEqual(actions.user.draft_get_text(), "")
+        actions.insert("some notes")
+        cron.advance("1s")
+
+        # Then switching back brings back the first draft and its history
+        actions.user.draft_buffer("default")
+        self.assertEqual(actions.user.draft_get_text(), "first draft")
+        actions.edit.undo()
+        self.assertEqual(actions.user.draft_get_text(), "")
+
+        # And the other buffer is still there
+        actions.user.draft_buffer("notes")
+        self.assertEqual(actions.user.draft_get_text(), "some notes")
+        self.assertEqual(actions.user.draft_buffer_list(), "default, notes")
+
+    def test_buffers_survive_restart(self):
+        # Given two buffers, with the window hidden while showing the second
+        actions.user.draft_show("")
+        actions.insert("first draft")
+        actions.user.draft_buffer("notes")
+        actions.insert("some notes")
+        cron.advance("1s")
+        actions.user.draft_hide()
+
+        # When Talon restarts and we show the window again
+        Autosave.journal.flush()
+        draft_manager.area.value = ""
+        Autosave.journal = DraftJournal(self.journal_path)
+        Autosave.recovered = False
+        DraftBuffers.store = BufferStore(DraftBuffers.store.directory)
+        DraftBuffers.current = "default"
+        actions.user.draft_show()
+
+        # Then the draft is recovered into the buffer it was written in
+        self.assertEqual(actions.user.draft_get_text(), "some notes")
+        self.assertEqual(DraftBuffers.current, "notes")
+
+        # And the other buffer was saved too, though it was never evicted
+        actions.user.draft_buffer("default")
+        self.assertEqual(actions.user.draft_get_text(), "first draft")
+
+    def test_large_document_is_paged(self):
+        # Given a draft much bigger than a page
+        self.set_setting("user.draft_window_large_document_kb", 1)
+        self.addCleanup(setattr, draft_manager, "page_chars", 50000)
+        draft_manager.page_chars = 400
+        lines = [f"line {i} of the document" for i in range(200)]
+        actions.user.draft_show("\n".join(lines))
+
+        # Then only a page of it is in the window
+        self.assertLessEqual(len(draft_manager.area.value), 400)
+        self.assertTrue(draft_manager.area.value.startswith("line 0 "))
+
+        # When we edit near the end of the page and wait
+        draft_manager.area.sel = len(draft_manager.area.value) - 10
+        actions.insert("!")
+        cron.advance("1s")
+
+        # Then the window moves on to the next page, starting on a new line
+        self.assertGreater(draft_manager.page_start, 0)
+        self.assertEqual(
+            draft_manager.document.slice(
+                draft_manager.page_start - 1, draft_manager.page_start
+            ),
+            "\n",
+        )
+
+        # And the caret is still just after the edit
+        left, _ = draft_manager.get_selection()
+        self.assertEqual(draft_manager.document.slice(left - 1, left), "!")
+
+        # And finishing gives the whole text, with the edit in it
+        actions.user.draft_finish()
+        text = actions.clipboard
+        self.assertEqual(text.count("\n"), 199)
+        self.assertEqual(text.count("!"), 1)
+        self.assertEqual(len(text), len("\n".join(lines)) + 1)
+
+    def test_paged_draft_is_journaled_as_it_changes(self):
+        # Given a paged draft
+        self.set_setting("user.draft_window_large_document_kb", 1)
+        self.addCleanup(setattr, draft_manager, "page_chars", 50000)
+        draft_manager.page_chars = 400
+        original = "\n".join(f"line {i} of the document" for i in range(200))
+        actions.user.draft_show(original)
+
+        # When we dictate into it and pause, without hiding the window
+        draft_manager.area.sel = 4
+        actions.insert("A")
+        cron.advance("1s")
+
+        # Then the whole draft is in the journal, edit and all
+        Autosave.journal.flush()
+        self.assertEqual(
+            DraftJournal.read(self.journal_path), original[:4] + "A" + original[4:]
+        )
+
+    def test_paged_commands_cover_whole_draft(self):
+        # Given a paged draft, showing the first page
+        self.set_setting("user.draft_window_large_document_kb", 1)
+        self.addCleanup(setattr, draft_manager, "page_chars", 50000)
+        draft_manager.page_chars = 400
+        lines = [f"line {i} of the document" for i in range(200)]
+        actions.user.draft_show("\n".join(lines))
+
+        # When we go to a line on another page
+        actions.user.draft_go_line(150)
+
+        # Then the caret is at the start of that line of the whole text
+        left, _ = draft_manager.get_selection()
+        self.assertEqual(left, len("\n".join(lines[:149])) + 1)
+        self.assertTrue(
+            draft_manager.area.value[draft_manager.area.sel.left :].startswith(
+                "line 149 "
+            )
+        )
+
+        # And selecting a line selects that line of the whole text
+        actions.user.draft_select_line(3)
+        self.assertEqual(actions.edit.selected_text(), "line 2 of the document")
+
+        # And jumping to a word finds it off the page
+        actions.user.draft_jump("199")
+        left, _ = draft_manager.get_selection()
+        self.assertEqual(draft_manager.get_text()[left : left + 3], "199")
+
+        # And replacing a word replaces it everywhere
+        actions.user.draft_replace_word("document", "draft")
+        text = draft_manager.get_text()
+        self.assertEqual(text.count("document"), 0)
+        self.assertEqual(text.count("draft"), 200)
+
+        # While editing by label changes the word labelled on the page
+        page_start = draft_manager.page_start
+        draft_manager.area.sel = 0
+        before = draft_manager.get_text()
+        word_end = before.index(" ", page_start)
+        actions.user.draft_replace("a", "first")
+        self.assertEqual(
+            draft_manager.get_text(), before[:page_start] + "first" + before[word_end:]
+        )
+
+    def test_undo_history_follows_pages(self):
+        # Given a paged draft
+        self.set_setting("user.draft_window_large_document_kb", 1)
+        self.addCleanup(setattr, draft_manager, "page_chars", 50000)
+        draft_manager.page_chars = 400
+        original = "\n".join(f"line {i} of the document" for i in range(200))
+        actions.user.draft_show(original)
+
+        # When we edit the first page, then move the caret to another page and
+        # edit there
+        draft_manager.area.sel = 4
+        actions.insert("A")
+        cron.advance("1s")
+        draft_manager.set_selection(len(original) - 5, len(original) - 5)
+        cron.advance("1s")
+        self.assertGreater(draft_manager.page_start, 0)
+        actions.insert("B")
+        cron.advance("1s")
+
+        # Then undo takes back both edits, across the pages
+        actions.edit.undo()
+        self.assertEqual(draft_manager.get_text(), original[:4] + "A" + original[4:])
+        self.assertEqual(
+            draft_manager.get_selection(), (len(original) - 5, len(original) - 5)
+        )
+        actions.edit.undo()
+        self.assertEqual(draft_manager.get_text(), original)
+
+        # And redo puts them back
+        actions.edit.redo()
+        actions.edit.redo()
+        self.assertEqual(draft_manager.get_text().count("B"), 1)
+        self.assertEqual(draft_manager.get_text().count("A"), 1)
+
+    def test_paged_edits_logged_without_joining_draft(self):
+        # Given a paged draft
+        self.set_setting("user.draft_window_large_document_kb", 1)
+        self.addCleanup(setattr, draft_manager, "page_chars", 50000)
+        draft_manager.page_chars = 400
+        original = "\n".join(f"line {i} of the document" for i in range(200))
+        edited = original[:4] + "A" + original[4:]
+        actions.user.draft_show(original)
+        cron.advance("1s")
+
+        # When we edit two pages before the text settles, then edit again
+        with mock.patch.object(
+            draft_manager.document, "text", side_effect=AssertionError
+        ) as text:
+            draft_manager.area.sel = 4
+            actions.insert("A")
+            draft_manager.set_selection(len(edited) - 5, len(edited) - 5)
+            actions.insert("B")
+            cron.advance("1s")
+            actions.key("backspace")
+            cron.advance("1s")
+
+            # Then the undo history and journal were updated without joining up
+            # the whole draft
+            text.assert_not_called()
+
+        Autosave.journal.flush()
+        self.assertEqual(DraftJournal.read(self.journal_path), edited)
+        actions.edit.undo()
+        self.assertEqual(draft_manager.get_text(), edited[:-5] + "B" + edited[-5:])
+        actions.edit.undo()
+        self.assertEqual(draft_manager.get_text(), original)
+
+    def hold_label_worker(self):
+        """Block the label worker until the returned event is set."""
+        started = threading.Event()
+        release = threading.Event()
+        draft_manager.label_worker.submit(
+            None, lambda: started.set() or release.wait(5) and None
+        )
+        started.wait(5)
+        self.addCleanup(release.set)
+        return release
+
+    def test_labels_in_background(self):
+        # Given a draft big enough to be labelled in the background
+        self.set_setting("user.draft_window_two_character_labels", 1)
+        self.set_setting("user.draft_window_background_labels_kb", 1)
+        # Keep the worker busy until we're ready for it
+        release = self.hold_label_worker()
+        actions.user.draft_show("one two three " + "filler " * 200)
+
+        # Then it's drawn without labels, as there are none for this text yet,
+        # and anchors can't be used until there are
+        self.assertEqual(draft_manager.area.labels, [])
+        with self.assertRaises(RuntimeError):
+            actions.user.draft_select("ab")
+
+        # When the labels are ready, then the window is redrawn with them
+        release.set()
+        self.assertTrue(draft_manager.label_worker.wait(5))
+        cron.advance("1ms")
+        self.assertEqual(draft_manager.area.labels[1][1], "ab")
+        actions.user.draft_select("ab")
+        self.assertEqual(actions.edit.selected_text(), "two")
+
+        # And moving the cursor keeps the labels on screen usable while new
+        # ones are worked out
+        draft_manager.area.sel = 0
+        actions.user.draft_select("ac")
+        self.assertEqual(actions.edit.selected_text(), "three")
+
+        # And once the text changes, the old labels are no longer drawn or used
+        release = self.hold_label_worker()
+        draft_manager.area.sel = 0
+        actions.insert("zero ")
+        self.assertEqual(draft_manager.area.labels, [])
+        with self.assertRaises(RuntimeError):
+            actions.user.draft_select("ab")
+
+        # Until the new ones are ready, which keep the labels the words had
+        release.set()
+        draft_manager.label_worker.wait(5)
+        cron.advance("1ms")
+        actions.user.draft_select("ab")
+        self.assertEqual(actions.edit.selected_text(), "two")
+
+    def test_single_character_labels_drawn_straight_away(self):
+        # Given a draft over the background labelling size
+        self.set_setting("user.draft_window_background_labels_kb", 1)
+        actions.user.draft_show("one two three " + "filler " * 200)
+
+        # When we type, then the labels are redrawn straight away, as only the
+        # words on screen need labelling
+        draft_manager.area.sel = 0
+        actions.insert("zero ")
+        self.assertEqual(draft_manager.area.labels[1][1], "b")
+        actions.user.draft_select("b")
+        self.assertEqual(actions.edit.selected_text(), "one")
+
+    def test_style_updates_are_coalesced(self):
+        # Given the window has been drawn
+        actions.user.draft_show("text")
+        theme = draft_manager.area.theme
+
+        # When settings that aren't the draft window's change, nothing happens
+        settings.set("user.some_other_setting", 1)
+        self.assertEqual(cron.pending, 0)
+
+        # And a burst of draft window changes is applied once, at the end
+        settings.set("user.draft_window_text_size", 30)
+        settings.set("user.draft_window_label_size", 30)
+        self.assertIs(draft_manager.area.theme, theme)
+        cron.advance("100ms")
+        self.assertEqual(draft_manager.area.theme.changes["text_size"], 30)
+        self.assertEqual(draft_manager.area.theme.changes["label_size"], 30)
+
+        # And changing back reuses the theme built before
+        settings.set("user.draft_window_text_size", 20)
+        settings.set("user.draft_window_label_size", 20)
+        cron.advance("100ms")
+        self.assertIs(draft_manager.area.theme, theme)
+
+    def test_trace_and_replay_session(self):
+        # Given tracing is turned on
+        self.set_setting("user.draft_window_trace", 1)
+
+        # When we dictate, edit and undo, then turn tracing off
+        actions.user.draft_show("")
+        actions.insert("one two three four")
+        cron.advance("1s")
+        actions.user.draft_select("b", "c")
+        actions.insert("2 3")
+        cron.advance("1s")
+        actions.user.draft_delete("a")
+        cron.advance("1s")
+        actions.edit.undo()
+        final_text = actions.user.draft_get_text()
+        actions.user.draft_hide()
+        trace_path = Tracing.recorder.path
+        settings.set("user.draft_window_trace", 0)
+        cron.advance("100ms")
+        actions.user.draft_show()
+
+        # Then the trace has the actions, outermost only
+        entries = read_trace(trace_path)
+        self.assertEqual(
+            [entry["action"] for entry in entries if "action" in entry],
+            [
+                "user.draft_show",
+                "user.draft_select",
+                "user.draft_delete",
+                "edit.undo",
+                "user.draft_get_text",
+                "user.draft_hide",
+            ],
+        )
+
+        # And replaying it does the same, step by step
+        results = replay(entries)
+        self.assertEqual([result["note"] for result in results], [""] * len(results))
+        # The text before we started, then the two bits of dictation
+        self.assertEqual([result["step"] for result in results].count("edit"), 3)
+        self.assertEqual(draft_manager.area.value, final_text)
+
+    def test_timing_report(self):
+        # Given timing is turned on
+        self.set_setting("user.draft_window_timing", 1)
+        actions.user.draft_timing_reset()
+
+        # When we use the draft window
+        actions.user.draft_show("one two three")
+        actions.user.draft_select("b")
+        actions.user.draft_finish()
+
+        # Then the report covers what we did
+        report = actions.user.draft_timing_report()
+        for operation in ["show", "labels", "anchor_to_range", "draft_finish"]:
+            self.assertIn(operation, report)
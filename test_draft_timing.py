@@ -0,0 +1,84 @@
+from unittest import TestCase
+import threading
+
+from .draft_timing import OperationTimings
+
+
+class OperationTimingsTest(TestCase):
+    """
+    Tests OperationTimings
+    """
+
+    def test_records_nothing_when_disabled(self):
+        timings = OperationTimings()
+
+        with timings.measure("op"):
+            pass
+        timings.timed("op")(lambda: None)()
+        timings.record("op", 1.0)
+
+        self.assertIsNone(timings.stats("op"))
+
+    def test_percentiles(self):
+        timings = OperationTimings()
+        timings.enabled = True
+
+        for ms in range(1, 101):
+            timings.record("op", ms / 1000)
+
+        stats = timings.stats("op")
+        self.assertEqual(stats["count"], 100)
+        self.assertEqual(stats["p50"], 0.050)
+        self.assertEqual(stats["p90"], 0.090)
+        self.assertEqual(stats["p99"], 0.099)
+        self.assertEqual(stats["max"], 0.100)
+
+    def test_keeps_rolling_window(self):
+        timings = OperationTimings(window=10)
+        timings.enabled = True
+
+        for ms in range(100):
+            timings.record("op", ms / 1000)
+
+        stats = timings.stats("op")
+        self.assertEqual(stats["count"], 10)
+        self.assertEqual(stats["p50"], 0.094)
+
+    def test_timed_and_measure_record_calls(self):
+        timings = OperationTimings()
+        timings.enabled = True
+
+        @timings.timed("decorated")
+        def add(a, b):
+            return a + b
+
+        self.assertEqual(add(1, 2), 3)
+        with timings.measure("block"):
+            pass
+
+        self.assertEqual(timings.stats("decorated")["count"], 1)
+        self.assertEqual(timings.stats("block")["count"], 1)
+        self.assertIn("decorated", timings.report())
+
+    def test_records_from_several_threads(self):
+        # Given threads recording while the report is read
+        timings = OperationTimings(window=10000)
+        timings.enabled = True
+
+        def record(name):
+            for _ in range(1000):
+                timings.record(name, 0.001)
+
+        threads = [
+            threading.Thread(target=record, args=(f"op{i % 2}",)) for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            timings.report()
+        for thread in threads:
+            thread.join()
+
+        # Then every duration is counted
+        self.assertEqual(timings.stats("op0")["count"], 2000)
+        self.assertEqual(timings.stats("op1")["count"], 2000)
@@ -0,0 +1,52 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from .draft_trace import TraceRecorder, read_trace
+
+
+class TraceRecorderTest(TestCase):
+    """
+    Tests TraceRecorder
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "traces", "trace.jsonl")
+        self.time = 0.0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_records_changes_and_actions(self):
+        # Given a recorder with a clock we control
+        recorder = TraceRecorder(self.path, clock=lambda: self.time)
+
+        # When we dictate, run an action and dictate some more
+        recorder.record_state("hello", (5, 5))
+        self.time = 1.5
+        recorder.record_action("user.draft_select", ("a",), {}, 0.002)
+        recorder.record_state("hello", (0, 5), result=True)
+        recorder.record_state("hello", (0, 5))
+        recorder.record_state("goodbye", (7, 7))
+        recorder.close()
+
+        # Then the text is written once, then only what changed
+        self.assertEqual(
+            read_trace(self.path),
+            [
+                {"text": "hello", "sel": [5, 5], "t": 0.0},
+                {"action": "user.draft_select", "args": ["a"], "ms": 2.0, "t": 1.5},
+                {"edit": [5, 5, ""], "sel": [0, 5], "result": True, "t": 1.5},
+                {"edit": [0, 5, "goodbye"], "sel": [7, 7], "t": 1.5},
+            ],
+        )
+
+    def test_ignores_line_torn_by_crash(self):
+        recorder = TraceRecorder(self.path)
+        recorder.record_state("one", (0, 0))
+        recorder.close()
+        with open(self.path, "a") as f:
+            f.write('{"action": "user.dra')
+
+        self.assertEqual(len(read_trace(self.path)), 1)
@@ -1,27 +1,39 @@
-try:
-    import talon.experimental.textarea
-    running_in_talon = True
-except ModuleNotFoundError:
-    # Some shenanigans to stub out the Talon imports
-    import imp, sys
-    name = "talon.experimental.textarea"
-    module = imp.new_module(name)
-    sys.modules[name] = module
-    exec(
-        "\n".join([
-            "TextArea = 1",
-            "Span = 1",
-            "DarkThemeLabels = 1",
-            "LightThemeLabels = 1"
-        ]),
-        module.__dict__
-    )
-    running_in_talon = False
-
-from unittest import TestCase
-from functools import wraps
-
-from .draft_ui import calculate_text_anchors
+from .fake_talon import install_fake_talon
+
+# Stand in for the Talon imports when running outside Talon
+running_in_talon = not install_fake_talon()
+
+from unittest import TestCase, mock, skipIf
+import random
+import re
+import sys
+
+from .draft_ui import (
+    CASE_TRANSFORMS,
+    calculate_range_anchors,
+    calculate_text_anchors,
+    edit_text_spans,
+    index_text_anchors,
+    locate_visible_text,
+    carry_labels,
+    ordinal_text_anchors,
+    parse_anchor_spans,
+)
+from talon.experimental.textarea import Span
+from . import draft_index
+from .draft_reference import reference_text_anchors
+from .draft_index import (
+    TOKENIZERS,
+    LineIndex,
+    WordOffsetIndex,
+    WordSpanIndex,
+    get_numpy,
+    numpy_word_spans,
+    text_difference,
+    use_numpy_spans,
+    word_key,
+    word_matcher,
+)
 
 
 class CalculateAnchorsTest(TestCase):
@@ -31,9 +43,9 @@ class CalculateAnchorsTest(TestCase):
 
     def test_finds_anchors(self):
         examples = [
-            ("one-word", [("a", 0, 8, 8)]),
-            ("two words", [("a", 0, 3, 4), ("b", 4, 9, 9)]),
-            ("two\nwords", [("a", 0, 3, 4), ("b", 4, 9, 9)]),
+            ("one-word", [("a", 0, 8, 0, 8)]),
+            ("two words", [("a", 0, 3, 0, 4), ("b", 4, 9, 3, 9)]),
+            ("two\nwords", [("a", 0, 3, 0, 4), ("b", 4, 9, 3, 9)]),
         ]
         anchor_labels = ["a", "b"]
         for text, expected in examples:
@@ -49,23 +61,23 @@ class CalculateAnchorsTest(TestCase):
         # In these examples the cursor is at the asterisk which is stripped by the test
         # code. Indicies after the asterisk have to take this into account.
         examples = [
-            ("one*-word", [("a", 0, 8, 8)]),
-            ("one-word*", [("a", 0, 8, 8)]),
+            ("one*-word", [("a", 0, 8, 0, 8)]),
+            ("one-word*", [("a", 0, 8, 0, 8)]),
             (
                 "the three words*",
-                [("a", 0, 3, 4), ("b", 4, 9, 10), ("c", 10, 15, 15)]
+                [("a", 0, 3, 0, 4), ("b", 4, 9, 3, 10), ("c", 10, 15, 9, 15)]
             ),
             (
                 "*the three words",
-                [("a", 0, 3, 4), ("b", 4, 9, 10), ("c", 10, 15, 15)]
+                [("a", 0, 3, 0, 4), ("b", 4, 9, 3, 10), ("c", 10, 15, 9, 15)]
             ),
             (
                 "too many* words for the number of anchors",
-                [("a", 0, 3, 4), ("b", 4, 8, 9), ("c", 9, 14, 15)]
+                [("a", 0, 3, 0, 4), ("b", 4, 8, 3, 9), ("c", 9, 14, 8, 15)]
             ),
             (
                 "too many words fo*r the number of anchors",
-                [("a", 9, 14, 15), ("b", 15, 18, 19), ("c", 19, 22, 23)]
+                [("a", 9, 14, 8, 15), ("b", 15, 18, 14, 19), ("c", 19, 22, 18, 23)]
             ),
         ]
         anchor_labels = ["a", "b", "c"]
@@ -84,3 +96,559 @@ class CalculateAnchorsTest(TestCase):
 
             # Then it matches what we expect
             self.assertEqual(result, expected, text)
+
+    def test_matches_reference_implementation(self):
+        rng = random.Random(0)
+        anchor_labels = ["a", "b", "c", "d"]
+        for _ in range(200):
+            # Given some text with awkward whitespace
+            text = "".join(rng.choice("ab  \t\n.") for _ in range(rng.randint(0, 30)))
+            for cursor_pos in range(len(text) + 2):
+                # When we calculate the result
+                result = list(
+                    calculate_text_anchors(text, cursor_pos, anchor_labels)
+                )
+
+                # Then it matches the reference implementation
+                expected = reference_text_anchors(text, cursor_pos, anchor_labels)
+                self.assertEqual(result, expected, (text, cursor_pos))
+
+
+class CalculateRangeAnchorsTest(TestCase):
+    """
+    Tests calculate_range_anchors and locate_visible_text
+    """
+
+    text = "one two\n  three\tfour  five\nsix seven eight nine ten"
+
+    def test_whole_range_matches_reference(self):
+        anchor_labels = ["a", "b", "c"]
+        for cursor_pos in range(len(self.text) + 1):
+            result = calculate_range_anchors(
+                self.text, 0, len(self.text), cursor_pos, anchor_labels
+            )
+            expected = reference_text_anchors(self.text, cursor_pos, anchor_labels)
+            self.assertEqual(result, expected, cursor_pos)
+
+    def test_spans_are_relative_to_whole_text(self):
+        all_labels = [str(i) for i in range(100)]
+        # Every word in the text, with positions from the reference
+        all_words = [
+            anchor_data[1:]
+            for anchor_data in reference_text_anchors(self.text, 0, all_labels)
+        ]
+        for range_start in range(len(self.text)):
+            for range_end in range(range_start, len(self.text) + 1):
+                # Given a range that may cut words in half
+
+                # When we label it
+                result = calculate_range_anchors(
+                    self.text, range_start, range_end, range_start, all_labels
+                )
+
+                # Then we get the full words that start inside it
+                expected = [
+                    word for word in all_words if range_start <= word[0] < range_end
+                ]
+                self.assertEqual(
+                    [anchor_data[1:] for anchor_data in result],
+                    expected,
+                    (range_start, range_end),
+                )
+
+    def test_cursor_past_range_anchors_from_the_end(self):
+        result = calculate_range_anchors(self.text, 0, 16, len(self.text), ["a", "b"])
+        self.assertEqual([self.text[r[1] : r[2]] for r in result], ["two", "three"])
+
+    def test_locates_occurrence_nearest_cursor(self):
+        text = "same line\nother\nsame line\n"
+        self.assertEqual(locate_visible_text(text, "same line", 0), 0)
+        self.assertEqual(locate_visible_text(text, "same line", 20), 16)
+        self.assertEqual(locate_visible_text(text, "missing", 0), None)
+
+
+class LabelWindowTest(TestCase):
+    """
+    Tests the window_start and margin arguments, which keep anchors in place as
+    the cursor moves
+    """
+
+    text = " ".join(f"w{i}" for i in range(40))
+    labels = list("abcdefghij")
+
+    def anchored_words(self, cursor_position, window_start):
+        index = WordSpanIndex(self.text)
+        results = [
+            calculate_text_anchors(
+                self.text, cursor_position, self.labels,
+                window_start=window_start, margin=2
+            ),
+            index_text_anchors(
+                index, cursor_position, self.labels,
+                window_start=window_start, margin=2
+            ),
+            calculate_range_anchors(
+                self.text, 0, len(self.text), cursor_position, self.labels,
+                window_start=window_start, margin=2
+            ),
+        ]
+        # All the ways of anchoring agree
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], results[2])
+        return [self.text[r[1] : r[2]] for r in results[0]]
+
+    def test_window_stays_until_cursor_reaches_margin(self):
+        # Given anchors on the first ten words
+        window_start = self.text.index("w5")
+        self.assertEqual(self.anchored_words(self.text.index("w10"), None)[0], "w5")
+
+        # When the cursor moves around inside them, they stay put
+        for word in ["w7", "w9", "w12"]:
+            words = self.anchored_words(self.text.index(word), window_start)
+            self.assertEqual(words[0], "w5", word)
+            self.assertEqual(words[-1], "w14", word)
+
+        # But once it's within two words of the edge they're centred again
+        words = self.anchored_words(self.text.index("w13"), window_start)
+        self.assertEqual(words[0], "w8")
+        words = self.anchored_words(self.text.index("w6"), window_start)
+        self.assertEqual(words[0], "w1")
+
+    def test_window_is_kept_inside_text(self):
+        window_start = self.text.index("w35")
+        self.assertEqual(
+            self.anchored_words(self.text.index("w36"), window_start)[0], "w30"
+        )
+        self.assertEqual(self.anchored_words(0, window_start)[0], "w0")
+
+
+class TokenizersTest(TestCase):
+    """
+    Tests the TOKENIZERS, and that everything that splits text into words can use
+    them
+    """
+
+    text = "parseHTTPServer2 snake_case kebab-case don't (stop), \u00e9t\u00e9Caf\u00e9\n"
+
+    def words(self, tokenizer):
+        return [
+            self.text[start:end]
+            for _, start, end, _, _ in calculate_text_anchors(
+                self.text, 0, [str(i) for i in range(100)], TOKENIZERS[tokenizer]
+            )
+        ]
+
+    def test_splits_words(self):
+        self.assertEqual(
+            self.words("word"),
+            [
+                "parseHTTPServer2", "snake_case", "kebab-case", "don't", "(stop),",
+                "\u00e9t\u00e9Caf\u00e9",
+            ]
+        )
+        self.assertEqual(
+            self.words("subword"),
+            [
+                "parse", "HTTP", "Server", "2", "snake", "case", "kebab", "-", "case",
+                "don", "'", "t", "(", "stop", "),", "\u00e9t\u00e9", "Caf\u00e9",
+            ]
+        )
+        self.assertEqual(
+            self.words("punctuation"),
+            [
+                "parseHTTPServer2", "snake_case", "kebab", "-", "case", "don't", "(",
+                "stop", "),", "\u00e9t\u00e9Caf\u00e9",
+            ]
+        )
+
+    def test_range_and_index_agree_with_whole_text(self):
+        rng = random.Random(0)
+        labels = [str(i) for i in range(1000)]
+        for name, tokenizer in TOKENIZERS.items():
+            index = WordSpanIndex(tokenizer=tokenizer)
+            text = ""
+            for _ in range(100):
+                # Given a random edit to some code-like text
+                start = rng.randint(0, len(text))
+                end = min(len(text), start + rng.randint(0, 5))
+                replacement = "".join(
+                    rng.choice(["a", "B", "_", " ", "1", "-", "\n"])
+                    for _ in range(rng.randint(0, 5))
+                )
+                text = text[:start] + replacement + text[end:]
+                expected = calculate_text_anchors(text, 0, labels, tokenizer)
+
+                # Then the index and labelling the whole range find the same words
+                index.update(text)
+                self.assertEqual(
+                    index_text_anchors(index, 0, labels), expected, (name, text)
+                )
+                self.assertEqual(
+                    calculate_range_anchors(text, 0, len(text), 0, labels, tokenizer),
+                    expected,
+                    (name, text)
+                )
+
+
+class OrdinalAnchorsTest(TestCase):
+    """
+    Tests ordinal_text_anchors, carry_labels and parse_anchor_spans
+    """
+
+    anchor_labels = ["aa", "ab", "ac", "ad"]
+
+    def test_labels_every_word_in_range(self):
+        text = "zero one two three four five"
+        index = WordSpanIndex(text)
+
+        result = ordinal_text_anchors(index, (5, 20), 0, self.anchor_labels)
+
+        # Then the labels follow the words' position in the whole text
+        self.assertEqual(
+            [(anchor, text[start:end]) for anchor, start, end, _, _ in result],
+            [("ab", "one"), ("ac", "two"), ("ad", "three"), ("aa", "four")],
+        )
+        # And the ranges are the same as the single character labels'
+        self.assertEqual(
+            [anchor_data[1:] for anchor_data in result],
+            [anchor_data[1:] for anchor_data in calculate_text_anchors(text, 0)][1:5],
+        )
+
+    def test_labels_stay_put_when_editing_after_them(self):
+        index = WordSpanIndex("one two three four")
+        before = ordinal_text_anchors(index, None, 0, self.anchor_labels)
+
+        index.update("one two three more four")
+        after = ordinal_text_anchors(index, None, 0, self.anchor_labels)
+
+        self.assertEqual(after[:3], before[:3])
+
+    def test_labels_carried_over_an_insertion(self):
+        # Given labelled words, and a word inserted part way through
+        old_text = "one two three"
+        index = WordSpanIndex(old_text)
+        before = ordinal_text_anchors(index, None, 0, self.anchor_labels)
+        labels = [(Span(start, end), anchor) for anchor, start, end, _, _ in before]
+        new_text = "one new two three"
+        index.update(new_text)
+
+        # When the labels are carried over
+        keep = carry_labels(old_text, new_text, labels)
+        after = ordinal_text_anchors(index, None, 0, self.anchor_labels, keep)
+
+        # Then every word keeps its label, and the new one gets a spare label
+        self.assertEqual(
+            [(anchor, new_text[start:end]) for anchor, start, end, _, _ in after],
+            [("aa", "one"), ("ad", "new"), ("ab", "two"), ("ac", "three")],
+        )
+
+    def test_edited_word_loses_its_label(self):
+        old_text = "one two three"
+        labels = [(Span(0, 3), "aa"), (Span(4, 7), "ab"), (Span(8, 13), "ac")]
+
+        keep = carry_labels(old_text, "one tao three", labels)
+
+        self.assertEqual(keep, {0: "aa", 8: "ac"})
+
+    def test_centres_on_cursor_when_too_many_words(self):
+        index = WordSpanIndex("0 1 2 3 4 5 6 7 8 9")
+
+        result = ordinal_text_anchors(index, None, 12, self.anchor_labels)
+
+        self.assertEqual(
+            [(anchor, start) for anchor, start, _, _, _ in result],
+            [("aa", 8), ("ab", 10), ("ac", 12), ("ad", 14)],
+        )
+
+    def test_parse_anchor_spans(self):
+        examples = [
+            ("a", 1, [("a", None)]),
+            ("a to d", 1, [("a", "d")]),
+            ("a c to d and f", 1, [("a", None), ("c", "d"), ("f", None)]),
+            ("acf", 1, [("a", None), ("c", None), ("f", None)]),
+            ("ab cd to ef", 2, [("ab", None), ("cd", "ef")]),
+        ]
+        for spec, label_length, expected in examples:
+            self.assertEqual(parse_anchor_spans(spec, label_length), expected, spec)
+
+
+class EditTextSpansTest(TestCase):
+    """
+    Tests edit_text_spans
+    """
+
+    text = "one two three four five"
+
+    def edit(self, *edits):
+        # Each edit is (first word number, last word number, replacement)
+        ranges = {
+            i: anchor_data[1:]
+            for i, anchor_data in enumerate(calculate_text_anchors(self.text, 0))
+        }
+        spans = [
+            (ranges[first][0], ranges[last][1], ranges[first][2], ranges[last][3], text)
+            for first, last, text in edits
+        ]
+        return edit_text_spans(self.text, spans)
+
+    def test_deletes_words(self):
+        self.assertEqual(self.edit((1, 1, "")), ("one three four five", 3))
+        self.assertEqual(self.edit((0, 0, ""), (3, 3, "")), ("two three five", 9))
+
+    def test_merges_neighbouring_deletions(self):
+        # Deleting words next to each other is like deleting them one at a time
+        self.assertEqual(self.edit((0, 0, ""), (1, 1, "")), ("three four five", 0))
+        self.assertEqual(self.edit((2, 3, ""), (1, 1, "")), ("one five", 3))
+        self.assertEqual(self.edit((1, 3, ""), (2, 2, "")), ("one five", 3))
+
+    def test_replaces_words(self):
+        self.assertEqual(
+            self.edit((4, 4, "5"), (0, 1, "1 2")),
+            ("1 2 three four 5", 16)
+        )
+
+    def test_rejects_overlapping_replacements(self):
+        self.assertRaises(RuntimeError, self.edit, (0, 2, "x"), (1, 1, "y"))
+
+
+class CaseTransformsTest(TestCase):
+    """
+    Tests CASE_TRANSFORMS
+    """
+
+    def test_transforms(self):
+        text = "the iPhone's  new-ish\tfeature_flag"
+        expected = {
+            "title": "The IPhone's  New-ish\tFeature_flag",
+            "lower": "the iphone's  new-ish\tfeature_flag",
+            "upper": "THE IPHONE'S  NEW-ISH\tFEATURE_FLAG",
+            "camel": "theIphoneSNewIshFeatureFlag",
+            "snake": "the_iphone_s_new_ish_feature_flag",
+            "kebab": "the-iphone-s-new-ish-feature-flag",
+        }
+        for case, result in expected.items():
+            self.assertEqual(CASE_TRANSFORMS[case](text), result, case)
+
+
+class NumpyImportTest(TestCase):
+    """
+    Tests numpy is only imported once a long text needs it
+    """
+
+    def test_imported_on_first_long_text(self):
+        with mock.patch.object(draft_index, "_numpy", None), mock.patch.dict(
+            sys.modules, {"numpy": None}
+        ):
+            # Short texts don't try
+            self.assertFalse(use_numpy_spans("short", word_matcher))
+            self.assertIsNone(draft_index._numpy)
+
+            # And once it's found to be missing, that's remembered
+            self.assertFalse(use_numpy_spans("x" * 2000, word_matcher))
+            self.assertIs(draft_index._numpy, False)
+            self.assertIsNone(get_numpy())
+
+
+@skipIf(get_numpy() is None, "numpy isn't installed")
+class NumpyWordSpansTest(TestCase):
+    """
+    Tests numpy_word_spans, and the anchor functions when they use it
+    """
+
+    def random_texts(self):
+        rng = random.Random(0)
+        # Including whitespace that isn't ASCII, and characters outside the BMP
+        alphabet = ["a", "b", "\u00e9", "\U0001f600", " ", "\t", "\n", "\u3000",
+                    "\u00a0", "\x85", "\u2028", "\x1c"]
+        yield ""
+        yield "   "
+        yield "word"
+        for _ in range(200):
+            yield "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 60)))
+
+    def test_matches_regex(self):
+        for text in self.random_texts():
+            spans = [(m.start(), m.end(1), m.end()) for m in word_matcher.finditer(text)]
+            starts, ends, whitespace_ends = numpy_word_spans(text)
+            self.assertEqual(
+                list(zip(starts.tolist(), ends.tolist(), whitespace_ends.tolist())),
+                spans,
+                repr(text),
+            )
+
+    def test_anchors_match_regex(self):
+        labels = list("abcdef")
+        for text in self.random_texts():
+            for cursor_pos in range(len(text) + 1):
+                for window_start in [None, 0, len(text) // 2]:
+                    expected = calculate_text_anchors(
+                        text, cursor_pos, labels,
+                        window_start=window_start, margin=1
+                    )
+                    with mock.patch.object(draft_index, "NUMPY_MIN_CHARS", 0):
+                        result = calculate_text_anchors(
+                            text, cursor_pos, labels,
+                            window_start=window_start, margin=1
+                        )
+                    self.assertEqual(
+                        result, expected, (text, cursor_pos, window_start)
+                    )
+
+    def test_index_built_with_numpy(self):
+        for text in self.random_texts():
+            with mock.patch.object(draft_index, "NUMPY_MIN_CHARS", 0):
+                index = WordSpanIndex(text)
+            expected = WordSpanIndex(text)
+            self.assertEqual(index.starts, expected.starts)
+            self.assertEqual(index.ends, expected.ends)
+            self.assertEqual(index.whitespace_ends, expected.whitespace_ends)
+            # And it carries on updating as normal
+            index.update(text + " more")
+            self.assertEqual(index.starts, WordSpanIndex(text + " more").starts)
+
+
+class WordSpanIndexTest(TestCase):
+    """
+    Tests WordSpanIndex, using reference_text_anchors to check the anchors
+    """
+
+    # (start, end, replacement) edits applied one after the other
+    edits = [
+        (0, 0, "the quick brown fox"),
+        (19, 19, " jumps"),
+        (4, 9, "slow"),
+        (3, 4, ""),
+        (0, 0, "  \n"),
+        (10, 10, "\t\t"),
+        (5, 20, "x"),
+        (0, 0, "start "),
+    ]
+
+    def test_incremental_update_matches_fresh_index(self):
+        index = WordSpanIndex()
+        text = ""
+        for start, end, replacement in self.edits:
+            # Given an edit to the text
+            text = text[:start] + replacement + text[end:]
+
+            # When we update the existing index
+            index.update(text)
+
+            # Then it matches an index built from scratch
+            fresh = WordSpanIndex(text)
+            self.assertEqual(index.starts, fresh.starts, text)
+            self.assertEqual(index.ends, fresh.ends, text)
+            self.assertEqual(index.whitespace_ends, fresh.whitespace_ends, text)
+
+    def test_anchors_match_calculate_text_anchors(self):
+        index = WordSpanIndex()
+        text = ""
+        anchor_labels = ["a", "b", "c"]
+        for start, end, replacement in self.edits:
+            text = text[:start] + replacement + text[end:]
+            index.update(text)
+            for cursor_pos in range(len(text) + 1):
+                # When we calculate the anchors both ways
+                result = list(index_text_anchors(index, cursor_pos, anchor_labels))
+                expected = reference_text_anchors(text, cursor_pos, anchor_labels)
+
+                # Then they're the same
+                self.assertEqual(result, expected, (text, cursor_pos))
+
+    def test_text_difference(self):
+        examples = [
+            ("", "", (0, 0, 0)),
+            ("abc", "abc", (3, 3, 3)),
+            ("abc", "abxc", (2, 2, 3)),
+            ("abc", "ac", (1, 2, 1)),
+            ("aaaa", "aa", (2, 4, 2)),
+            ("x" * 10000 + "y", "x" * 10000 + "z", (10000, 10001, 10001)),
+        ]
+        for old, new, expected in examples:
+            self.assertEqual(text_difference(old, new), expected, (old, new))
+
+
+class WordOffsetIndexTest(TestCase):
+    """
+    Tests WordOffsetIndex against the offsets found by scanning the whole text
+    """
+
+    def expected_offsets(self, text):
+        offsets = {}
+        for match in re.finditer(r"\S+", text):
+            offsets.setdefault(word_key(match.group()), []).append(match.start())
+        return offsets
+
+    def test_incremental_update_matches_scan(self):
+        rng = random.Random(0)
+        words = ["the", "The,", "cat", "(cat)", "sat", "...", "on", "mat."]
+        # A small log, so it's cleared part way through
+        index = WordOffsetIndex(max_pending_edits=5)
+        text = ""
+        for _ in range(300):
+            # Given a random edit to the text
+            start = rng.randint(0, len(text))
+            end = min(len(text), start + rng.randint(0, 10))
+            replacement = "".join(
+                rng.choice(words) + rng.choice([" ", "", "\n"])
+                for _ in range(rng.randint(0, 3))
+            )
+            text = text[:start] + replacement + text[end:]
+
+            # When we update the index
+            index.update(text)
+
+            # Then every word is where a full scan finds it
+            expected = self.expected_offsets(text)
+            for word in words + ["missing"]:
+                self.assertEqual(
+                    list(index.offsets(word)),
+                    expected.get(word_key(word), []),
+                    (text, word)
+                )
+
+    def test_word_key(self):
+        self.assertEqual(word_key("Hello,"), "hello")
+        self.assertEqual(word_key("\u201cquoted\u201d"), "quoted")
+        self.assertEqual(word_key("don't"), "don't")
+        self.assertEqual(word_key("..."), "...")
+
+
+class LineIndexTest(TestCase):
+    """
+    Tests LineIndex
+    """
+
+    def test_incremental_update_matches_fresh_index(self):
+        rng = random.Random(0)
+        index = LineIndex()
+        text = ""
+        for _ in range(300):
+            # Given a random edit to the text
+            start = rng.randint(0, len(text))
+            end = min(len(text), start + rng.randint(0, 5))
+            replacement = "".join(rng.choice("ab\n") for _ in range(rng.randint(0, 5)))
+            text = text[:start] + replacement + text[end:]
+
+            # When we update the index
+            index.update(text)
+
+            # Then it matches an index built from scratch
+            expected = [0] + [m.end() for m in re.finditer("\n", text)]
+            self.assertEqual(list(index.starts), expected, text)
+
+    def test_lines_and_paragraphs(self):
+        text = "one\ntwo\n\nthree\nfour\nfive\n\n"
+        index = LineIndex(text)
+
+        self.assertEqual(len(index), 8)
+        self.assertEqual(index.line_at(0), 0)
+        self.assertEqual(index.line_at(3), 0)
+        self.assertEqual(index.line_at(4), 1)
+        self.assertEqual(index.line_range(3), (9, 14))
+        self.assertEqual(index.line_range(7), (len(text), len(text)))
+
+        # Paragraphs run between blank lines
+        self.assertEqual(index.paragraph_range(1), (0, 7))
+        self.assertEqual(index.paragraph_range(20), (9, 24))
+        self.assertEqual(index.paragraph_range(8), (8, 8))
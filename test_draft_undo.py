@@ -0,0 +1,107 @@
+from unittest import TestCase
+import json
+
+from .draft_undo import UndoHistory
+
+
+class UndoHistoryTest(TestCase):
+    """
+    Tests UndoHistory
+    """
+
+    states = [
+        ("", (0, 0)),
+        ("hello", (5, 5)),
+        ("hello world", (11, 11)),
+        ("hi world", (2, 2)),
+        ("hi there world", (8, 8)),
+        ("", (0, 0)),
+        ("x" * 10000, (3, 7)),
+    ]
+
+    def test_pops_states_in_reverse_order(self):
+        # Given a history with some states pushed onto it
+        history = UndoHistory()
+        for text, sel in self.states:
+            history.push(text, sel)
+        self.assertEqual(len(history), len(self.states))
+
+        # When we pop them all off, then they come back in reverse
+        for state in reversed(self.states):
+            self.assertEqual(history.peek(), state)
+            self.assertEqual(history.pop(), state)
+        self.assertEqual(len(history), 0)
+        self.assertRaises(IndexError, history.pop)
+
+    def test_set_top_selection(self):
+        history = UndoHistory()
+        history.push("one", (0, 0))
+        history.push("one two", (7, 7))
+
+        history.set_top_selection((0, 3))
+
+        self.assertEqual(history.pop(), ("one two", (0, 3)))
+        self.assertEqual(history.pop(), ("one", (0, 0)))
+
+    def test_stores_changes_rather_than_copies(self):
+        history = UndoHistory()
+        text = "word " * 100000
+        for i in range(100):
+            text = text + str(i)
+            history.push(text, (0, 0))
+
+        # Only the top state is a full copy
+        self.assertLess(history.size_in_chars, len(text) + 1000)
+
+    def test_push_edit(self):
+        # Given a history with a state on top
+        history = UndoHistory()
+        history.push("one three", (0, 0))
+
+        # When we push an edit to it, and one that changes nothing
+        self.assertTrue(history.push_edit(4, 4, "two ", (8, 8)))
+        self.assertFalse(history.push_edit(0, 3, "one", (1, 1)))
+
+        # Then only the real edit is a new state
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history.pop(), ("one two three", (8, 8)))
+        self.assertEqual(history.pop(), ("one three", (0, 0)))
+        self.assertRaises(IndexError, history.push_edit, 0, 0, "x", (0, 0))
+
+    def test_forgets_oldest_states_past_entry_limit(self):
+        history = UndoHistory(max_entries=3)
+        for text, sel in self.states:
+            history.push(text, sel)
+
+        self.assertEqual(len(history), 3)
+        self.assertEqual(
+            [history.pop() for _ in range(3)], list(reversed(self.states[-3:]))
+        )
+
+    def test_forgets_oldest_states_past_memory_limit(self):
+        history = UndoHistory(max_chars=100)
+        history.push("a" * 80, (0, 0))
+        history.push("", (0, 0))
+        history.push("b" * 80, (0, 0))
+        history.push("", (0, 0))
+
+        # Going back to the "a"s would need more than 100 characters of edits
+        self.assertEqual(len(history), 3)
+        self.assertEqual(history.pop()[0], "")
+        self.assertEqual(history.pop()[0], "b" * 80)
+        self.assertEqual(history.pop()[0], "")
+        self.assertEqual(len(history), 0)
+
+    def test_round_trips_through_dict(self):
+        # Given a history saved to a dict and rebuilt
+        history = UndoHistory(max_entries=50)
+        for text, sel in self.states:
+            history.push(text, sel)
+        data = json.loads(json.dumps(history.to_dict()))
+        restored = UndoHistory.from_dict(data)
+
+        # Then it holds the same states
+        self.assertEqual(restored.max_entries, 50)
+        for state in reversed(self.states):
+            self.assertEqual(restored.pop(), state)
+        self.assertEqual(len(restored), 0)
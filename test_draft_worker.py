@@ -0,0 +1,43 @@
+from unittest import TestCase
+import threading
+
+from .draft_worker import LatestWorker
+
+
+class LatestWorkerTest(TestCase):
+    """
+    Tests LatestWorker
+    """
+
+    def test_runs_latest_job(self):
+        # Given a worker that's busy with a slow job
+        done = []
+        worker = LatestWorker("test worker", lambda: done.append(worker.result))
+        started = threading.Event()
+        release = threading.Event()
+        worker.submit(1, lambda: started.set() or release.wait(1) and "first")
+        started.wait(1)
+
+        # When more jobs are submitted before it finishes
+        ran = []
+        for key in [2, 3, 4]:
+            worker.submit(key, lambda key=key: ran.append(key) or f"job {key}")
+        release.set()
+
+        # Then only the last of them runs, and its result is kept
+        self.assertTrue(worker.wait(1))
+        self.assertEqual(ran, [4])
+        self.assertEqual(worker.result, (4, "job 4"))
+        self.assertEqual(done, [(1, "first"), (4, "job 4")])
+        self.assertFalse(worker.is_busy())
+
+    def test_failed_job_keeps_previous_result(self):
+        worker = LatestWorker("test worker")
+        worker.submit("ok", lambda: 1)
+        worker.wait(1)
+
+        with self.assertLogs(level="ERROR"):
+            worker.submit("bad", lambda: 1 / 0)
+            worker.wait(1)
+
+        self.assertEqual(worker.result, ("ok", 1))